@@ -1,22 +1,162 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import numpy as np
 import pandas as pd
 from joblib import dump, load
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, accuracy_score
 from sklearn.preprocessing import StandardScaler
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 
-def train_and_predict_network_traffic(train_file, new_data_file, output_model_file, output_scaler_file, prediction_output_file):
+from capture_preprocess import FlowTransformer, STATS_FILE
+import metrics
+from flow_stats import COLUMNS
+from model_registry import ModelRegistry
+
+# Memory-mappable .npy copies of parsed training CSVs
+DATASET_CACHE_DIR = '.dataset_cache'
+
+_PREDICT_ROWS = metrics.counter('hids_predict_rows_total', "Rows scored by predict_network_traffic")
+_PREDICT_SECONDS = metrics.histogram('hids_predict_seconds', "Scaling and prediction time per file")
+
+
+def _versioned_name(file_name, version):
+    """random_forest_model.joblib -> random_forest_model.<version>.joblib"""
+    base, ext = os.path.splitext(file_name)
+    return f"{base}.{version}{ext}"
+
+
+def _file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_dataset(train_file='network_dataset.csv', cache_dir=DATASET_CACHE_DIR):
+    """Return (X, y, columns) for a labelled CSV, going through a binary cache.
+
+    The first load parses the CSV (dropping rows with missing values, as
+    training always has) and saves X and y as .npy files under
+    cache_dir (relative to the CSV's directory), named after the CSV and
+    its SHA-256. Later loads memory-map those files instead of parsing.
+    The hash is only recomputed when the CSV's size or mtime changed, and
+    a changed content hash rebuilds the cache. Pass cache_dir=None to
+    always parse.
+    """
+    if cache_dir is None:
+        df = pd.read_csv(train_file).dropna()
+        return df.drop(columns=['Label']).to_numpy(dtype='float64'), df['Label'].to_numpy(), \
+            [column for column in df.columns if column != 'Label']
+
+    cache_dir = os.path.join(os.path.dirname(train_file), cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    stat = os.stat(train_file)
+    base = os.path.basename(train_file)
+    meta_file = os.path.join(cache_dir, base + '.json')
+    meta = None
+    if os.path.isfile(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+    if meta is None or (meta['size'], meta['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+        digest = _file_digest(train_file)
+        if meta is None or meta['sha256'] != digest:
+            df = pd.read_csv(train_file).dropna()
+            columns = [column for column in df.columns if column != 'Label']
+            y = df['Label'].to_numpy()
+            if y.dtype == object:
+                y = y.astype(str)
+            prefix = os.path.join(cache_dir, f"{base}.{digest[:16]}")
+            np.save(prefix + '.X.npy', df[columns].to_numpy(dtype='float64'))
+            np.save(prefix + '.y.npy', y)
+            if meta is not None and meta['sha256'] != digest:
+                for suffix in ('.X.npy', '.y.npy'):
+                    stale = os.path.join(cache_dir, f"{base}.{meta['sha256'][:16]}{suffix}")
+                    if os.path.exists(stale):
+                        os.remove(stale)
+            meta = {'sha256': digest, 'columns': columns}
+        meta.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        tmp_file = meta_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, meta_file)
+
+    prefix = os.path.join(cache_dir, f"{base}.{meta['sha256'][:16]}")
+    return np.load(prefix + '.X.npy', mmap_mode='r'), np.load(prefix + '.y.npy', mmap_mode='r'), \
+        meta['columns']
+
+
+def _save_artifacts(clf, scaler, transformer, output_model_file, output_scaler_file, version):
+    """Write versioned copies of the artifacts, then point the unversioned names at them."""
+    versioned_files = []
+    for artifact, file_name in ((clf, output_model_file), (scaler, output_scaler_file)):
+        versioned_file = _versioned_name(file_name, version)
+        dump(artifact, versioned_file)
+        versioned_files.append((versioned_file, file_name))
+    stats_file = stats_file_for(output_scaler_file)
+    versioned_file = _versioned_name(stats_file, version)
+    transformer.save(versioned_file)
+    versioned_files.append((versioned_file, stats_file))
+    for versioned_file, file_name in versioned_files:
+        tmp_file = file_name + '.tmp'
+        shutil.copyfile(versioned_file, tmp_file)
+        os.replace(tmp_file, file_name)
 
-    df = pd.read_csv(train_file)
-    df.dropna(inplace=True) 
 
-    X = df.drop(columns=['Label']).values 
-    y = df['Label'].values 
+def _publish(registry, clf, scaler, transformer, accuracy, train_file, version):
+    if registry is None:
+        return None
+    if not isinstance(registry, ModelRegistry):
+        registry = ModelRegistry(registry)
+    registry_version = registry.publish(clf, scaler, transformer, feature_columns(scaler, train_file),
+                                        accuracy=float(accuracy), train_file=os.path.abspath(train_file),
+                                        tag=version)
+    print(f"Published as {registry_version} in {registry.root}")
+    return registry_version
 
+
+def _print_timings(timings):
+    print("Timings: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+
+
+def train_model(train_file='network_dataset.csv', output_model_file='random_forest_model.joblib',
+                output_scaler_file='scaler.joblib', version=None, cache_dir=DATASET_CACHE_DIR,
+                n_jobs=-1, registry=None):
+    """Fit the scaler and Random Forest on train_file and save them as versioned artifacts.
+
+    Each run writes <model>.<version>.joblib and <scaler>.<version>.joblib,
+    then replaces output_model_file/output_scaler_file with copies of them,
+    so the unversioned names always point at the latest training run.
+    The data is read through load_dataset()'s binary cache and the trees
+    are fitted on n_jobs cores (all by default). If registry (a
+    model_registry.ModelRegistry or its directory) is given, the model is
+    only published there, as the new current version, and no files are
+    written next to output_model_file.
+    Returns (clf, scaler, accuracy, version).
+    """
+    if version is None:
+        version = datetime.now().strftime('%Y%m%d%H%M%S')
+
+    timings = {}
+    start = time.perf_counter()
+    X, y, columns = load_dataset(train_file, cache_dir)
+    X = pd.DataFrame(X, columns=columns)
+    timings['load'] = time.perf_counter() - start
+
+    start = time.perf_counter()
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
+    # Imputation means for captured data, learned from the training split only
+    transformer = FlowTransformer().fit(X_train)
+
+    # Fitted on a DataFrame so the scaler remembers the feature columns
     scaler = StandardScaler()
     X_train = scaler.fit_transform(X_train)
     X_test = scaler.transform(X_test)
@@ -26,62 +166,227 @@ def train_and_predict_network_traffic(train_file, new_data_file, output_model_fi
         max_depth=10,
         max_features='sqrt',
         min_samples_split=2,
-        random_state=42
+        random_state=42,
+        n_jobs=n_jobs
     )
     clf.fit(X_train, y_train)
+    timings['fit'] = time.perf_counter() - start
 
-    dump(clf, output_model_file)
-    dump(scaler, output_scaler_file)
+    if registry is None:
+        _save_artifacts(clf, scaler, transformer, output_model_file, output_scaler_file, version)
 
+    start = time.perf_counter()
     y_pred = clf.predict(X_test)
     accuracy = accuracy_score(y_test, y_pred)
+    timings['evaluation'] = time.perf_counter() - start
     #classification_rep = classification_report(y_test, y_pred)
     print("Accuracy:", accuracy)
     #print("Classification Report:\n", classification_rep)
+    _print_timings(timings)
+    if registry is None:
+        print(f"Model version {version} saved to {output_model_file} and {output_scaler_file}")
+    _publish(registry, clf, scaler, transformer, accuracy, train_file, version)
+
+    return clf, scaler, accuracy, version
+
+
+def add_trees(new_data_file, n_trees=20, model_file='random_forest_model.joblib',
+              scaler_file='scaler.joblib', version=None, cache_dir=DATASET_CACHE_DIR, registry=None):
+    """Grow the saved forest by n_trees fitted on newly labelled data (warm start).
+
+    The existing trees and the scaler are kept as they are, so old and
+    new trees see identically scaled inputs. Accuracy is measured on a
+    held-out 20% of new_data_file, which the new trees are not fitted on.
+    Saves a new model version and returns (clf, scaler, accuracy, version).
+    With registry, the registry's current model is grown and the result
+    is only published there.
+    """
+    if version is None:
+        version = datetime.now().strftime('%Y%m%d%H%M%S')
+    if registry is not None:
+        if not isinstance(registry, ModelRegistry):
+            registry = ModelRegistry(registry)
+        model = registry.load(mmap=False)
+        clf, scaler, transformer = model.clf, model.scaler, model.transformer
+    else:
+        clf, scaler = load_model(model_file, scaler_file)
+        transformer = load_transformer(scaler_file)
+
+    timings = {}
+    start = time.perf_counter()
+    X, y, columns = load_dataset(new_data_file, cache_dir)
+    X = pd.DataFrame(X, columns=columns)[feature_columns(scaler)]
+    timings['load'] = time.perf_counter() - start
+    if not set(np.unique(y)) <= set(clf.classes_):
+        raise ValueError(f"{new_data_file} has labels the model was not trained on")
+
+    start = time.perf_counter()
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    clf.set_params(warm_start=True, n_estimators=len(clf.estimators_) + n_trees, n_jobs=-1)
+    clf.fit(scaler.transform(X_train), y_train)
+    clf.set_params(warm_start=False)
+    timings['fit'] = time.perf_counter() - start
 
+    if registry is None:
+        _save_artifacts(clf, scaler, transformer, model_file, scaler_file, version)
+
+    start = time.perf_counter()
+    accuracy = accuracy_score(y_test, clf.predict(scaler.transform(X_test)))
+    timings['evaluation'] = time.perf_counter() - start
+    print("Accuracy:", accuracy)
+    _print_timings(timings)
+    if registry is None:
+        print(f"Model version {version} with {len(clf.estimators_)} trees saved to {model_file}")
+    _publish(registry, clf, scaler, transformer, accuracy, new_data_file, version)
+    return clf, scaler, accuracy, version
+
+
+def stats_file_for(scaler_file):
+    """Return the preprocessing statistics file that sits next to scaler_file."""
+    return os.path.join(os.path.dirname(scaler_file), STATS_FILE)
+
+
+def load_transformer(scaler_file='scaler.joblib'):
+    """Load the preprocessing statistics saved with scaler_file, if there are any."""
+    stats_file = stats_file_for(scaler_file)
+    return FlowTransformer.load(stats_file) if os.path.isfile(stats_file) else FlowTransformer()
+
+
+def load_model(model_file='random_forest_model.joblib', scaler_file='scaler.joblib'):
+    """Load a trained model and scaler once, for repeated scoring."""
+    return load(model_file), load(scaler_file)
+
+
+def feature_columns(scaler, train_file='network_dataset.csv'):
+    """Return the model's input columns, in training order."""
+    if hasattr(scaler, 'feature_names_in_'):
+        return list(scaler.feature_names_in_)
+    # Scalers saved before the columns were recorded: read the training header,
+    # or fall back to the capture feature set the shipped model was trained on
+    if os.path.isfile(train_file):
+        return list(pd.read_csv(train_file, nrows=0).drop(columns=['Label']).columns)
+    return list(COLUMNS)
+
+
+def predict_network_traffic(clf, scaler, new_data_file, prediction_output_file,
+                            train_file='network_dataset.csv', show_alert=False, correlator=None):
+    """Score new_data_file with an already loaded model and save the malicious rows.
+
+    With correlator (an alert_correlator.AlertCorrelator), each malicious
+    row is also added to it as a detection, so it can report incidents
+    instead of one alert per row.
+    """
     new_data = pd.read_csv(new_data_file)
     new_data.dropna(inplace=True)
 
-    train_columns = df.drop(columns=['Label']).columns
+    train_columns = feature_columns(scaler, train_file)
     new_data = new_data[train_columns]
 
-    new_data_scaled = scaler.transform(new_data)
-
-    new_predictions = clf.predict(new_data_scaled)
+    with _PREDICT_SECONDS.time():
+        new_data_scaled = scaler.transform(new_data)
+        new_predictions = clf.predict(new_data_scaled)
+    _PREDICT_ROWS.inc(len(new_data))
     new_data['Predicted_Label'] = new_predictions
 
     filtered_predictions = new_data[new_data['Predicted_Label'] == 1]
     filtered_predictions.to_csv(prediction_output_file, index=False)
     print(f"Filtered predictions have been saved to {prediction_output_file}")
 
-    def alert_animation():
-        fig, ax = plt.subplots(figsize=(10, 6))
-        counts, bins, patches = ax.hist(new_data['Predicted_Label'], bins=2, rwidth=0.8, color='grey')
-        ax.set_title("Distribution of Predicted Labels")
-        ax.set_xlabel("Predicted Label")
-        ax.set_ylabel("Frequency")
-        ax.set_xticks([0, 1])
-        ax.set_xticklabels(["Label 0", "Label 1"])
-        
-        if (new_data['Predicted_Label'] == 1).any():
-            alert_text = ax.text(0.5, 0.8, "ALERT: Detected malicious", transform=ax.transAxes,
-                                fontsize=16, color='red', ha='center', va='center', fontweight='bold',
-                                visible=False)
-            
-            def animate(frame):
-                color = 'red' if frame % 2 == 0 else 'grey' 
-                for patch in patches:
-                    patch.set_color(color)
-                alert_text.set_visible(True)
-
-            ani = FuncAnimation(fig, animate, repeat=False, interval=500)
-        else:
+    if correlator is not None:
+        from alert_feed import flow_alert
+
+        correlator.add_many(flow_alert(record) for record in filtered_predictions.to_dict('records'))
+
+    if show_alert:
+        alert_animation(new_data)
+    return new_data
+
+
+def alert_animation(new_data):
+    """Plot the predicted label distribution, flashing an alert if anything is malicious."""
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    counts, bins, patches = ax.hist(new_data['Predicted_Label'], bins=2, rwidth=0.8, color='grey')
+    ax.set_title("Distribution of Predicted Labels")
+    ax.set_xlabel("Predicted Label")
+    ax.set_ylabel("Frequency")
+    ax.set_xticks([0, 1])
+    ax.set_xticklabels(["Label 0", "Label 1"])
+
+    if (new_data['Predicted_Label'] == 1).any():
+        alert_text = ax.text(0.5, 0.8, "ALERT: Detected malicious", transform=ax.transAxes,
+                            fontsize=16, color='red', ha='center', va='center', fontweight='bold',
+                            visible=False)
+
+        def animate(frame):
+            color = 'red' if frame % 2 == 0 else 'grey'
             for patch in patches:
-                patch.set_color('skyblue')
-        
-        plt.show()
+                patch.set_color(color)
+            alert_text.set_visible(True)
+
+        ani = FuncAnimation(fig, animate, repeat=False, interval=500)
+    else:
+        for patch in patches:
+            patch.set_color('skyblue')
+
+    plt.show()
+
+
+def train_and_predict_network_traffic(train_file, new_data_file, output_model_file, output_scaler_file, prediction_output_file):
+    """Train a fresh model and score new_data_file with it in one go."""
+    from alert_correlator import AlertCorrelator
+
+    clf, scaler, _, _ = train_model(train_file, output_model_file, output_scaler_file)
+    # One line per incident rather than per malicious row
+    correlator = AlertCorrelator(wall_clock=False)
+    new_data = predict_network_traffic(clf, scaler, new_data_file, prediction_output_file,
+                                       train_file=train_file, correlator=correlator)
+    correlator.flush()
+    print(f"{correlator.detections} malicious flows in {correlator.incidents} incidents")
+    alert_animation(new_data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or run the Random Forest traffic model.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
 
-    alert_animation()
+    train_parser = subparsers.add_parser('train', help="train and save a new model version")
+    train_parser.add_argument('--train-file', default='network_dataset.csv')
+    train_parser.add_argument('--model-file', default='random_forest_model.joblib')
+    train_parser.add_argument('--scaler-file', default='scaler.joblib')
+    train_parser.add_argument('--version', help="version tag (default: current timestamp)")
+    train_parser.add_argument('--cache-dir', default=DATASET_CACHE_DIR,
+                              help="binary dataset cache directory; pass an empty string to disable")
+    train_parser.add_argument('--n-jobs', type=int, default=-1, help="cores used to fit the trees")
+    train_parser.add_argument('--registry', help="publish the model to this model registry instead")
 
+    update_parser = subparsers.add_parser('update', help="add trees fitted on newly labelled data")
+    update_parser.add_argument('new_data_file')
+    update_parser.add_argument('--trees', type=int, default=20)
+    update_parser.add_argument('--model-file', default='random_forest_model.joblib')
+    update_parser.add_argument('--scaler-file', default='scaler.joblib')
+    update_parser.add_argument('--version', help="version tag (default: current timestamp)")
+    update_parser.add_argument('--cache-dir', default=DATASET_CACHE_DIR)
+    update_parser.add_argument('--registry', help="grow and publish the registry's current model instead")
 
+    predict_parser = subparsers.add_parser('predict', help="score a dataset with the saved model")
+    predict_parser.add_argument('new_data_file')
+    predict_parser.add_argument('--output', default='predicted_captured_dataset.csv')
+    predict_parser.add_argument('--model-file', default='random_forest_model.joblib')
+    predict_parser.add_argument('--scaler-file', default='scaler.joblib')
+    predict_parser.add_argument('--train-file', default='network_dataset.csv')
+    predict_parser.add_argument('--show-alert', action='store_true')
 
+    args = parser.parse_args()
+    if args.command == 'train':
+        train_model(args.train_file, args.model_file, args.scaler_file, args.version,
+                    args.cache_dir or None, args.n_jobs, args.registry)
+    elif args.command == 'update':
+        add_trees(args.new_data_file, args.trees, args.model_file, args.scaler_file, args.version,
+                  args.cache_dir or None, args.registry)
+    else:
+        clf, scaler = load_model(args.model_file, args.scaler_file)
+        predict_network_traffic(clf, scaler, args.new_data_file, args.output,
+                                train_file=args.train_file, show_alert=args.show_alert)
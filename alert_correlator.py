@@ -0,0 +1,181 @@
+"""Group flow detections into incidents and emit one alert per incident.
+
+A scan or flood makes the model flag thousands of near-identical flows.
+AlertCorrelator folds detections with the same (source, destination,
+destination port) into one open incident while they keep arriving
+within window seconds of each other, counting them and tracking first
+and last seen. An incident is emitted once, when it goes quiet for
+window seconds, when it has been open for max_age seconds (a long
+attack is reported in max_age slices), or when it is pushed out
+because more than max_incidents are open.
+
+Detections are alert_feed.flow_alert() dicts; their 'timestamp' (the
+flow's start time) is used as the detection time when present.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+SEVERITY_ORDER = ('low', 'medium', 'high', 'critical')
+MAX_PORT_SAMPLE = 10
+# Distinct source ports counted per incident; a count at this cap means "at least"
+MAX_PORTS = 1024
+
+
+def print_incident(incident):
+    """Default incident sink: one line per incident on stdout."""
+    print(f"ALERT incident {incident['src']} -> {incident['dst']}:{incident['dst_port']} "
+          f"({incident['protocol']}): {incident['count']} flows over "
+          f"{incident['last_seen'] - incident['first_seen']:.1f}s from "
+          f"{incident['src_ports']} source ports")
+
+
+class _Incident:
+    __slots__ = ('key', 'first_seen', 'last_seen', 'count', 'ports', 'protocol', 'severity')
+
+    def __init__(self, key, detection, now):
+        self.key = key
+        self.first_seen = self.last_seen = now
+        self.count = 0
+        self.ports = set()
+        self.protocol = detection.get('protocol')
+        self.severity = detection.get('severity', 'high')
+
+    def add(self, detection, now):
+        self.count += 1
+        self.last_seen = max(self.last_seen, now)
+        if len(self.ports) < MAX_PORTS:
+            self.ports.add(detection.get('src_port'))
+        severity = detection.get('severity', 'high')
+        if SEVERITY_ORDER.index(severity) > SEVERITY_ORDER.index(self.severity):
+            self.severity = severity
+
+    def to_alert(self, reason):
+        src, dst, dst_port = self.key
+        return {
+            'kind': 'incident',
+            'severity': self.severity,
+            'src': src,
+            'dst': dst,
+            'dst_port': dst_port,
+            'protocol': self.protocol,
+            'count': self.count,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'src_ports': len(self.ports),
+            'src_port_sample': sorted(self.ports, key=str)[:MAX_PORT_SAMPLE],
+            'closed': reason,
+        }
+
+
+class AlertCorrelator:
+    """Fold detections into incidents keyed by (src, dst, dst_port).
+
+    sink receives one incident alert per incident. Call expire() now
+    and then (or start() a thread that does) so quiet incidents are
+    emitted even when no new detections arrive, and flush() at the end
+    to emit whatever is still open. With wall_clock=False (replaying old
+    captures) time only moves with the detections' own timestamps.
+    """
+
+    def __init__(self, window=60.0, max_age=300.0, max_incidents=10000, sink=print_incident,
+                 wall_clock=True):
+        self.window = window
+        self.wall_clock = wall_clock
+        self.max_age = max_age
+        self.max_incidents = max_incidents
+        self.sink = sink
+        self._open = OrderedDict()  # key -> _Incident, least recently updated first
+        self._lock = threading.Lock()
+        self._latest = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        self.detections = 0
+        self.incidents = 0
+
+    def _emit(self, incident, reason):
+        self.incidents += 1
+        if self.sink is not None:
+            self.sink(incident.to_alert(reason))
+
+    def add(self, detection):
+        """Fold one detection into its incident."""
+        now = detection.get('timestamp') or time.time()
+        key = (detection.get('src'), detection.get('dst'), detection.get('dst_port'))
+        closed = []
+        with self._lock:
+            self.detections += 1
+            self._latest = max(self._latest, now)
+            incident = self._open.get(key)
+            if incident is not None and (now - incident.last_seen > self.window
+                                         or now - incident.first_seen > self.max_age):
+                closed.append((self._open.pop(key), 'idle' if now - incident.last_seen > self.window
+                               else 'max_age'))
+                incident = None
+            if incident is None:
+                incident = self._open[key] = _Incident(key, detection, now)
+                if len(self._open) > self.max_incidents:
+                    closed.append((self._open.popitem(last=False)[1], 'evicted'))
+            else:
+                self._open.move_to_end(key)
+            incident.add(detection, now)
+            closed.extend(self._expired(self._latest))
+        for old, reason in closed:
+            self._emit(old, reason)
+
+    def add_many(self, detections):
+        for detection in detections:
+            self.add(detection)
+
+    def _expired(self, now):
+        """Pop incidents quiet for longer than window. Caller holds the lock."""
+        closed = []
+        while self._open:
+            incident = next(iter(self._open.values()))
+            if now - incident.last_seen <= self.window:
+                break
+            self._open.popitem(last=False)
+            closed.append((incident, 'idle'))
+        return closed
+
+    def expire(self, now=None):
+        """Emit incidents that have been quiet for window seconds as of now."""
+        with self._lock:
+            if now is None:
+                now = max(time.time(), self._latest) if self.wall_clock else self._latest
+            closed = self._expired(now)
+        for incident, reason in closed:
+            self._emit(incident, reason)
+        return len(closed)
+
+    def flush(self):
+        """Emit every open incident."""
+        with self._lock:
+            closed = list(self._open.values())
+            self._open.clear()
+        for incident in closed:
+            self._emit(incident, 'flush')
+        return len(closed)
+
+    @property
+    def open_incidents(self):
+        return len(self._open)
+
+    def start(self, interval=1.0):
+        """Call expire() every interval seconds in a background thread."""
+        def loop():
+            while not self._stop.wait(interval):
+                self.expire()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self, flush=True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.flush()
@@ -0,0 +1,263 @@
+"""Live alert feed: a bounded in-memory ring buffer with sequence cursors.
+
+The detector publishes alerts into an AlertFeed; readers ask for
+everything after the last sequence number they saw (since()) or block
+until there is something new (wait()). Each alert is serialised to
+JSON once when published, so many viewers cost no extra encoding.
+
+The detector and the Flask app run in different processes, so a feed
+can mirror every alert to an append-only JSON lines file, and the app's
+feed follows that file (follow()) to pick alerts up with their original
+sequence numbers.
+
+    python alert_feed.py alerts.jsonl     # print alerts as they are mirrored
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+ALERT_FILE = 'alerts.jsonl'
+# IP protocol numbers, as preprocessed CSV rows carry them, to the names packets carry
+_PROTOCOL_NAMES = {6: 'TCP', 17: 'UDP'}
+# Bytes read back from the end of a mirror file when following it
+_TAIL_BYTES = 4 * 1024 * 1024
+
+
+def _ip(value):
+    """IP address as a string, whether given as text or as capture_preprocess's integer form."""
+    if isinstance(value, str):
+        return value
+    try:
+        return str(ipaddress.ip_address(int(value)))
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def flow_alert(record, severity='high'):
+    """Alert dict for a flow record predicted malicious (raw or preprocessed columns)."""
+    timestamp = record.get('Timestamp')
+    if hasattr(timestamp, 'timestamp'):
+        timestamp = timestamp.timestamp()
+    protocol = record.get('Protocol')
+    if hasattr(protocol, 'item'):
+        # numpy scalar from a DataFrame row
+        protocol = protocol.item()
+    if isinstance(protocol, float) and protocol != protocol:
+        # NaN for an unknown protocol in a DataFrame row
+        protocol = None
+    elif isinstance(protocol, (int, float)):
+        # Same schema on the batch (numeric) and stream ('TCP') paths
+        protocol = _PROTOCOL_NAMES.get(int(protocol), str(int(protocol)))
+    return {
+        'kind': 'flow',
+        'severity': severity,
+        'src': _ip(record.get('Source IP')),
+        'src_port': int(record.get('Source Port', 0)),
+        'dst': _ip(record.get('Destination IP')),
+        'dst_port': int(record.get('Destination Port', 0)),
+        'protocol': protocol,
+        'timestamp': float(timestamp) if timestamp is not None else None,
+    }
+
+
+class AlertFeed:
+    """Thread-safe ring buffer of the last capacity alerts.
+
+    publish() stamps each alert with an increasing 'seq' and a 'time'.
+    With mirror_file, alerts are also appended to that file, and
+    numbering continues from the last alert already in it.
+    """
+
+    def __init__(self, capacity=10000, mirror_file=None, flush_interval=0.5):
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity)   # (seq, alert, json text)
+        self._condition = threading.Condition()
+        self._last_seq = 0
+        self._mirror = None
+        self._dirty = False
+        self._follower = None
+        self._stop = threading.Event()
+        if mirror_file:
+            last = _last_line(mirror_file)
+            if last is not None:
+                self._last_seq = json.loads(last).get('seq', 0)
+            self._mirror = open(mirror_file, 'a', buffering=1 << 16)
+            # Writes are buffered; a background thread flushes them every flush_interval
+            threading.Thread(target=self._flush_loop, args=(flush_interval,), daemon=True).start()
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    def _append(self, alert, text):
+        self._entries.append((alert['seq'], alert, text))
+        self._last_seq = alert['seq']
+
+    def publish(self, alert):
+        """Add alert (a JSON-serialisable dict) and return its sequence number."""
+        with self._condition:
+            alert = {'seq': self._last_seq + 1, 'time': time.time(), **alert}
+            text = json.dumps(alert)
+            self._append(alert, text)
+            if self._mirror is not None:
+                self._mirror.write(text + '\n')
+                self._dirty = True
+            self._condition.notify_all()
+        return alert['seq']
+
+    def publish_many(self, alerts):
+        for alert in alerts:
+            self.publish(alert)
+
+    def _flush_loop(self, interval):
+        while not self._stop.wait(interval):
+            with self._condition:
+                if self._dirty and self._mirror is not None:
+                    self._mirror.flush()
+                    self._dirty = False
+
+    def _after(self, since, limit):
+        """Entries with seq > since, oldest first, at most limit. Caller holds the lock."""
+        count = min(len(self._entries), self._last_seq - since)
+        if count <= 0:
+            return []
+        # Only the newest entries can be after the cursor: walk back from the end
+        entries = list(islice(reversed(self._entries), count))[::-1]
+        return [entry for entry in entries if entry[0] > since][:limit]
+
+    def _cursor(self, since):
+        # A cursor from before a restart of the numbering starts over
+        return 0 if since > self._last_seq else since
+
+    def since(self, since=0, limit=100):
+        """Alerts after cursor since, oldest first.
+
+        Returns {'alerts', 'next', 'oldest', 'missed'}: pass next as the
+        following call's since; missed counts alerts after since that
+        already dropped out of the buffer.
+        """
+        with self._condition:
+            since = self._cursor(since)
+            entries = self._after(since, limit)
+            oldest = self._entries[0][0] if self._entries else self._last_seq + 1
+        return self._page(since, entries, oldest)
+
+    def since_json(self, since=0, limit=100):
+        """since() as a JSON string, built from the cached alert texts."""
+        with self._condition:
+            since = self._cursor(since)
+            entries = self._after(since, limit)
+            oldest = self._entries[0][0] if self._entries else self._last_seq + 1
+        page = self._page(since, entries, oldest)
+        return ('{"alerts": [' + ', '.join(text for _, _, text in entries) + '], '
+                f'"next": {page["next"]}, "oldest": {oldest}, "missed": {page["missed"]}}}')
+
+    @staticmethod
+    def _page(since, entries, oldest):
+        return {'alerts': [alert for _, alert, _ in entries],
+                'next': entries[-1][0] if entries else since,
+                'oldest': oldest,
+                'missed': max(0, oldest - since - 1)}
+
+    def latest(self, n=50):
+        """The newest n alerts, newest first."""
+        with self._condition:
+            return [alert for _, alert, _ in list(self._entries)[-n:]][::-1]
+
+    def wait(self, since, timeout=15.0, limit=500):
+        """Block until there are alerts after since (or timeout); return their (seq, json text)."""
+        with self._condition:
+            since = self._cursor(since)
+            self._condition.wait_for(lambda: self._last_seq > since or self._stop.is_set(), timeout)
+            return [(seq, text) for seq, _, text in self._after(since, limit)]
+
+    def follow(self, mirror_file, poll_interval=0.5):
+        """Load alerts appended to mirror_file by another process, in a background thread."""
+        self._follower = threading.Thread(target=self._follow, args=(mirror_file, poll_interval),
+                                          daemon=True)
+        self._follower.start()
+
+    def _follow(self, mirror_file, poll_interval):
+        f, inode, buffer = None, None, b''
+        while not self._stop.is_set():
+            try:
+                st = os.stat(mirror_file)
+            except FileNotFoundError:
+                self._stop.wait(poll_interval)
+                continue
+            if f is None or st.st_ino != inode or st.st_size < f.tell():
+                # First open, replaced or truncated: start near the end of the file
+                if f is not None:
+                    f.close()
+                f, inode, buffer = open(mirror_file, 'rb'), st.st_ino, b''
+                if st.st_size > _TAIL_BYTES:
+                    f.seek(st.st_size - _TAIL_BYTES)
+                    f.readline()
+            chunk = f.read()
+            if not chunk:
+                self._stop.wait(poll_interval)
+                continue
+            lines = (buffer + chunk).split(b'\n')
+            buffer = lines.pop()
+            with self._condition:
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    text = line.decode('utf-8', 'replace')
+                    alert = json.loads(text)
+                    if alert['seq'] <= self._last_seq:
+                        if alert['seq'] < self._last_seq - self.capacity:
+                            # The detector restarted its numbering: start over
+                            self._entries.clear()
+                        else:
+                            continue
+                    self._append(alert, text)
+                self._condition.notify_all()
+        if f is not None:
+            f.close()
+
+    def close(self):
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+            if self._mirror is not None:
+                self._mirror.close()
+                self._mirror = None
+        if self._follower is not None:
+            self._follower.join(timeout=2)
+
+
+def _last_line(path):
+    """The last non-empty line of a text file, or None."""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 65536))
+            lines = [line for line in f.read().split(b'\n') if line.strip()]
+    except FileNotFoundError:
+        return None
+    return lines[-1].decode('utf-8', 'replace') if lines else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print alerts as they are appended to a mirror file.")
+    parser.add_argument('mirror_file', nargs='?', default=ALERT_FILE)
+    args = parser.parse_args()
+
+    feed = AlertFeed()
+    feed.follow(args.mirror_file)
+    cursor = 0
+    try:
+        while True:
+            for seq, text in feed.wait(cursor):
+                print(text)
+                cursor = seq
+    except KeyboardInterrupt:
+        feed.close()
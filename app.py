@@ -1,10 +1,13 @@
-import requests
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-import mysql.connector
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session
 from werkzeug.security import check_password_hash
-from datetime import datetime, timedelta
+from datetime import datetime
+import atexit
 import re
 import logging
+import threading
+
+from alert_feed import ALERT_FILE, AlertFeed
+from login_security import ConnectionPool, FailedAttemptBatcher, RecaptchaVerifier, SlidingWindowLimiter
 
 # Configure logging
 logging.basicConfig(filename='app.log', level=logging.INFO)
@@ -18,26 +21,84 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # Mitigate CSRF attacks
 # Google reCAPTCHA Secret Key
 RECAPTCHA_SECRET_KEY = 'YOUR_SECRET_KEY'  # Replace with your secret key from Google
 
+app.config['DATABASE'] = {
+    'host': 'localhost',
+    'user': 'your_mysql_user',
+    'password': 'your_mysql_password',
+    'database': 'user_database',
+}
+app.config['DB_POOL_SIZE'] = 10
+# Login attempts allowed per client IP and per username, per 60 seconds
+app.config['LOGIN_LIMIT_PER_IP'] = 20
+app.config['LOGIN_LIMIT_PER_USER'] = 5
+app.config['LOGIN_LIMIT_WINDOW'] = 60
+# Set DB_POOL (e.g. a sqlite3-backed ConnectionPool) or CAPTCHA_VERIFIER (any
+# callable taking the response token) before the first request to replace them
+app.config['DB_POOL'] = None
+app.config['CAPTCHA_VERIFIER'] = None
+# Alerts mirrored by the detector (main.py), kept in memory for the dashboard
+app.config['ALERT_FILE'] = ALERT_FILE
+app.config['ALERT_CAPACITY'] = 10000
+app.config['ALERT_FEED'] = None
+_alert_feed_lock = threading.Lock()
+
 
 # Database connection
 def get_db_connection():
-    return mysql.connector.connect(
-        host='localhost',
-        user='your_mysql_user',
-        password='your_mysql_password',
-        database='user_database'
-    )
+    import mysql.connector
+
+    return mysql.connector.connect(**app.config['DATABASE'])
+
+
+def get_db_pool():
+    if app.config['DB_POOL'] is None:
+        app.config['DB_POOL'] = ConnectionPool(get_db_connection, size=app.config['DB_POOL_SIZE'])
+    return app.config['DB_POOL']
+
+
+def get_failed_attempts():
+    """The FailedAttemptBatcher writing through the current pool."""
+    pool = get_db_pool()
+    batcher = app.extensions.get('failed_attempts')
+    if batcher is None or batcher.pool is not pool:
+        if batcher is not None:
+            batcher.flush()
+        batcher = app.extensions['failed_attempts'] = FailedAttemptBatcher(pool)
+    return batcher
+
+
+def get_limiter(kind):
+    """Sliding-window limiter for 'ip' or 'user' login attempts."""
+    limiters = app.extensions.setdefault('login_limiters', {})
+    if kind not in limiters:
+        limit = app.config['LOGIN_LIMIT_PER_IP' if kind == 'ip' else 'LOGIN_LIMIT_PER_USER']
+        limiters[kind] = SlidingWindowLimiter(limit, app.config['LOGIN_LIMIT_WINDOW'])
+    return limiters[kind]
 
 
 def verify_recaptcha(recaptcha_response):
     """Verify the reCAPTCHA response with Google's verification API"""
-    payload = {
-        'secret': RECAPTCHA_SECRET_KEY,
-        'response': recaptcha_response
-    }
-    response = requests.post('https://www.google.com/recaptcha/api/siteverify', data=payload)
-    result = response.json()
-    return result.get('success', False)
+    if app.config['CAPTCHA_VERIFIER'] is None:
+        app.config['CAPTCHA_VERIFIER'] = RecaptchaVerifier(RECAPTCHA_SECRET_KEY)
+    return app.config['CAPTCHA_VERIFIER'](recaptcha_response)
+
+
+def get_alert_feed():
+    """The AlertFeed following the detector's alert file."""
+    if app.config['ALERT_FEED'] is None:
+        # Threaded requests must not each start a follower on the same file
+        with _alert_feed_lock:
+            if app.config['ALERT_FEED'] is None:
+                feed = AlertFeed(app.config['ALERT_CAPACITY'])
+                feed.follow(app.config['ALERT_FILE'])
+                app.config['ALERT_FEED'] = feed
+    return app.config['ALERT_FEED']
+
+
+@atexit.register
+def _flush_failed_attempts():
+    if 'failed_attempts' in app.extensions:
+        app.extensions['failed_attempts'].flush()
 
 
 @app.route('/')
@@ -49,7 +110,7 @@ def index():
 def login():
     username = request.form['username']
     password = request.form['password']
-    recaptcha_response = request.form['g-recaptcha-response']
+    recaptcha_response = request.form.get('g-recaptcha-response', '')
 
     # Validate user input for SQL Injection and other vulnerabilities
     if not re.match(r'^[a-zA-Z0-9]{3,20}$', username):
@@ -60,31 +121,40 @@ def login():
         flash('Password must be at least 8 characters long and contain at least one number', 'danger')
         return redirect(url_for('index'))
 
+    # Reject clients over their attempt budget before any captcha or database work
+    if not get_limiter('ip').allow(request.remote_addr) or not get_limiter('user').allow(username):
+        logging.warning(f"Login rate limit hit for {username} from {request.remote_addr}")
+        flash('Too many login attempts. Please try again later.', 'danger')
+        return redirect(url_for('index'))
+
     # Verify the reCAPTCHA response using if-else
     if verify_recaptcha(recaptcha_response):
         # If CAPTCHA is verified, proceed with the login logic
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute('SELECT * FROM users WHERE username = %s', (username,))
-        user = cursor.fetchone()
-
-        # Check if user exists and verify the password
+        pool = get_db_pool()
+        failed_attempts = get_failed_attempts()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(pool.sql('SELECT password, failed_attempts FROM users WHERE username = %s'),
+                           (username,))
+            user = cursor.fetchone()
+            cursor.close()
+
+        # Check if user exists and verify the password (without holding a pooled connection)
         if user:
-            if check_password_hash(user['password'], password):
+            if check_password_hash(user[0], password):
                 # Reset failed attempts on successful login
-                cursor.execute('UPDATE users SET failed_attempts = 0 WHERE username = %s', (username,))
-                conn.commit()
+                with pool.connection() as conn:
+                    cursor = conn.cursor()
+                    failed_attempts.reset(username, cursor)
+                    conn.commit()
+                    cursor.close()
                 session.pop('failed_attempts', None)  # Clear failed attempts from session
                 session.pop('last_attempt_time', None)  # Clear timestamp from session
                 flash('Login successful!', 'success')
                 return redirect(url_for('dashboard'))
             else:
-                # Handle incorrect password
-                new_failed_attempts = user['failed_attempts'] + 1
-                cursor.execute('UPDATE users SET failed_attempts = %s, last_failed_attempt = NOW() WHERE username = %s',
-                               (new_failed_attempts, username))
-                conn.commit()
+                # Handle incorrect password; the counter is written in the next batch
+                new_failed_attempts = (user[1] or 0) + failed_attempts.record(username)
 
                 # Track failed attempts in session
                 session['failed_attempts'] = new_failed_attempts
@@ -107,7 +177,39 @@ def login():
 
 @app.route('/dashboard')
 def dashboard():
-    return render_template('dashboard.html')
+    # The page starts from the newest alerts; static/alert_feed.js streams the rest from cursor
+    feed = get_alert_feed()
+    return render_template('dashboard.html', alerts=feed.latest(50), cursor=feed.last_seq)
+
+
+@app.route('/api/alerts')
+def api_alerts():
+    """Alerts after ?since= (a sequence number), oldest first, at most ?limit= of them."""
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    return Response(get_alert_feed().since_json(since, limit), mimetype='application/json')
+
+
+@app.route('/api/alerts/stream')
+def api_alerts_stream():
+    """Server-sent events: one event per alert, id set to its sequence number."""
+    feed = get_alert_feed()
+    cursor = request.headers.get('Last-Event-ID', type=int)
+    if cursor is None:
+        cursor = request.args.get('since', feed.last_seq, type=int)
+
+    def events(cursor):
+        yield 'retry: 2000\n\n'
+        while True:
+            batch = feed.wait(cursor, timeout=15.0)
+            if not batch:
+                yield ': keepalive\n\n'
+                continue
+            cursor = batch[-1][0]
+            yield ''.join(f'id: {seq}\ndata: {text}\n\n' for seq, text in batch)
+
+    return Response(events(cursor), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,82 @@
+"""Latency and throughput of sklearn vs the compiled flat-array forest.
+
+    python bench_forest.py [--model-file ...] [--scaler-file ...] [--json out.json]
+"""
+
+import argparse
+import json
+import time
+import warnings
+
+import numpy as np
+from joblib import load
+
+from forest_compiler import compile_forest
+
+BATCH_SIZES = (1, 10, 100, 1000, 10000, 100000)
+
+
+def _time_calls(function, X, min_time=0.5, max_calls=1000):
+    """Call function(X) repeatedly and return the per-call latencies in seconds."""
+    latencies = []
+    deadline = time.perf_counter() + min_time
+    while len(latencies) < 3 or (time.perf_counter() < deadline and len(latencies) < max_calls):
+        start = time.perf_counter()
+        function(X)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+def benchmark_forest(clf, scaler, batch_sizes=BATCH_SIZES, seed=42, min_time=0.5):
+    """Compare sklearn and compiled scoring on synthetic inputs drawn around the scaler's means."""
+    compiled = compile_forest(clf, scaler)
+    rng = np.random.default_rng(seed)
+    X_all = rng.normal(scaler.mean_, scaler.scale_, size=(max(batch_sizes), len(scaler.mean_)))
+
+    def sklearn_predict(X):
+        return clf.predict(scaler.transform(X))
+
+    results = []
+    for batch_size in batch_sizes:
+        X = X_all[:batch_size]
+        identical = bool((sklearn_predict(X) == compiled.predict(X)).all())
+        row = {'batch_size': batch_size, 'identical': identical}
+        for name, function in (('sklearn', sklearn_predict), ('compiled', compiled.predict)):
+            latencies = _time_calls(function, X, min_time)
+            median = float(np.median(latencies))
+            row[f'{name}_ms_p50'] = median * 1000
+            row[f'{name}_ms_p99'] = float(np.percentile(latencies, 99)) * 1000
+            row[f'{name}_rows_per_s'] = batch_size / median
+        row['speedup'] = row['sklearn_ms_p50'] / row['compiled_ms_p50']
+        results.append(row)
+    return results
+
+
+def print_results(results):
+    print(f"{'batch':>7} {'sklearn ms':>11} {'compiled ms':>12} {'sklearn rows/s':>15} "
+          f"{'compiled rows/s':>16} {'speedup':>8} identical")
+    for row in results:
+        print(f"{row['batch_size']:>7} {row['sklearn_ms_p50']:>11.3f} {row['compiled_ms_p50']:>12.3f} "
+              f"{row['sklearn_rows_per_s']:>15,.0f} {row['compiled_rows_per_s']:>16,.0f} "
+              f"{row['speedup']:>7.1f}x {row['identical']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sklearn vs compiled Random Forest scoring.")
+    parser.add_argument('--model-file', default='random_forest_model.joblib')
+    parser.add_argument('--scaler-file', default='scaler.joblib')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(BATCH_SIZES))
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help="seconds spent timing each scorer per batch size")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with warnings.catch_warnings():
+        # Models pickled by another sklearn version still load and score the same
+        warnings.simplefilter('ignore')
+        clf, scaler = load(args.model_file), load(args.scaler_file)
+        results = benchmark_forest(clf, scaler, args.batch_sizes, min_time=args.min_time)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,586 @@
+"""End-to-end benchmark of the HIDS pipeline on synthetic traffic.
+
+Every stage runs offline on packets from synthetic_traffic, in its own
+forked process so its peak RSS is measured separately:
+
+    flows       FlowTable + FlowRecordWriter, the loop behind network.capture_packets
+    replay      the same, reading packets back from a pcap file (PcapFileSource)
+    preprocess  capture_preprocess.process_traffic_data on the captured CSV
+    train       RandomForest.train_model on a labelled synthetic dataset
+    score       RandomForest.predict_network_traffic on the preprocessed flows
+    forest      CompiledForest scoring of the same flows
+    rules       rule_engine.RuleEngine matching synthetic log records
+    sketches    sketches.ScanFloodDetector on the traffic with scans and a SYN flood
+                mixed in (SyntheticAttacks), with precision/recall of the detections
+    archive     flow_archive.FlowArchive writing the finished flows (rows/s), then
+                IP and IP + 15 minute queries (p50/p99 ms per query)
+    login       app.py's /login on a sqlite3 ConnectionPool with a stub captcha
+                verifier; fails if the rate limiter window or the failed-attempt
+                batcher's flush at interpreter exit misbehave
+    startup     hids.py subcommand startup in fresh interpreters (p50/p99 over the
+                commands held to hids.STARTUP_BUDGET_MS, startup_ms the slowest)
+
+    python benchmark.py [--flows 20000] [--json results.json] [--baseline old.json]
+
+With --baseline, throughput that drops (or latency/RSS that grows) by
+more than --tolerance, or a value outside a --thresholds file, is
+reported and the exit status is 1.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from synthetic_traffic import (SyntheticAttacks, SyntheticTraffic, synthetic_log_events, synthetic_rules,
+                               training_dataset, write_pcap)
+
+STAGES = ('flows', 'replay', 'preprocess', 'train', 'score', 'forest', 'rules', 'sketches', 'archive', 'login', 'startup')
+LATENCY_BATCH = 1000
+
+# Metric name -> True when a bigger value is better
+HIGHER_IS_BETTER = {
+    'packets_per_s': True,
+    'flows_per_s': True,
+    'rows_per_s': True,
+    'events_per_s': True,
+    'requests_per_s': True,
+    'seconds': False,
+    'p50_ms': False,
+    'p99_ms': False,
+    'startup_ms': False,
+    'precision': True,
+    'recall': True,
+    'peak_rss_mb': False,
+}
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _latency_ms(latencies):
+    if not latencies:
+        return {'p50_ms': 0.0, 'p99_ms': 0.0}
+    latencies = np.asarray(latencies) * 1000
+    return {'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99))}
+
+
+def _timed_batches(packets, latencies, batch_size=LATENCY_BATCH):
+    """Pass packets through, recording the time spent on each batch_size packets."""
+    count = 0
+    start = time.perf_counter()
+    for packet in packets:
+        yield packet
+        count += 1
+        if count == batch_size:
+            now = time.perf_counter()
+            latencies.append(now - start)
+            start, count = now, 0
+
+
+def _rates(seconds, **counts):
+    metrics = {'seconds': seconds}
+    for name, count in counts.items():
+        metrics[name] = count
+        metrics[f"{name.split('_')[0]}_per_s"] = count / seconds if seconds > 0 else 0.0
+    return metrics
+
+
+def _build_flows(packets, work_dir, table_kwargs):
+    from flow_stats import FlowTable, build_flows
+    from flow_writer import FlowRecordWriter
+
+    output_file = os.path.join(work_dir, 'captured_traffic.bin')
+    csv_file = os.path.join(work_dir, 'captured_traffic.csv')
+    for file_name in (output_file, csv_file):
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    latencies = []
+    table = FlowTable(**table_kwargs)
+    start = time.perf_counter()
+    with FlowRecordWriter(output_file, csv_file=csv_file, flush_records=10000) as writer:
+        packet_count = build_flows(_timed_batches(packets, latencies), writer, table)
+    seconds = time.perf_counter() - start
+    metrics = _rates(seconds, packets=packet_count, flows=writer.records_written)
+    metrics.update(_latency_ms(latencies))
+    return metrics
+
+
+def stage_flows(context):
+    packets = list(context['traffic'].packets())
+    return _build_flows(packets, context['work_dir'], context['table_kwargs'])
+
+
+def stage_replay(context):
+    from packet_sources import PcapFileSource
+
+    source = PcapFileSource(context['pcap_file'])
+    try:
+        return _build_flows(source, context['work_dir'], context['table_kwargs'])
+    finally:
+        source.close()
+
+
+def stage_preprocess(context):
+    from capture_preprocess import process_traffic_data
+
+    input_file = os.path.join(context['work_dir'], 'captured_traffic.csv')
+    output_file = os.path.join(context['work_dir'], 'captured_dataset.csv')
+    stats_file = os.path.join(context['work_dir'], 'preprocess_stats.joblib')
+    with open(input_file) as f:
+        rows = sum(1 for _ in f) - 1
+    start = time.perf_counter()
+    process_traffic_data(input_file, output_file, stats_file)
+    return _rates(time.perf_counter() - start, rows=rows)
+
+
+def stage_train(context):
+    import RandomForest
+
+    work_dir = context['work_dir']
+    with open(context['train_file']) as f:
+        rows = sum(1 for _ in f) - 1
+    start = time.perf_counter()
+    RandomForest.train_model(context['train_file'],
+                             os.path.join(work_dir, 'random_forest_model.joblib'),
+                             os.path.join(work_dir, 'scaler.joblib'), version='bench')
+    return _rates(time.perf_counter() - start, rows=rows)
+
+
+def _load_model(work_dir):
+    import RandomForest
+
+    return RandomForest.load_model(os.path.join(work_dir, 'random_forest_model.joblib'),
+                                   os.path.join(work_dir, 'scaler.joblib'))
+
+
+def stage_score(context):
+    import RandomForest
+
+    work_dir = context['work_dir']
+    clf, scaler = _load_model(work_dir)
+    start = time.perf_counter()
+    scored = RandomForest.predict_network_traffic(
+        clf, scaler, os.path.join(work_dir, 'captured_dataset.csv'),
+        os.path.join(work_dir, 'predicted_captured_dataset.csv'), train_file=context['train_file'])
+    metrics = _rates(time.perf_counter() - start, rows=len(scored))
+    metrics['malicious'] = int((scored['Predicted_Label'] == 1).sum())
+    return metrics
+
+
+def stage_forest(context):
+    import pandas as pd
+    import RandomForest
+    from forest_compiler import compile_forest
+
+    work_dir = context['work_dir']
+    clf, scaler = _load_model(work_dir)
+    columns = RandomForest.feature_columns(scaler, context['train_file'])
+    X = pd.read_csv(os.path.join(work_dir, 'captured_dataset.csv'))[columns].to_numpy(dtype='float64')
+    compiled = compile_forest(clf, scaler)
+    latencies = []
+    start = time.perf_counter()
+    for offset in range(0, len(X), LATENCY_BATCH):
+        batch_start = time.perf_counter()
+        compiled.predict(X[offset:offset + LATENCY_BATCH])
+        latencies.append(time.perf_counter() - batch_start)
+    metrics = _rates(time.perf_counter() - start, rows=len(X))
+    metrics.update(_latency_ms(latencies))
+    return metrics
+
+
+def _check_event_export(work_dir):
+    """Read a newest-first event log export twice, as Get-WinEvent | ConvertTo-Json writes them."""
+    from log_sources import EventLogExportSource
+
+    path = os.path.join(work_dir, 'events.json')
+
+    def export(first, last):
+        with open(path, 'w') as f:
+            json.dump([{'RecordId': record_id, 'Id': 4625, 'LogName': 'Security',
+                        'Message': f'event {record_id}'} for record_id in range(last, first - 1, -1)], f)
+
+    source = EventLogExportSource(path, log='Security')
+    export(101, 105)
+    first = [record['record_id'] for record in source.read_batch(2)] + \
+        [record['record_id'] for record in source.read_batch()]
+    export(101, 107)
+    second = [record['record_id'] for record in source.read_batch()]
+    if first != [105, 104, 103, 102, 101] or second != [107, 106]:
+        raise RuntimeError(f"Newest-first export read as {first}, then {second}")
+
+
+def stage_rules(context):
+    from rule_engine import RuleEngine
+
+    _check_event_export(context['work_dir'])
+    records = synthetic_log_events(context['n_events'], context['seed'])
+    engine = RuleEngine(synthetic_rules(context['n_rules'], context['seed']))
+    latencies = []
+    start = time.perf_counter()
+    for offset in range(0, len(records), LATENCY_BATCH):
+        batch_start = time.perf_counter()
+        engine.match_batch(records[offset:offset + LATENCY_BATCH])
+        latencies.append(time.perf_counter() - batch_start)
+    metrics = _rates(time.perf_counter() - start, events=len(records))
+    metrics.update(_latency_ms(latencies))
+    metrics['rules'] = len(engine.rules)
+    metrics['alerts'] = engine.alerts_raised
+    return metrics
+
+
+def stage_sketches(context):
+    from sketches import ScanFloodDetector, evaluate
+
+    attacks = SyntheticAttacks(context['traffic'], seed=context['seed'])
+    packets = list(attacks.packets())
+    detections = []
+    detector = ScanFloodDetector(sink=detections.append)
+    latencies = []
+    start = time.perf_counter()
+    detector.add_many(_timed_batches(packets, latencies))
+    metrics = _rates(time.perf_counter() - start, packets=len(packets))
+    metrics.update(_latency_ms(latencies))
+    accuracy = evaluate(detections, attacks.expected)
+    metrics['precision'] = accuracy['precision']
+    metrics['recall'] = accuracy['recall']
+    metrics['detections'] = accuracy['detected']
+    return metrics
+
+
+def stage_archive(context):
+    from flow_archive import FlowArchive
+    from flow_stats import FlowTable
+
+    table = FlowTable(**context['table_kwargs'])
+    records = []
+    for packet in context['traffic'].packets():
+        records.extend(flow.to_record() for flow in table.add(packet))
+    records.extend(flow.to_record() for flow in table.flush())
+    root = os.path.join(context['work_dir'], 'flow_archive')
+    shutil.rmtree(root, ignore_errors=True)
+    archive = FlowArchive(root, retention_days=None, flush_records=10000)
+    start = time.perf_counter()
+    for offset in range(0, len(records), 1000):
+        archive.extend(records[offset:offset + 1000])
+    archive.close()
+    metrics = _rates(time.perf_counter() - start, rows=len(records))
+
+    rng = np.random.default_rng(context['seed'])
+    latencies = []
+    for record in rng.choice(records, 100):
+        begin = record['Timestamp'].timestamp() - 450
+        query_start = time.perf_counter()
+        archive.query(ip=record['Source IP'])
+        archive.query(ip=record['Source IP'], start=begin, end=begin + 900)
+        latencies.append((time.perf_counter() - query_start) / 2)
+    metrics.update(_latency_ms(latencies))
+    metrics['segments'] = archive.stats()['segments']
+    return metrics
+
+
+def _login_db(path, n_users):
+    import sqlite3
+    from werkzeug.security import generate_password_hash
+
+    if os.path.exists(path):
+        os.remove(path)
+    # Cheap hashes: the stage measures the request path, not the password KDF
+    password = generate_password_hash('password123', method='pbkdf2:sha256:1000')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE users (username TEXT PRIMARY KEY, password TEXT, '
+                     'failed_attempts INTEGER DEFAULT 0, last_failed_attempt TEXT)')
+        conn.executemany('INSERT INTO users (username, password) VALUES (?, ?)',
+                         [(f'user{i}', password) for i in range(n_users)])
+
+
+def _failed_attempts(path):
+    import sqlite3
+
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT COALESCE(SUM(failed_attempts), 0) FROM users').fetchone()[0]
+
+
+def _login_pool(path):
+    import sqlite3
+    from login_security import ConnectionPool
+
+    return ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), size=4, placeholder='?')
+
+
+# Failed logins in a fresh interpreter that then exits normally, leaving them to the atexit flush
+_LOGIN_EXIT_SCRIPT = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+import app as webapp
+import benchmark
+webapp.app.config.update(DB_POOL=benchmark._login_pool(sys.argv[2]), CAPTCHA_VERIFIER=lambda response: True)
+client = webapp.app.test_client()
+for i in range(int(sys.argv[3])):
+    client.post('/login', data={'username': f'user{i}', 'password': 'wrongpass1', 'g-recaptcha-response': 'x'},
+                environ_base={'REMOTE_ADDR': f'10.1.{i // 250}.{i % 250}'})
+print(len(webapp.app.extensions['failed_attempts']._pending))
+'''
+
+
+def stage_login(context):
+    import subprocess
+
+    from login_security import SlidingWindowLimiter
+
+    # The window itself: limit hits pass, the next is refused until the first ages out
+    limiter = SlidingWindowLimiter(3, 60)
+    allowed = [limiter.allow('client', now) for now in (0, 1, 2, 3, 59.9, 60.0, 60.5)]
+    if allowed != [True, True, True, False, False, True, False]:
+        raise RuntimeError(f"SlidingWindowLimiter allowed {allowed}")
+
+    work_dir = context['work_dir']
+    os.chdir(work_dir)  # app.py logs to app.log in the working directory
+    import app as webapp
+
+    n_users = 200
+    db_file = os.path.join(work_dir, 'users.db')
+    _login_db(db_file, n_users)
+    captcha_calls = []
+
+    def verifier(response):
+        captcha_calls.append(response)
+        return response == 'ok'
+
+    pool = _login_pool(db_file)
+    webapp.app.config.update(DB_POOL=pool, CAPTCHA_VERIFIER=verifier,
+                             LOGIN_LIMIT_PER_USER=5, LOGIN_LIMIT_PER_IP=20)
+    # Every request is a new client, so flashed messages do not pile up in one session cookie
+    client = webapp.app.test_client(use_cookies=False)
+    rng = np.random.default_rng(context['seed'])
+    latencies = []
+    start = time.perf_counter()
+    for i in range(context['n_logins']):
+        user = int(rng.integers(n_users))
+        password = 'password123' if rng.random() < 0.5 else 'wrongpass1'
+        request_start = time.perf_counter()
+        response = client.post('/login', data={'username': f'user{user}', 'password': password,
+                                               'g-recaptcha-response': 'ok'},
+                               environ_base={'REMOTE_ADDR': f'10.0.{i // 250 % 250}.{i % 250}'})
+        latencies.append(time.perf_counter() - request_start)
+        if response.status_code != 302:
+            raise RuntimeError(f"/login answered {response.status_code}")
+    metrics = _rates(time.perf_counter() - start, requests=context['n_logins'])
+    metrics.update(_latency_ms(latencies))
+
+    # One user hammering from one address: the sixth attempt never reaches the captcha
+    calls = len(captcha_calls)
+    for _ in range(6):
+        client.post('/login', data={'username': 'burst', 'password': 'wrongpass1', 'g-recaptcha-response': 'ok'},
+                    environ_base={'REMOTE_ADDR': '192.0.2.1'})
+    if len(captcha_calls) - calls != 5:
+        raise RuntimeError(f"{len(captcha_calls) - calls} of 6 burst logins reached the captcha, expected 5")
+    limited = context['n_logins'] + 6 - len(captcha_calls)
+    webapp.app.extensions['failed_attempts'].flush()
+    pool.close()
+
+    # Failed attempts still waiting for their batch must reach the database at exit
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    exit_db_file = os.path.join(work_dir, 'users_exit.db')
+    _login_db(exit_db_file, n_users)
+    pending = subprocess.run([sys.executable, '-c', _LOGIN_EXIT_SCRIPT, repo_dir, exit_db_file, '50'],
+                             capture_output=True, text=True, check=True, cwd=work_dir).stdout
+    written = _failed_attempts(exit_db_file)
+    if written != 50:
+        raise RuntimeError(f"{written} of 50 failed logins written after exit "
+                           f"({pending.strip()} were pending)")
+    metrics['rate_limited'] = limited
+    metrics['captcha_calls'] = len(captcha_calls)
+    metrics['pending_at_exit'] = int(pending.strip().splitlines()[-1])
+    return metrics
+
+
+def stage_startup(context):
+    import hids
+
+    start = time.perf_counter()
+    results = hids.check_startup()
+    seconds = time.perf_counter() - start
+    budgeted = sorted(r['startup_ms'] for command, r in results.items() if not hids.COMMANDS[command][2])
+    return {
+        'seconds': seconds,
+        'p50_ms': float(np.percentile(budgeted, 50)),
+        'p99_ms': float(np.percentile(budgeted, 99)),
+        'startup_ms': budgeted[-1],
+        'over_budget': sum(r['over_budget'] for r in results.values()),
+        'unexpected_imports': sum(len(r['unexpected']) for r in results.values()),
+    }
+
+
+def _child(function, context, results):
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            metrics = function(context)
+        metrics['peak_rss_mb'] = _peak_rss_mb()
+        results.put(('ok', metrics))
+    except Exception as e:
+        results.put(('error', f"{type(e).__name__}: {e}"))
+
+
+def run_stage(name, context):
+    """Run one stage in a forked child and return its metrics."""
+    function = globals()[f'stage_{name}']
+    if 'fork' in mp.get_all_start_methods():
+        ctx = mp.get_context('fork')
+        results = ctx.Queue()
+        process = ctx.Process(target=_child, args=(function, context, results))
+        process.start()
+        status, payload = results.get()
+        process.join()
+    else:
+        # No fork (Windows): run in-process, so peak RSS also covers earlier stages
+        results = queue.Queue()
+        _child(function, context, results)
+        status, payload = results.get()
+    if status == 'error':
+        raise RuntimeError(f"Stage {name} failed: {payload}")
+    return payload
+
+
+def run_benchmark(n_flows=20000, packets_per_flow=20, attack_ratio=0.1, train_flows=None,
+                  seed=42, stages=STAGES, work_dir=None, idle_timeout=120.0,
+                  active_timeout=1800.0, max_flows=100000, n_events=200000, n_rules=1000, n_logins=2000):
+    """Generate synthetic traffic, run the requested stages and return the results dict."""
+    cleanup = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='hids-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+    traffic = SyntheticTraffic(n_flows, packets_per_flow, attack_ratio, seed=seed)
+    context = {
+        'traffic': traffic,
+        'work_dir': work_dir,
+        'pcap_file': os.path.join(work_dir, 'synthetic.pcap'),
+        'train_file': os.path.join(work_dir, 'network_dataset.csv'),
+        'table_kwargs': {'idle_timeout': idle_timeout, 'active_timeout': active_timeout,
+                         'max_flows': max_flows},
+        'seed': seed,
+        'n_events': n_events,
+        'n_rules': n_rules,
+        'n_logins': n_logins,
+    }
+    results = {
+        'config': {'n_flows': n_flows, 'packets_per_flow': packets_per_flow,
+                   'attack_ratio': attack_ratio, 'seed': seed, 'n_events': n_events,
+                   'n_rules': n_rules, 'n_logins': n_logins},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'stages': {},
+    }
+    try:
+        if 'replay' in stages:
+            write_pcap(context['pcap_file'], traffic.packets())
+        if {'train', 'score', 'forest'} & set(stages):
+            train_traffic = SyntheticTraffic(train_flows or n_flows, packets_per_flow, attack_ratio,
+                                             seed=seed + 1000)
+            training_dataset(train_traffic, **context['table_kwargs']).to_csv(context['train_file'],
+                                                                              index=False)
+        for name in STAGES:
+            if name in stages:
+                results['stages'][name] = run_stage(name, context)
+    finally:
+        if cleanup:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline=None, tolerance=0.2, thresholds=None):
+    """Return a list of regression messages.
+
+    Metrics are compared with the same stage and metric in baseline,
+    allowing a relative change of tolerance in the bad direction.
+    thresholds maps stage -> metric -> {'min': x} and/or {'max': y}.
+    """
+    problems = []
+    for stage, metrics in results['stages'].items():
+        if baseline is not None:
+            old_metrics = baseline.get('stages', {}).get(stage, {})
+            for metric, higher_is_better in HIGHER_IS_BETTER.items():
+                if metric not in metrics or not old_metrics.get(metric):
+                    continue
+                new, old = metrics[metric], old_metrics[metric]
+                change = (new - old) / old
+                if (-change if higher_is_better else change) > tolerance:
+                    problems.append(f"{stage}.{metric}: {new:,.2f} vs baseline {old:,.2f} "
+                                    f"({change:+.0%})")
+        for metric, limits in (thresholds or {}).get(stage, {}).items():
+            if metric not in metrics:
+                continue
+            value = metrics[metric]
+            if 'min' in limits and value < limits['min']:
+                problems.append(f"{stage}.{metric}: {value:,.2f} below minimum {limits['min']:,.2f}")
+            if 'max' in limits and value > limits['max']:
+                problems.append(f"{stage}.{metric}: {value:,.2f} above maximum {limits['max']:,.2f}")
+    return problems
+
+
+def print_results(results):
+    print(f"{'stage':<11} {'seconds':>8} {'packets/s':>11} {'flows/s':>10} {'rows/s':>11} "
+          f"{'events/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'peak RSS MB':>12}")
+    for stage, m in results['stages'].items():
+        def cell(metric, width, spec=',.0f'):
+            return f"{m[metric]:>{width}{spec}}" if metric in m else ' ' * (width - 1) + '-'
+        print(f"{stage:<11} {m['seconds']:>8.2f} {cell('packets_per_s', 11)} {cell('flows_per_s', 10)} "
+              f"{cell('rows_per_s', 11)} {cell('events_per_s', 10)} {cell('p50_ms', 8, '.2f')} "
+              f"{cell('p99_ms', 8, '.2f')} {m['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark each HIDS stage on synthetic traffic.")
+    parser.add_argument('--flows', type=int, default=20000, help="number of synthetic flows")
+    parser.add_argument('--packets-per-flow', type=int, default=20)
+    parser.add_argument('--attack-ratio', type=float, default=0.1)
+    parser.add_argument('--train-flows', type=int, help="flows in the training set (default: --flows)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--events', type=int, default=200000, help="log records for the rules stage")
+    parser.add_argument('--rules', type=int, default=1000, help="rules for the rules stage")
+    parser.add_argument('--logins', type=int, default=2000, help="login requests for the login stage")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--work-dir', help="keep generated files here instead of a temporary directory")
+    parser.add_argument('--json', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="results JSON from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed relative regression against the baseline")
+    parser.add_argument('--thresholds', help="JSON file of {stage: {metric: {min|max: value}}}")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.flows, args.packets_per_flow, args.attack_ratio, args.train_flows,
+                            args.seed, args.stages, args.work_dir, n_events=args.events,
+                            n_rules=args.rules, n_logins=args.logins)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baseline = thresholds = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    if baseline is not None or thresholds is not None:
+        problems = compare(results, baseline, args.tolerance, thresholds)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+        print("No regressions")
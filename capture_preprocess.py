@@ -1,59 +1,135 @@
-import ipaddress
+import argparse
+import os
 import pandas as pd
 import numpy as np
-from sklearn.impute import SimpleImputer
+from joblib import dump, load
 
-def process_traffic_data(input_file, output_file):
-    # Set up the SimpleImputer
-    imputer = SimpleImputer(strategy='mean')
+import metrics
 
-    # Initialize a flag to check if the output file already exists (for appending data)
-    is_first_chunk = True
+_ROWS = metrics.counter('hids_preprocess_rows_total', "Captured flow rows preprocessed")
+_CHUNK_SECONDS = metrics.histogram('hids_preprocess_chunk_seconds', "Time to transform and write one chunk")
 
-    # Define a function to process each chunk
-    def process_chunk(df):
-        # Map protocol names to integers (TCP = 6, UDP = 17)
-        protocol_map = {'TCP': 6, 'UDP': 17}
-        df['Protocol'] = df['Protocol'].map(protocol_map).astype('Int64')
+# Imputation statistics learned at training time, saved next to scaler.joblib
+STATS_FILE = 'preprocess_stats.joblib'
 
-        # Remove any extra spaces in column names
-        df.columns = df.columns.str.strip()
+PROTOCOL_MAP = {'TCP': 6, 'UDP': 17}
+IP_COLUMNS = ('Source IP', 'Destination IP')
+_IPV4_PATTERN = r'^(0|[1-9]\d{0,2})\.(0|[1-9]\d{0,2})\.(0|[1-9]\d{0,2})\.(0|[1-9]\d{0,2})$'
+
+
+def ip_to_int(values):
+    """Vectorized IPv4 string -> integer conversion, NaN where the address is invalid."""
+    if pd.api.types.is_numeric_dtype(values):
+        numbers = pd.to_numeric(values, errors='coerce').astype('float64')
+        return numbers.where((numbers >= 0) & (numbers < 2 ** 32))
+    octets = values.astype('string').str.extract(_IPV4_PATTERN).apply(pd.to_numeric).astype('float64')
+    if (octets > 255).any(axis=None):
+        octets[octets > 255] = np.nan
+    return (octets[0] * 16777216 + octets[1] * 65536 + octets[2] * 256 + octets[3]).rename(values.name)
 
-        # Convert 'Source IP' and 'Destination IP' to integers using IP address conversion
-        def safe_ip_conversion(ip):
-            try:
-                return int(ipaddress.IPv4Address(ip))
-            except ValueError:
-                return np.nan  # Return NaN if the IP is invalid
 
-        df['Source IP'] = df['Source IP'].apply(safe_ip_conversion)
-        df['Destination IP'] = df['Destination IP'].apply(safe_ip_conversion)
+def timestamp_to_epoch(values):
+    """Vectorized timestamp -> Unix seconds; naive times are read as UTC, like Timestamp.timestamp()."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype('float64')
+    times = pd.to_datetime(values, errors='coerce')
+    if getattr(times.dt, 'tz', None) is not None:
+        times = times.dt.tz_convert('UTC').dt.tz_localize(None)
+    nanoseconds = times.to_numpy(dtype='datetime64[ns]').view('int64')
+    seconds = np.round(nanoseconds / 1e9, 6)
+    seconds[times.isna().to_numpy()] = np.nan
+    return pd.Series(seconds, index=values.index, name=values.name)
 
-        # Convert 'Timestamp' to datetime format and then to Unix timestamp
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'], errors='coerce')
-        df['Timestamp'] = df['Timestamp'].apply(lambda x: x.timestamp() if pd.notnull(x) else np.nan)
 
-        # Replace infinite values with NaN
-        df.replace([np.inf, -np.inf], np.nan, inplace=True)
+class FlowTransformer:
+    """Turn raw flow records into numeric model input.
+
+    Maps protocol names to numbers, IPs to integers and timestamps to
+    epoch seconds, then turns +/-inf into NaN and fills NaN with column
+    means. The means are learned once with fit() on training data and
+    saved with save(), so every chunk and every streamed batch is
+    imputed the same way. Columns without a learned mean are filled with 0.
+    """
+
+    def __init__(self, means=None):
+        self.means = dict(means or {})
+
+    def convert(self, df):
+        """Apply the type conversions without imputing."""
+        df = df.copy()
+        df.columns = df.columns.str.strip()
+        if 'Protocol' in df.columns and not pd.api.types.is_numeric_dtype(df['Protocol']):
+            df['Protocol'] = df['Protocol'].map(PROTOCOL_MAP).astype('float64')
+        for column in IP_COLUMNS:
+            if column in df.columns:
+                df[column] = ip_to_int(df[column])
+        if 'Timestamp' in df.columns:
+            df['Timestamp'] = timestamp_to_epoch(df['Timestamp'])
+        numerical_columns = df.select_dtypes(include='number').columns
+        df[numerical_columns] = df[numerical_columns].astype('float64').replace([np.inf, -np.inf], np.nan)
+        return df
 
-        # Impute missing numerical values using the mean of the column
-        numerical_columns = df.select_dtypes(include=['float64', 'int64']).columns
-        df[numerical_columns] = imputer.fit_transform(df[numerical_columns])
+    def fit(self, df):
+        """Learn the imputation means from training data."""
+        df = self.convert(df)
+        numerical_columns = df.select_dtypes(include='number').columns
+        self.means = {column: float(mean) for column, mean in df[numerical_columns].mean().items()
+                      if pd.notnull(mean)}
+        return self
 
+    def transform(self, df):
+        """Convert df and fill missing values with the learned means."""
+        df = self.convert(df)
+        numerical_columns = df.select_dtypes(include='number').columns
+        fill = {column: self.means.get(column, 0.0) for column in numerical_columns}
+        df[numerical_columns] = df[numerical_columns].fillna(fill)
         return df
-    chunk_size = 500
+
+    def transform_records(self, records, columns):
+        """Build the model's feature matrix from flow record dicts."""
+        return self.transform(pd.DataFrame.from_records(records, columns=columns))[columns].to_numpy(dtype='float64')
+
+    def save(self, path=STATS_FILE):
+        dump({'means': self.means}, path)
+
+    @classmethod
+    def load(cls, path=STATS_FILE):
+        return cls(load(path)['means'])
+
+
+def process_traffic_data(input_file, output_file, stats_file=STATS_FILE, chunk_size=100000):
+    if os.path.isfile(stats_file):
+        transformer = FlowTransformer.load(stats_file)
+    else:
+        # No training statistics: learn them from the first chunk and keep them for the rest
+        print(f"{stats_file} not found, imputing with the means of the first chunk")
+        transformer = None
+
+    # Initialize a flag to check if the output file already exists (for appending data)
+    is_first_chunk = True
+
     for chunk in pd.read_csv(input_file, chunksize=chunk_size):
-        processed_chunk = process_chunk(chunk)
-        print("first iteration is finished")
+        with _CHUNK_SECONDS.time():
+            if transformer is None:
+                transformer = FlowTransformer().fit(chunk)
+            processed_chunk = transformer.transform(chunk)
 
-        # Append to the output CSV file (create file if it doesn't exist)
-        if is_first_chunk:
-            processed_chunk.to_csv(output_file, index=False, mode='w')
-            is_first_chunk = False
-        else:
-            processed_chunk.to_csv(output_file, index=False, mode='a', header=False)
+            # Append to the output CSV file (create file if it doesn't exist)
+            if is_first_chunk:
+                processed_chunk.to_csv(output_file, index=False, mode='w')
+                is_first_chunk = False
+            else:
+                processed_chunk.to_csv(output_file, index=False, mode='a', header=False)
+        _ROWS.inc(len(chunk))
 
     print(f"Processed data saved to {output_file}")
 
-# Call the function with the desired input and output filenames
-process_traffic_data('captured_traffic.csv', 'captured_dataset1.csv')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert captured flow records into model input.")
+    parser.add_argument('input_file', nargs='?', default='captured_traffic.csv')
+    parser.add_argument('output_file', nargs='?', default='captured_dataset.csv')
+    parser.add_argument('--stats-file', default=STATS_FILE)
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    args = parser.parse_args()
+    process_traffic_data(args.input_file, args.output_file, args.stats_file, args.chunk_size)
@@ -1,6 +1,6 @@
-import requests
-
 def net():
+    import requests
+
     try:
         res = requests.get("http://google.com",timeout=5)
         return True
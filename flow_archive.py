@@ -0,0 +1,519 @@
+"""Time-partitioned columnar archive of flow records and their predictions.
+
+Finished flows are kept under one directory per UTC hour, in immutable
+segments of numpy columns (one .npy file per COLUMNS entry plus Label:
+-1 unscored, 0 benign, 1 malicious), with rows sorted by time:
+
+    flow_archive/2026-10-18T02/<segment>/source_ip.npy ...
+                                         ip_index.npy   (ip, row) sorted by ip
+                                         meta.json      count, min/max time, label counts,
+                                                        bloom filter of every IP
+
+A query only opens the segments whose hour, time range, label counts and
+bloom filter can match, and reads their columns through memory maps: the
+time range is a binary search on the sorted timestamps and an IP a binary
+search of ip_index, so only matching rows are ever touched.
+
+    python flow_archive.py query --ip 10.0.0.5 --start 2026-10-18T02:00 --end 2026-10-18T02:15
+    python flow_archive.py query --port 22 --label 1 --csv > suspicious.csv
+    python flow_archive.py import captured_traffic.bin
+    python flow_archive.py stats
+    python flow_archive.py prune --retention-days 7
+
+Partitions older than retention_days (or the oldest ones, while the
+archive is over max_bytes) are deleted whenever new flows are flushed.
+Segments are written to a temporary directory and renamed into place,
+and a compacted segment lists the ones it replaces, so readers never see
+a half-written or doubled partition.
+"""
+
+import argparse
+import base64
+import calendar
+import csv
+import json
+import os
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import metrics
+from flow_stats import COLUMNS
+from flow_writer import PROTOCOL_NAMES, PROTOCOL_NUMBERS, RECORD
+
+ARCHIVE_DIR = 'flow_archive'
+LABEL = 'Label'
+UNSCORED = -1
+BLOOM_BITS_PER_IP = 10
+BLOOM_HASHES = 7
+_HOUR_FORMAT = '%Y-%m-%dT%H'
+_META_FILE = 'meta.json'
+_INDEX_FILE = 'ip_index.npy'
+
+_RECORDS_ARCHIVED = metrics.counter('hids_archive_records_total', "Flow records written to the archive")
+_SEGMENTS_WRITTEN = metrics.counter('hids_archive_segments_total', "Archive segments written")
+_QUERY_SECONDS = metrics.histogram('hids_archive_query_seconds', "Time to answer one archive query")
+
+# Same widths as the binary flow records (flow_writer.RECORD), IPs as integers
+_STRUCT_DTYPES = {'4s': '<u4', 'H': '<u2', 'B': 'u1', 'd': '<f8', 'Q': '<u8', 'I': '<u4'}
+DTYPES = {name: np.dtype(_STRUCT_DTYPES[code])
+          for name, code in zip(COLUMNS, re.findall(r'\d*[A-Za-z]', RECORD.format.lstrip('<')))}
+DTYPES[LABEL] = np.dtype('i1')
+
+_INDEX_DTYPE = np.dtype([('ip', '<u4'), ('row', '<u4')])
+
+
+def column_file(name):
+    """'Flow Packets/s' -> 'flow_packets_s.npy'."""
+    return re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_') + '.npy'
+
+
+def ip_to_int(ip):
+    return int.from_bytes(socket.inet_aton(ip), 'big')
+
+
+def int_to_ip(value):
+    return socket.inet_ntoa(int(value).to_bytes(4, 'big'))
+
+
+def partition_name(timestamp):
+    return time.strftime(_HOUR_FORMAT, time.gmtime(timestamp))
+
+
+def partition_start(name):
+    """Epoch seconds at which partition name's hour starts."""
+    return calendar.timegm(time.strptime(name, _HOUR_FORMAT))
+
+
+def _mix64(values):
+    """splitmix64 finaliser over a uint64 array (wraps, as intended)."""
+    x = values.astype(np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def _bloom_positions(values, bits, hashes):
+    x = _mix64(np.asarray(values))
+    h1 = x & np.uint64(0xffffffff)
+    h2 = (x >> np.uint64(32)) | np.uint64(1)
+    steps = np.arange(hashes, dtype=np.uint64)
+    return (h1[:, None] + steps * h2[:, None]) % np.uint64(bits)
+
+
+def bloom_filter(values, bits_per_value=BLOOM_BITS_PER_IP, hashes=BLOOM_HASHES):
+    """Packed bit array of a bloom filter holding values (about 1% false positives)."""
+    bits = max(1024, (len(values) * bits_per_value + 7) // 8 * 8)
+    filled = np.zeros(bits, dtype=bool)
+    filled[_bloom_positions(values, bits, hashes).ravel()] = True
+    return np.packbits(filled)
+
+
+def bloom_contains(packed, value, hashes=BLOOM_HASHES):
+    positions = _bloom_positions([value], len(packed) * 8, hashes).ravel().astype(np.int64)
+    return bool(np.all(packed[positions >> 3] & (0x80 >> (positions & 7))))
+
+
+def _to_columns(records, labels=None):
+    """Column arrays for flow record dicts, sorted by timestamp."""
+    count = len(records)
+    columns = {}
+    for name in COLUMNS:
+        values = (record[name] for record in records)
+        if name in ('Source IP', 'Destination IP'):
+            values = (ip_to_int(ip) for ip in values)
+        elif name == 'Protocol':
+            values = (PROTOCOL_NUMBERS.get(protocol, 0) for protocol in values)
+        elif name == 'Timestamp':
+            values = (t.timestamp() if hasattr(t, 'timestamp') else float(t) for t in values)
+        columns[name] = np.fromiter(values, DTYPES[name], count)
+    if labels is None:
+        columns[LABEL] = np.full(count, UNSCORED, DTYPES[LABEL])
+    else:
+        columns[LABEL] = np.asarray(labels, dtype=DTYPES[LABEL])
+    order = np.argsort(columns['Timestamp'], kind='stable')
+    return {name: column[order] for name, column in columns.items()}
+
+
+def _to_records(columns):
+    """Flow record dicts (plus Label) back from column arrays."""
+    lists = {name: column.tolist() for name, column in columns.items()}
+    lists['Source IP'] = [int_to_ip(ip) for ip in lists['Source IP']]
+    lists['Destination IP'] = [int_to_ip(ip) for ip in lists['Destination IP']]
+    lists['Protocol'] = [PROTOCOL_NAMES.get(protocol, '') for protocol in lists['Protocol']]
+    lists['Timestamp'] = [datetime.fromtimestamp(t) for t in lists['Timestamp']]
+    names = list(lists)
+    return [dict(zip(names, row)) for row in zip(*lists.values())]
+
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class FlowArchive:
+    """Append flow records by the hour and answer IP/port/label/time queries.
+
+    Records are buffered and written as one segment per hour they fall
+    in once flush_records are held or flush_interval seconds have
+    passed. A partition that reaches compact_segments segments is merged
+    back into one.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR, retention_days=30, max_bytes=None, flush_records=50000,
+                 flush_interval=60.0, compact_segments=16):
+        self.root = root
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.compact_segments = compact_segments
+        self.records_written = 0
+        self.partitions_deleted = 0
+        self.last_query = {}
+        self._records = []
+        self._labels = []
+        self._last_flush = time.monotonic()
+        self._meta = {}  # segment path -> meta; segments never change once written
+        os.makedirs(root, exist_ok=True)
+
+    def extend(self, records, labels=None):
+        """Buffer finished flow records, with their predicted labels when scored."""
+        self._records.extend(records)
+        self._labels.extend(labels if labels is not None else [UNSCORED] * len(records))
+        if (len(self._records) >= self.flush_records
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write buffered records out, then compact and apply the retention policy."""
+        self._last_flush = time.monotonic()
+        if not self._records:
+            return
+        records, labels = self._records, self._labels
+        self._records, self._labels = [], []
+        columns = _to_columns(records, labels)
+        hours = (columns['Timestamp'] // 3600).astype(np.int64)
+        starts = np.flatnonzero(np.diff(hours)) + 1
+        for lo, hi in zip(np.concatenate(([0], starts)), np.concatenate((starts, [len(hours)]))):
+            name = partition_name(int(hours[lo]) * 3600)
+            self._write_segment(name, {column: values[lo:hi] for column, values in columns.items()})
+            if len(self.segments(name)) >= self.compact_segments:
+                self.compact(name)
+        self.records_written += len(records)
+        _RECORDS_ARCHIVED.inc(len(records))
+        self.enforce_retention()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write_segment(self, partition, columns, replaces=()):
+        """Write sorted columns atomically as a new segment of partition."""
+        directory = os.path.join(self.root, partition)
+        os.makedirs(directory, exist_ok=True)
+        ips = np.concatenate((columns['Source IP'], columns['Destination IP']))
+        rows = np.tile(np.arange(len(columns['Timestamp']), dtype=np.uint32), 2)
+        order = np.lexsort((rows, ips))
+        index = np.empty(len(ips), _INDEX_DTYPE)
+        index['ip'] = ips[order]
+        index['row'] = rows[order]
+        timestamps = columns['Timestamp']
+        labels, counts = np.unique(columns[LABEL], return_counts=True)
+        meta = {
+            'count': len(timestamps),
+            'min_time': float(timestamps[0]),
+            'max_time': float(timestamps[-1]),
+            'labels': {str(label): int(count) for label, count in zip(labels.tolist(), counts)},
+            'bloom': base64.b64encode(bloom_filter(np.unique(ips)).tobytes()).decode('ascii'),
+            'replaces': list(replaces),
+        }
+        tmp_dir = tempfile.mkdtemp(dir=directory, prefix='.segment-')
+        try:
+            for name, values in columns.items():
+                np.save(os.path.join(tmp_dir, column_file(name)), values)
+            np.save(os.path.join(tmp_dir, _INDEX_FILE), index)
+            with open(os.path.join(tmp_dir, _META_FILE), 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_dir, os.path.join(directory, f"{time.time_ns():020d}"))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        _SEGMENTS_WRITTEN.inc()
+
+    def partitions(self):
+        """Hour partition names, oldest first."""
+        names = []
+        for name in os.listdir(self.root):
+            try:
+                partition_start(name)
+            except ValueError:
+                continue
+            names.append(name)
+        return sorted(names)
+
+    def _load_meta(self, path):
+        meta = self._meta.get(path)
+        if meta is None:
+            with open(os.path.join(path, _META_FILE)) as f:
+                meta = json.load(f)
+            meta['bloom'] = np.frombuffer(base64.b64decode(meta['bloom']), dtype=np.uint8)
+            self._meta[path] = meta
+        return meta
+
+    def segments(self, partition):
+        """[(segment path, meta)] of partition, without those a compaction replaced."""
+        directory = os.path.join(self.root, partition)
+        try:
+            names = sorted(name for name in os.listdir(directory) if not name.startswith('.'))
+        except FileNotFoundError:
+            return []
+        segments = []
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                segments.append((name, path, self._load_meta(path)))
+            except FileNotFoundError:
+                # Removed by a compaction or prune in another process
+                continue
+        replaced = {old for _, _, meta in segments for old in meta['replaces']}
+        return [(path, meta) for name, path, meta in segments if name not in replaced]
+
+    def _open(self, path, names):
+        return {name: np.load(os.path.join(path, column_file(name)), mmap_mode='r') for name in names}
+
+    def compact(self, partition):
+        """Merge partition's segments into one; returns the number merged."""
+        segments = self.segments(partition)
+        if len(segments) < 2:
+            return 0
+        parts = [self._open(path, DTYPES) for path, _ in segments]
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in DTYPES}
+        order = np.argsort(columns['Timestamp'], kind='stable')
+        columns = {name: values[order] for name, values in columns.items()}
+        del parts
+        self._write_segment(partition, columns, replaces=[os.path.basename(path) for path, _ in segments])
+        for path, _ in segments:
+            shutil.rmtree(path, ignore_errors=True)
+            self._meta.pop(path, None)
+        return len(segments)
+
+    def enforce_retention(self, now=None):
+        """Delete partitions past retention_days, then the oldest while over max_bytes."""
+        now = time.time() if now is None else now
+        deleted = []
+        partitions = self.partitions()
+        if self.retention_days is not None:
+            cutoff = now - self.retention_days * 86400
+            while partitions and partition_start(partitions[0]) + 3600 <= cutoff:
+                deleted.append(partitions.pop(0))
+        if self.max_bytes is not None:
+            sizes = [_directory_size(os.path.join(self.root, name)) for name in partitions]
+            total = sum(sizes)
+            # The newest partition is kept whatever its size
+            while len(partitions) > 1 and total > self.max_bytes:
+                total -= sizes.pop(0)
+                deleted.append(partitions.pop(0))
+        for name in deleted:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        self._meta = {path: meta for path, meta in self._meta.items()
+                      if os.path.basename(os.path.dirname(path)) not in deleted}
+        self.partitions_deleted += len(deleted)
+        return deleted
+
+    def query(self, ip=None, port=None, label=None, protocol=None, start=None, end=None, limit=None):
+        """Flow records (with Label) matching every filter given, oldest first.
+
+        ip and port match either end of a flow; start and end are epoch
+        seconds or datetimes, end exclusive. last_query records how many
+        partitions and segments were skipped without being read.
+        """
+        started = time.perf_counter()
+        start = start.timestamp() if hasattr(start, 'timestamp') else start
+        end = end.timestamp() if hasattr(end, 'timestamp') else end
+        ip_value = ip_to_int(ip) if ip is not None else None
+        protocol = PROTOCOL_NUMBERS.get(protocol, protocol) if protocol is not None else None
+        stats = {'partitions': 0, 'partitions_skipped': 0, 'segments': 0, 'segments_skipped': 0,
+                 'rows_examined': 0, 'rows': 0}
+        self.last_query = stats
+        results = []
+        for partition in self.partitions():
+            hour = partition_start(partition)
+            if (start is not None and hour + 3600 <= start) or (end is not None and hour >= end):
+                stats['partitions_skipped'] += 1
+                continue
+            stats['partitions'] += 1
+            for path, meta in self.segments(partition):
+                if ((start is not None and meta['max_time'] < start)
+                        or (end is not None and meta['min_time'] >= end)
+                        or (label is not None and not meta['labels'].get(str(label)))
+                        or (ip_value is not None and not bloom_contains(meta['bloom'], ip_value))):
+                    stats['segments_skipped'] += 1
+                    continue
+                stats['segments'] += 1
+                rows, examined = self._match(path, ip_value, port, label, protocol, start, end)
+                stats['rows_examined'] += examined
+                if len(rows):
+                    columns = self._open(path, DTYPES)
+                    results.extend(_to_records({name: values[rows] for name, values in columns.items()}))
+                    if limit is not None and len(results) >= limit:
+                        del results[limit:]
+                        stats['rows'] = len(results)
+                        _QUERY_SECONDS.observe(time.perf_counter() - started)
+                        return results
+        stats['rows'] = len(results)
+        _QUERY_SECONDS.observe(time.perf_counter() - started)
+        return results
+
+    def _match(self, path, ip_value, port, label, protocol, start, end):
+        """(row numbers of one segment that pass every filter, rows in its time/IP range)."""
+        timestamps = np.load(os.path.join(path, column_file('Timestamp')), mmap_mode='r')
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, 'left'))
+        hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, 'left'))
+        if ip_value is not None:
+            index = np.load(os.path.join(path, _INDEX_FILE), mmap_mode='r')
+            ips = index['ip']
+            first = int(np.searchsorted(ips, ip_value, 'left'))
+            last = int(np.searchsorted(ips, ip_value, 'right'))
+            rows = np.unique(index['row'][first:last]).astype(np.int64)
+            rows = rows[(rows >= lo) & (rows < hi)]
+        else:
+            rows = np.arange(lo, max(lo, hi))
+        examined = len(rows)
+        if not examined:
+            return rows, examined
+        names = []
+        if port is not None:
+            names += ['Source Port', 'Destination Port']
+        if label is not None:
+            names.append(LABEL)
+        if protocol is not None:
+            names.append('Protocol')
+        if not names:
+            return rows, examined
+        columns = self._open(path, names)
+        keep = np.ones(len(rows), dtype=bool)
+        if port is not None:
+            keep &= (columns['Source Port'][rows] == port) | (columns['Destination Port'][rows] == port)
+        if label is not None:
+            keep &= columns[LABEL][rows] == label
+        if protocol is not None:
+            keep &= columns['Protocol'][rows] == protocol
+        return rows[keep], examined
+
+    def stats(self):
+        """Partition, segment and record counts, bytes on disk and the time span covered."""
+        partitions = self.partitions()
+        segments = [meta for partition in partitions for _, meta in self.segments(partition)]
+        labels = {}
+        for meta in segments:
+            for label, count in meta['labels'].items():
+                labels[label] = labels.get(label, 0) + count
+        return {
+            'partitions': len(partitions),
+            'segments': len(segments),
+            'records': sum(meta['count'] for meta in segments),
+            'labels': labels,
+            'bytes': _directory_size(self.root),
+            'first': datetime.fromtimestamp(min(meta['min_time'] for meta in segments)).isoformat()
+            if segments else None,
+            'last': datetime.fromtimestamp(max(meta['max_time'] for meta in segments)).isoformat()
+            if segments else None,
+        }
+
+
+def print_flow(record):
+    print(f"{record['Timestamp']:%Y-%m-%d %H:%M:%S} {record['Protocol']:<3} "
+          f"{record['Source IP']}:{record['Source Port']} -> "
+          f"{record['Destination IP']}:{record['Destination Port']} "
+          f"packets={record['Total Fwd Packets'] + record['Total Bwd Packets']} "
+          f"bytes={record['Total Length of Fwd Packets'] + record['Total Length of Bwd Packets']} "
+          f"label={record[LABEL]}")
+
+
+def _time(value):
+    return datetime.fromisoformat(value).timestamp()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query and maintain the flow archive.")
+    parser.add_argument('--root', default=ARCHIVE_DIR, help="archive directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query = commands.add_parser('query', help="print flows matching every filter given")
+    query.add_argument('--ip', help="source or destination address")
+    query.add_argument('--port', type=int, help="source or destination port")
+    query.add_argument('--label', type=int, choices=(UNSCORED, 0, 1),
+                       help="-1 unscored, 0 benign, 1 malicious")
+    query.add_argument('--protocol', choices=sorted(PROTOCOL_NUMBERS))
+    query.add_argument('--start', type=_time, help="local ISO time, e.g. 2026-10-18T02:00")
+    query.add_argument('--end', type=_time, help="local ISO time, exclusive")
+    query.add_argument('--limit', type=int)
+    query.add_argument('--csv', action='store_true', help="write CSV to stdout instead")
+
+    import_ = commands.add_parser('import', help="archive the flows of binary flow record files")
+    import_.add_argument('flow_files', nargs='+')
+
+    commands.add_parser('compact', help="merge every partition's segments into one")
+    commands.add_parser('stats', help="print what the archive holds")
+    prune = commands.add_parser('prune', help="delete partitions outside the retention policy")
+    import_.add_argument('--retention-days', type=float, default=None,
+                         help="apply this retention after importing (default: keep everything)")
+    prune.add_argument('--retention-days', type=float, default=30)
+    for command in (import_, prune):
+        command.add_argument('--max-mb', type=float, help="also delete the oldest hours above this size")
+    args = parser.parse_args()
+
+    if args.command in ('import', 'prune'):
+        archive = FlowArchive(args.root, retention_days=args.retention_days,
+                              max_bytes=args.max_mb * 1024 * 1024 if args.max_mb else None)
+    else:
+        archive = FlowArchive(args.root, retention_days=None)
+
+    if args.command == 'query':
+        records = archive.query(args.ip, args.port, args.label, args.protocol, args.start, args.end,
+                                args.limit)
+        if args.csv:
+            writer = csv.DictWriter(sys.stdout, fieldnames=COLUMNS + [LABEL])
+            writer.writeheader()
+            writer.writerows(records)
+        else:
+            for record in records:
+                print_flow(record)
+        print(f"{len(records)} flows; {archive.last_query}", file=sys.stderr)
+    elif args.command == 'import':
+        from flow_writer import read_records
+
+        for flow_file in args.flow_files:
+            with archive:
+                archive.extend(list(read_records(flow_file)))
+            print(f"Archived {flow_file}")
+        print(f"{archive.records_written} flow records archived, "
+              f"{archive.partitions_deleted} partitions deleted by retention")
+    elif args.command == 'compact':
+        for partition in archive.partitions():
+            merged = archive.compact(partition)
+            if merged:
+                print(f"{partition}: merged {merged} segments")
+    elif args.command == 'stats':
+        print(json.dumps(archive.stats(), indent=2))
+    elif args.command == 'prune':
+        deleted = archive.enforce_retention()
+        print(f"Deleted {len(deleted)} partitions{': ' + ', '.join(deleted) if deleted else ''}")
@@ -0,0 +1,395 @@
+"""Constant-time, constant-memory per-flow statistics."""
+
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+import metrics
+
+# TCP flag bits, as they appear in the TCP header flags byte
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+PSH = 0x08
+ACK = 0x10
+URG = 0x20
+
+# Feature columns produced for every flow, in output order
+COLUMNS = [
+    'Source IP', 'Source Port', 'Destination IP', 'Destination Port',
+    'Protocol', 'Timestamp', 'Flow Duration',
+    'Total Fwd Packets', 'Total Bwd Packets',
+    'Total Length of Fwd Packets', 'Total Length of Bwd Packets',
+    'Fwd Packet Length Mean', 'Bwd Packet Length Mean',
+    'Flow Packets/s', 'Fwd IAT Max', 'Bwd IAT Mean',
+    'Fwd Header Length', 'Bwd Header Length',
+    'Min Packet Length', 'Max Packet Length',
+    'FIN Flag Count', 'SYN Flag Count', 'RST Flag Count',
+    'PSH Flag Count', 'ACK Flag Count', 'URG Flag Count',
+]
+
+
+class FlowAccumulator:
+    """Running counters for one flow.
+
+    Every update touches a fixed number of fields, so per-packet cost and
+    memory stay the same no matter how long the flow lives.
+    """
+
+    __slots__ = (
+        'src_ip', 'src_port', 'dst_ip', 'dst_port', 'protocol',
+        'start_time', 'end_time',
+        'total_fwd_packets', 'total_bwd_packets',
+        'total_length_fwd_packets', 'total_length_bwd_packets',
+        'min_length', 'max_length',
+        'last_fwd_time', 'last_bwd_time', 'fwd_iat_max', 'bwd_iat_sum',
+        'fwd_header_length', 'bwd_header_length',
+        'psh_flags', 'syn_flags', 'rst_flags', 'ack_flags',
+        'fwd_urg_flags', 'bwd_urg_flags',
+        # Epoch seconds and FIN directions, maintained by FlowTable
+        'first_seen', 'last_seen', 'fin_state',
+        # Overload sampling: 1/rate the flow was admitted at (0 if not), packets dropped
+        'weight', 'packets_shed',
+    )
+
+    def __init__(self, src_ip, src_port, dst_ip, dst_port, protocol, timestamp):
+        self.src_ip = src_ip
+        self.src_port = src_port
+        self.dst_ip = dst_ip
+        self.dst_port = dst_port
+        self.protocol = protocol
+        self.start_time = timestamp
+        self.end_time = timestamp
+        self.total_fwd_packets = 0
+        self.total_bwd_packets = 0
+        self.total_length_fwd_packets = 0
+        self.total_length_bwd_packets = 0
+        self.min_length = None
+        self.max_length = None
+        self.last_fwd_time = None
+        self.last_bwd_time = None
+        self.fwd_iat_max = None
+        self.bwd_iat_sum = 0
+        self.fwd_header_length = 0
+        self.bwd_header_length = 0
+        self.psh_flags = 0
+        self.syn_flags = 0
+        self.rst_flags = 0
+        self.ack_flags = 0
+        self.fwd_urg_flags = 0
+        self.bwd_urg_flags = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.fin_state = 0
+        self.weight = 1.0
+        self.packets_shed = 0
+
+    def update(self, timestamp, length, is_forward, header_length=0, flags=0):
+        """Fold one packet into the flow counters."""
+        self.end_time = timestamp
+
+        if self.min_length is None or length < self.min_length:
+            self.min_length = length
+        if self.max_length is None or length > self.max_length:
+            self.max_length = length
+
+        if is_forward:
+            self.total_fwd_packets += 1
+            self.total_length_fwd_packets += length
+            self.fwd_header_length += header_length
+            if self.last_fwd_time is not None:
+                iat = (timestamp - self.last_fwd_time).total_seconds()
+                if self.fwd_iat_max is None or iat > self.fwd_iat_max:
+                    self.fwd_iat_max = iat
+            self.last_fwd_time = timestamp
+        else:
+            self.total_bwd_packets += 1
+            self.total_length_bwd_packets += length
+            self.bwd_header_length += header_length
+            if self.last_bwd_time is not None:
+                self.bwd_iat_sum += (timestamp - self.last_bwd_time).total_seconds()
+            self.last_bwd_time = timestamp
+
+        if flags:
+            if flags & SYN:
+                self.syn_flags += 1
+            if flags & PSH:
+                self.psh_flags += 1
+            if flags & RST:
+                self.rst_flags += 1
+            if flags & ACK:
+                self.ack_flags += 1
+            if flags & URG:
+                if is_forward:
+                    self.fwd_urg_flags += 1
+                else:
+                    self.bwd_urg_flags += 1
+
+    def to_record(self):
+        """Return the flow's feature row as a dict keyed by COLUMNS."""
+        duration = (self.end_time - self.start_time).total_seconds()
+        fwd_count = self.total_fwd_packets
+        bwd_count = self.total_bwd_packets
+        fwd_packet_len_mean = self.total_length_fwd_packets / fwd_count if fwd_count else 0
+        bwd_packet_len_mean = self.total_length_bwd_packets / bwd_count if bwd_count else 0
+        # Sum of backward gaps over the number of backward packets, not gaps
+        bwd_iat_mean = self.bwd_iat_sum / bwd_count if bwd_count > 1 else 0
+
+        return {
+            'Source IP': self.src_ip,
+            'Source Port': self.src_port,
+            'Destination IP': self.dst_ip,
+            'Destination Port': self.dst_port,
+            'Protocol': self.protocol,
+            'Timestamp': self.start_time,
+            'Flow Duration': duration,
+            'Total Fwd Packets': fwd_count,
+            'Total Bwd Packets': bwd_count,
+            'Total Length of Fwd Packets': self.total_length_fwd_packets,
+            'Total Length of Bwd Packets': self.total_length_bwd_packets,
+            'Fwd Packet Length Mean': fwd_packet_len_mean,
+            'Bwd Packet Length Mean': bwd_packet_len_mean,
+            'Flow Packets/s': (fwd_count + bwd_count) / duration if duration > 0 else 0,
+            'Fwd IAT Max': self.fwd_iat_max if self.fwd_iat_max is not None else 0,
+            'Bwd IAT Mean': bwd_iat_mean,
+            'Fwd Header Length': self.fwd_header_length,
+            'Bwd Header Length': self.bwd_header_length,
+            'Min Packet Length': self.min_length if self.min_length is not None else 0,
+            'Max Packet Length': self.max_length if self.max_length is not None else 0,
+            # The model was trained with RST counts in this column
+            'FIN Flag Count': self.rst_flags,
+            'SYN Flag Count': self.syn_flags,
+            'RST Flag Count': self.rst_flags,
+            'PSH Flag Count': self.psh_flags,
+            'ACK Flag Count': self.ack_flags,
+            'URG Flag Count': self.fwd_urg_flags + self.bwd_urg_flags,
+        }
+
+
+class FlowTable:
+    """Bounded table of active flows keyed by a direction-normalized 5-tuple.
+
+    The first packet seen for a pair of endpoints sets the forward
+    direction. A flow is finished, removed from the table and returned
+    exactly once when it has been idle for idle_timeout seconds, has
+    lasted active_timeout seconds, has been reset, has seen a FIN in
+    both directions, or is the least recently used flow when the table
+    holds max_flows. Packets whose protocol is not in protocols are
+    ignored. All times are packet timestamps, so replay behaves like
+    live capture. With a sampler (overload.OverloadController), new
+    flows are only admitted while it lets them through.
+    """
+
+    def __init__(self, idle_timeout=120.0, active_timeout=1800.0, max_flows=100000,
+                 protocols=('TCP',), closed_grace=2.0, sweep_interval=1.0, sampler=None):
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.max_flows = max_flows
+        self.protocols = frozenset(protocols)
+        self.closed_grace = closed_grace
+        self.sweep_interval = sweep_interval
+        self.sampler = sampler
+        # Least recently seen flow first
+        self.flows = OrderedDict()
+        self.evictions = {'idle': 0, 'active': 0, 'fin': 0, 'rst': 0, 'lru': 0, 'flush': 0}
+        self.late_packets = 0
+        # Keys of recently closed flows, so trailing ACKs after FIN/RST are not new flows
+        self._closed = OrderedDict()
+        self._last_sweep = None
+
+    def __len__(self):
+        return len(self.flows)
+
+    @staticmethod
+    def flow_key(src_ip, src_port, dst_ip, dst_port, protocol):
+        """Return the same key for both directions of a connection."""
+        if (src_ip, src_port) <= (dst_ip, dst_port):
+            return (src_ip, src_port, dst_ip, dst_port, protocol)
+        return (dst_ip, dst_port, src_ip, src_port, protocol)
+
+    def _evict(self, key, reason, finished):
+        flow = self.flows.pop(key)
+        self.evictions[reason] += 1
+        if self.sampler is None or self.sampler.finished(flow):
+            finished.append(flow)
+        if reason in ('fin', 'rst'):
+            self._closed[key] = flow.last_seen
+            if len(self._closed) > self.max_flows:
+                self._closed.popitem(last=False)
+
+    def add(self, packet):
+        """Fold a PacketInfo into its flow and return the list of flows finished by it."""
+        finished = []
+        if packet.protocol not in self.protocols:
+            return finished
+        now = packet.timestamp
+        if self._last_sweep is None or now - self._last_sweep >= self.sweep_interval:
+            self.expire(now, finished)
+            if self.sampler is not None:
+                self.sampler.update(now)
+
+        flows = self.flows
+        key = self.flow_key(packet.src_ip, packet.src_port, packet.dst_ip, packet.dst_port,
+                            packet.protocol)
+        flow = flows.get(key)
+        if flow is not None:
+            # Checked here too, so the outcome never depends on when the last sweep ran
+            if now - flow.last_seen >= self.idle_timeout:
+                self._evict(key, 'idle', finished)
+                flow = None
+            elif now - flow.first_seen >= self.active_timeout:
+                self._evict(key, 'active', finished)
+                flow = None
+
+        if flow is None:
+            closed_at = self._closed.get(key)
+            if closed_at is not None and now - closed_at < self.closed_grace \
+                    and not packet.flags & SYN:
+                self.late_packets += 1
+                return finished
+            weight = 1.0
+            if self.sampler is not None:
+                weight = self.sampler.admit(packet, key)
+                if not weight and not packet.flags & (SYN | RST):
+                    self.sampler.shed(key)
+                    return finished
+            if len(flows) >= self.max_flows:
+                self._evict(next(iter(flows)), 'lru', finished)
+            flow = flows[key] = FlowAccumulator(
+                packet.src_ip, packet.src_port, packet.dst_ip, packet.dst_port,
+                packet.protocol, datetime.fromtimestamp(now))
+            flow.first_seen = now
+            flow.weight = weight
+            if not weight:
+                flow.packets_shed = self.sampler.shed_before(key)
+        else:
+            if not flow.weight and not packet.flags & (SYN | RST):
+                # Not sampled in: only its SYN/RST packets are kept
+                flow.packets_shed += 1
+                self.sampler.shed()
+                return finished
+            flows.move_to_end(key)
+
+        is_forward = packet.src_port == flow.src_port and packet.src_ip == flow.src_ip
+        flow.last_seen = now
+        flow.update(datetime.fromtimestamp(now), packet.length, is_forward,
+                    packet.header_length, packet.flags)
+
+        if packet.flags & RST:
+            self._evict(key, 'rst', finished)
+        elif packet.flags & FIN:
+            flow.fin_state |= 1 if is_forward else 2
+            if flow.fin_state == 3:
+                self._evict(key, 'fin', finished)
+        return finished
+
+    def expire(self, now, finished=None):
+        """Finish flows idle since before now - idle_timeout and return them."""
+        if finished is None:
+            finished = []
+        self._last_sweep = now
+        flows = self.flows
+        while flows:
+            key, flow = next(iter(flows.items()))
+            if now - flow.last_seen < self.idle_timeout:
+                break
+            self._evict(key, 'idle', finished)
+        closed = self._closed
+        while closed and now - next(iter(closed.values())) >= self.closed_grace:
+            closed.popitem(last=False)
+        return finished
+
+    def flush(self):
+        """Finish and return every remaining flow, e.g. at shutdown."""
+        finished = []
+        while self.flows:
+            self._evict(next(iter(self.flows)), 'flush', finished)
+        return finished
+
+    def stats(self):
+        """Return the table size and eviction counters by reason."""
+        return {'active_flows': len(self.flows), 'late_packets': self.late_packets,
+                **{f'evicted_{reason}': count for reason, count in self.evictions.items()}}
+
+
+def _flow_counts(packets, table):
+    counts = Counter()
+    if hasattr(packets, 'packets_seen'):
+        counts['packets_seen'] = packets.packets_seen
+        counts['packets_skipped'] = packets.packets_skipped
+    if table is not None:
+        counts['late_packets'] = table.late_packets
+        for reason, count in table.evictions.items():
+            counts[reason] = count
+    return counts
+
+
+# Counts from earlier sources and tables, plus the ones being read now;
+# swapped in one assignment so a scrape never sees a half-updated total
+_metric_sources = (Counter(), None, None)
+
+
+def _metric_total(key):
+    base, packets, table = _metric_sources
+    return base[key] + _flow_counts(packets, table)[key]
+
+
+def _export_metrics(packets, table):
+    """Expose the counters the source and table already keep, read only when collected.
+
+    Each capture cycle brings a new source and table; what the previous
+    ones counted is carried over, so the *_total counters never go back.
+    """
+    global _metric_sources
+    base, old_packets, old_table = _metric_sources
+    _metric_sources = (base + _flow_counts(old_packets, old_table), packets, table)
+    metrics.counter('hids_packets_seen_total', "Packets read from the capture source").set_function(
+        lambda: _metric_total('packets_seen'))
+    metrics.counter('hids_packets_dropped_total', "Packets without a usable IP/TCP/UDP header").set_function(
+        lambda: _metric_total('packets_skipped'))
+    metrics.counter('hids_packets_parsed_total', "Packets decoded into PacketInfo").set_function(
+        lambda: _metric_total('packets_seen') - _metric_total('packets_skipped'))
+    metrics.gauge('hids_flow_table_flows', "Flows in the flow table").set_function(lambda: len(table.flows))
+    metrics.counter('hids_flow_table_late_packets_total',
+                    "Packets for flows already exported, within the closed-flow grace window").set_function(
+        lambda: _metric_total('late_packets'))
+    for reason in table.evictions:
+        metrics.counter('hids_flows_finished_total', "Flows finished, by reason", reason=reason).set_function(
+            lambda reason=reason: _metric_total(reason))
+
+
+def build_flows(packets, writer, table=None, scorer=None, detector=None):
+    """Feed packets from any packet source through a FlowTable into writer.
+
+    Only finished flows are written, and also handed to scorer (e.g. a
+    stream_inference.MicroBatchScorer) when one is given. Every packet
+    also goes to detector (e.g. a sketches.ScanFloodDetector), which sees
+    it before the table does, so nothing waits on a flow finishing.
+    Whatever is still in the table is flushed when the source ends or the
+    loop is interrupted. Returns the number of packets read from the source.
+    """
+    if table is None:
+        table = FlowTable()
+    _export_metrics(packets, table)
+    packet_count = 0
+    try:
+        for packet in packets:
+            packet_count += 1
+            if detector is not None:
+                detector.add(packet)
+            finished = table.add(packet)
+            if finished:
+                records = [flow.to_record() for flow in finished]
+                writer.extend(records)
+                if scorer is not None:
+                    scorer.extend(records)
+            else:
+                writer.poll()
+                if scorer is not None:
+                    scorer.poll()
+    finally:
+        records = [flow.to_record() for flow in table.flush()]
+        writer.extend(records)
+        if scorer is not None:
+            scorer.extend(records)
+            scorer.flush()
+    return packet_count
@@ -0,0 +1,160 @@
+"""Buffered, append-only storage for flow records."""
+
+import csv
+import os
+import socket
+import struct
+import time
+from datetime import datetime
+
+import metrics
+from flow_stats import COLUMNS
+
+_RECORDS_WRITTEN = metrics.counter('hids_flow_records_written_total', "Flow records written to disk")
+_FLUSH_SECONDS = metrics.histogram('hids_writer_flush_seconds', "Time to write one batch of flow records")
+_FLUSH_RECORDS = metrics.histogram('hids_writer_flush_records', "Flow records per write",
+                                   buckets=metrics.SIZE_BUCKETS)
+
+MAGIC = b'HIDSFLW1'
+
+# One fixed-size little-endian record per flow, fields in COLUMNS order
+RECORD = struct.Struct('<4sH4sHBdd' 'QQQQ' 'ddddd' 'QQ' 'II' 'IIIIII')
+
+PROTOCOL_NUMBERS = {'TCP': 6, 'UDP': 17}
+PROTOCOL_NAMES = {number: name for name, number in PROTOCOL_NUMBERS.items()}
+
+
+def pack_record(record):
+    """Pack a flow record dict into its binary form."""
+    return RECORD.pack(
+        socket.inet_aton(record['Source IP']), int(record['Source Port']),
+        socket.inet_aton(record['Destination IP']), int(record['Destination Port']),
+        PROTOCOL_NUMBERS.get(record['Protocol'], 0),
+        record['Timestamp'].timestamp(),
+        record['Flow Duration'],
+        record['Total Fwd Packets'], record['Total Bwd Packets'],
+        record['Total Length of Fwd Packets'], record['Total Length of Bwd Packets'],
+        record['Fwd Packet Length Mean'], record['Bwd Packet Length Mean'],
+        record['Flow Packets/s'], record['Fwd IAT Max'], record['Bwd IAT Mean'],
+        record['Fwd Header Length'], record['Bwd Header Length'],
+        record['Min Packet Length'], record['Max Packet Length'],
+        record['FIN Flag Count'], record['SYN Flag Count'], record['RST Flag Count'],
+        record['PSH Flag Count'], record['ACK Flag Count'], record['URG Flag Count'],
+    )
+
+
+def unpack_record(buffer, offset=0):
+    """Unpack one binary flow record back into a dict keyed by COLUMNS."""
+    values = list(RECORD.unpack_from(buffer, offset))
+    values[0] = socket.inet_ntoa(values[0])
+    values[2] = socket.inet_ntoa(values[2])
+    values[4] = PROTOCOL_NAMES.get(values[4], '')
+    values[5] = datetime.fromtimestamp(values[5])
+    return dict(zip(COLUMNS, values))
+
+
+def read_records(file_name):
+    """Yield every flow record stored in a binary flow file."""
+    with open(file_name, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{file_name} is not a flow record file")
+        data = f.read()
+    # Ignore a trailing partial record left by an interrupted write
+    usable = len(data) - len(data) % RECORD.size
+    for offset in range(0, usable, RECORD.size):
+        yield unpack_record(data, offset)
+
+
+def _write_csv_rows(file_name, records):
+    write_header = not os.path.isfile(file_name) or os.path.getsize(file_name) == 0
+    with open(file_name, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if write_header:
+            writer.writeheader()
+        writer.writerows(records)
+
+
+def export_csv(file_name, csv_file):
+    """Export a binary flow file to CSV, replacing csv_file."""
+    if os.path.isfile(csv_file):
+        os.remove(csv_file)
+    _write_csv_rows(csv_file, read_records(file_name))
+    print(f"Flow records exported to {csv_file}")
+
+
+class FlowRecordWriter:
+    """Collect flow records in memory and append them to disk in bulk.
+
+    Records are flushed once flush_records of them are buffered or
+    flush_interval seconds have passed since the last flush, whichever
+    comes first. Each record is written exactly once. If csv_file is
+    given, every flushed batch is also appended there as CSV, and with an
+    archive (flow_archive.FlowArchive) it is archived unscored.
+    """
+
+    def __init__(self, file_name='captured_traffic.bin', csv_file=None,
+                 flush_records=1000, flush_interval=5.0, archive=None):
+        self.file_name = file_name
+        self.csv_file = csv_file
+        self.archive = archive
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.records_written = 0
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._file = open(file_name, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def add(self, record):
+        """Buffer one flow record, flushing if a trigger has been reached."""
+        self._buffer.append(record)
+        if len(self._buffer) >= self.flush_records:
+            self.flush()
+        else:
+            self.poll()
+
+    def extend(self, records):
+        """Buffer several flow records at once."""
+        self._buffer.extend(records)
+        if len(self._buffer) >= self.flush_records:
+            self.flush()
+        else:
+            self.poll()
+
+    def poll(self):
+        """Flush if the buffer has been held for longer than flush_interval."""
+        if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered records to disk."""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        records, self._buffer = self._buffer, []
+        with _FLUSH_SECONDS.time():
+            self._file.write(b''.join(pack_record(record) for record in records))
+            self._file.flush()
+            if self.csv_file:
+                _write_csv_rows(self.csv_file, records)
+            if self.archive is not None:
+                self.archive.extend(records)
+        self.records_written += len(records)
+        _RECORDS_WRITTEN.inc(len(records))
+        _FLUSH_RECORDS.observe(len(records))
+
+    def close(self):
+        """Flush remaining records and close the file."""
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
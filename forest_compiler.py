@@ -0,0 +1,166 @@
+"""Flat-array export and vectorized scoring for the trained Random Forest.
+
+compile_forest() copies every tree of a fitted RandomForestClassifier
+into a handful of concatenated NumPy arrays. CompiledForest walks all
+trees for a whole batch at once with array indexing, applies the
+StandardScaler itself and reproduces sklearn's predictions exactly,
+without sklearn's per-call validation overhead.
+"""
+
+import argparse
+
+import numpy as np
+
+LEAF = -1
+
+
+class CompiledForest:
+    """A Random Forest flattened into node arrays, with the scaler folded in."""
+
+    def __init__(self, feature, threshold, left, right, value, roots, depth, classes,
+                 mean=None, scale=None, missing_left=None):
+        self.feature = feature
+        self.threshold = threshold
+        if missing_left is None:
+            missing_left = np.zeros(len(feature), dtype=bool)
+        self.missing_left = missing_left
+        self.left = left
+        self.right = right
+        # Interleaved [left, right] pairs, so one gather picks the next node
+        self.children = np.stack([left, right], axis=1).ravel()
+        self.value = value
+        self.roots = roots
+        self.depth = int(depth)
+        self.classes = classes
+        self.mean = mean
+        self.scale = scale
+        self.n_features = None if mean is None else len(mean)
+
+    def _prepare(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        # Same arithmetic as StandardScaler.transform, then sklearn's float32 tree input
+        if self.mean is not None:
+            X = X - self.mean
+        if self.scale is not None:
+            X = X / self.scale
+        return X.astype(np.float32)
+
+    def _leaves(self, X, chunk_size):
+        """Yield (start row, leaf node per row and tree) for each chunk of X."""
+        n_samples, n_features = X.shape
+        row_offsets = (np.arange(min(n_samples, chunk_size), dtype=np.int64) * n_features)[:, None]
+        for start in range(0, n_samples, chunk_size):
+            block = np.ascontiguousarray(X[start:start + chunk_size])
+            values = block.ravel()
+            offsets = row_offsets[:block.shape[0]]
+            has_missing = np.isnan(values).any()
+            nodes = np.broadcast_to(self.roots, (block.shape[0], len(self.roots))).copy()
+            for _ in range(self.depth):
+                node_values = values[offsets + self.feature[nodes]]
+                go_right = node_values > self.threshold[nodes]
+                if has_missing:
+                    # NaN follows the direction recorded at training time, as in sklearn
+                    missing = np.isnan(node_values)
+                    go_right[missing] = ~self.missing_left[nodes[missing]]
+                nodes = self.children[2 * nodes + go_right]
+            yield start, nodes
+
+    def predict_proba(self, X, chunk_size=8192):
+        """Average of the per-tree leaf class distributions, as in sklearn."""
+        X = self._prepare(X)
+        proba = np.empty((X.shape[0], self.value.shape[1]), dtype=np.float64)
+        for start, nodes in self._leaves(X, chunk_size):
+            # Summed tree by tree, in estimator order, like sklearn's accumulation
+            proba[start:start + nodes.shape[0]] = self.value[nodes].sum(axis=1)
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X, chunk_size=8192):
+        return self.classes.take(np.argmax(self.predict_proba(X, chunk_size), axis=1))
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in
+                  ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'classes',
+                   'missing_left')}
+        arrays['depth'] = np.array(self.depth)
+        if self.mean is not None:
+            arrays['mean'] = self.mean
+        if self.scale is not None:
+            arrays['scale'] = self.scale
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        arrays['depth'] = int(arrays['depth'])
+        return cls(**arrays)
+
+
+def compile_forest(clf, scaler=None):
+    """Flatten a fitted RandomForestClassifier (and optional StandardScaler)."""
+    features, thresholds, lefts, rights, values, roots, missing_lefts = [], [], [], [], [], [], []
+    offset = 0
+    depth = 0
+    for estimator in clf.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(offset, offset + n_nodes)
+        is_leaf = tree.children_left == LEAF
+        # Leaves point at themselves and always compare true, so extra steps are no-ops
+        left = np.where(is_leaf, node_ids, tree.children_left + offset)
+        right = np.where(is_leaf, node_ids, tree.children_right + offset)
+        feature = np.where(is_leaf, 0, tree.feature)
+        threshold = np.where(is_leaf, np.inf, tree.threshold)
+        missing = getattr(tree, 'missing_go_to_left', None)
+        missing_left = np.zeros(n_nodes, dtype=bool) if missing is None else missing.astype(bool)
+        value = tree.value[:, 0, :].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, None]
+        normalizer[normalizer == 0.0] = 1.0
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left)
+        rights.append(right)
+        missing_lefts.append(missing_left)
+        values.append(value / normalizer)
+        roots.append(offset)
+        depth = max(depth, tree.max_depth)
+        offset += n_nodes
+
+    index_type = np.int32 if offset < 2 ** 31 else np.int64
+    mean = scale = None
+    if scaler is not None:
+        if getattr(scaler, 'with_mean', True) and scaler.mean_ is not None:
+            mean = np.asarray(scaler.mean_, dtype=np.float64)
+        if getattr(scaler, 'with_std', True) and scaler.scale_ is not None:
+            scale = np.asarray(scaler.scale_, dtype=np.float64)
+    return CompiledForest(
+        feature=np.concatenate(features).astype(index_type),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(index_type),
+        right=np.concatenate(rights).astype(index_type),
+        value=np.concatenate(values),
+        roots=np.array(roots, dtype=index_type),
+        depth=depth,
+        classes=np.asarray(clf.classes_),
+        mean=mean,
+        scale=scale,
+        missing_left=np.concatenate(missing_lefts),
+    )
+
+
+if __name__ == "__main__":
+    from joblib import load
+
+    parser = argparse.ArgumentParser(description="Export the trained Random Forest to flat node arrays.")
+    parser.add_argument('--model-file', default='random_forest_model.joblib')
+    parser.add_argument('--scaler-file', default='scaler.joblib')
+    parser.add_argument('--output', default='random_forest_compiled.npz')
+    args = parser.parse_args()
+
+    compiled = compile_forest(load(args.model_file), load(args.scaler_file))
+    compiled.save(args.output)
+    print(f"Compiled {len(compiled.roots)} trees, {len(compiled.feature)} nodes, "
+          f"depth {compiled.depth}, saved to {args.output}")
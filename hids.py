@@ -0,0 +1,183 @@
+"""Single entry point for the HIDS tools.
+
+Each subcommand runs one module's own command line, so every flag that
+module takes works here too:
+
+    capture     network.py          live capture into flow records
+    replay      replay.py           a pcap file through the flow builder
+    preprocess  capture_preprocess  captured flows -> model input
+    train       RandomForest train  a new model version
+    detect      main.py             capture, score and alert continuously
+    monitor     host_metrics.py     headless CPU/memory/disk/network sampling
+    logs        log_sources.py      incremental syslog/journal/event log ingestion
+    archive     flow_archive.py     query, import into and prune the flow archive
+
+    python hids.py detect --stream --interface eth0 --metrics-port 9108
+    python hids.py --config hids.json replay capture.pcap --score
+    python hids.py --check-startup
+
+Defaults for any subcommand can be kept in a JSON config file (hids.json
+in the working directory is read when present), one object per
+subcommand with flag names as keys:
+
+    {"detect": {"interface": "eth0", "stream": true, "batch_size": 512},
+     "replay": {"idle_timeout": 60}}
+
+Flags given on the command line win over the config file. Nothing
+beyond the standard library is imported until a subcommand has been
+chosen, and --check-startup measures how long each subcommand takes to
+get going against STARTUP_BUDGET_MS.
+"""
+
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import json
+import os
+import runpy
+import subprocess
+import sys
+
+CONFIG_FILE = 'hids.json'
+
+# Milliseconds from starting Python to a subcommand's module being loaded
+STARTUP_BUDGET_MS = 500
+# Modules too slow to import (or unavailable headless) unless the subcommand needs them
+HEAVY_MODULES = ('pandas', 'sklearn', 'matplotlib', 'pyshark', 'win32evtlog')
+
+# Subcommand -> (module, arguments put before the user's, heavy modules it needs at import)
+COMMANDS = {
+    'capture': ('network', [], ()),
+    'replay': ('replay', [], ()),
+    'preprocess': ('capture_preprocess', [], ('pandas',)),
+    'train': ('RandomForest', ['train'], ('pandas', 'sklearn')),
+    'detect': ('main', [], ()),
+    'monitor': ('host_metrics', [], ()),
+    'logs': ('log_sources', [], ()),
+    'archive': ('flow_archive', [], ()),
+}
+
+
+def load_config(path):
+    """Return {subcommand: {flag: value}} from a JSON config file."""
+    with open(path) as f:
+        config = json.load(f)
+    unknown = set(config) - set(COMMANDS)
+    if unknown:
+        raise ValueError(f"{path}: unknown sections {', '.join(sorted(unknown))}")
+    return config
+
+
+def config_arguments(options):
+    """Turn {flag: value} into command line arguments.
+
+    True becomes a bare flag, False and None are left out and lists
+    become one flag followed by every item.
+    """
+    arguments = []
+    for name, value in options.items():
+        flag = '--' + name.replace('_', '-')
+        if value is None or value is False:
+            continue
+        if value is True:
+            arguments.append(flag)
+        elif isinstance(value, list):
+            arguments += [flag] + [str(item) for item in value]
+        else:
+            arguments += [flag, str(value)]
+    return arguments
+
+
+def run(command, arguments, config=None):
+    """Run command's module as a script with arguments (config values first)."""
+    module, prefix, _ = COMMANDS[command]
+    options = (config or {}).get(command, {})
+    sys.argv = [f'hids.py {command}'] + prefix + config_arguments(options) + list(arguments)
+    runpy.run_module(module, run_name='__main__')
+
+
+def _import_only(command):
+    """Import command's module, then print the time since start and the heavy modules loaded."""
+    module, _, _ = COMMANDS[command]
+    __import__(module)
+    print(json.dumps({'command': command,
+                      'import_ms': (time.perf_counter() - _STARTED) * 1000,
+                      'heavy': [name for name in HEAVY_MODULES if name in sys.modules]}))
+
+
+def check_startup(commands=None, repeat=3, budget_ms=STARTUP_BUDGET_MS):
+    """Measure each subcommand's startup in fresh interpreters.
+
+    Returns {command: {'startup_ms', 'heavy', 'unexpected', 'over_budget'}}
+    where startup_ms is the fastest of repeat runs, wall clock from
+    starting Python to the command's module being loaded. Commands that
+    need pandas or sklearn at import are reported but not held to the budget.
+    """
+    script = os.path.abspath(__file__)
+    results = {}
+    for command in commands or COMMANDS:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, script, '--import-only', command],
+                                    capture_output=True, text=True, check=True).stdout
+            times.append((time.perf_counter() - start) * 1000)
+        heavy = json.loads(output.strip().splitlines()[-1])['heavy']
+        expected = COMMANDS[command][2]
+        results[command] = {
+            'startup_ms': min(times),
+            'heavy': heavy,
+            'unexpected': [name for name in heavy if name not in expected],
+            'over_budget': not expected and min(times) > budget_ms,
+        }
+    return results
+
+
+def print_startup(results, budget_ms=STARTUP_BUDGET_MS):
+    print(f"{'command':<11} {'startup ms':>10}  heavy imports")
+    for command, result in results.items():
+        flags = []
+        if result['over_budget']:
+            flags.append(f"OVER BUDGET ({budget_ms} ms)")
+        if result['unexpected']:
+            flags.append("UNEXPECTED " + ', '.join(result['unexpected']))
+        print(f"{command:<11} {result['startup_ms']:>10.0f}  {', '.join(result['heavy']) or '-'}"
+              f"{'  ' + '; '.join(flags) if flags else ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='hids.py', description="Host intrusion detection tools.",
+        epilog="Run 'hids.py COMMAND --help' for a command's own flags.")
+    parser.add_argument('--config', help=f"JSON file of per-command defaults (default: {CONFIG_FILE} if present)")
+    parser.add_argument('--check-startup', action='store_true',
+                        help=f"time every command's startup against the {STARTUP_BUDGET_MS} ms budget")
+    parser.add_argument('--import-only', metavar='COMMAND', choices=COMMANDS, help=argparse.SUPPRESS)
+    parser.add_argument('command', nargs='?', choices=COMMANDS)
+    parser.add_argument('arguments', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    if args.import_only:
+        _import_only(args.import_only)
+        return 0
+    if args.check_startup:
+        results = check_startup([args.command] if args.command else None)
+        print_startup(results)
+        return 1 if any(r['over_budget'] or r['unexpected'] for r in results.values()) else 0
+    if args.command is None:
+        parser.print_help()
+        return 2
+
+    config_file = args.config or (CONFIG_FILE if os.path.isfile(CONFIG_FILE) else None)
+    try:
+        config = load_config(config_file) if config_file else None
+    except (OSError, ValueError) as e:
+        parser.error(f"cannot read config: {e}")
+    run(args.command, args.arguments, config)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""Headless host metrics sampling with rolling anomaly detection.
+
+HostSampler reads CPU, memory, disk and network counters with psutil at
+sub-second intervals into preallocated NumPy ring buffers. Rolling
+mean/standard deviation over a fixed window and an EWMA are updated
+incrementally on every sample, and threshold and z-score alerts are
+raised without any plotting. system_usage.monitor_system is an optional
+GUI on top of it.
+
+    python host_metrics.py [--interval 0.25] [--duration 60]
+"""
+
+import argparse
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import psutil
+
+# Percentages, then rates in MB/s computed from the cumulative counters
+METRICS = ('cpu', 'memory', 'disk', 'disk_read', 'disk_write', 'net_sent', 'net_recv')
+PERCENT_METRICS = ('cpu', 'memory', 'disk')
+DEFAULT_THRESHOLDS = {'cpu': 90.0, 'memory': 90.0, 'disk': 90.0}
+
+_MB = 1024 * 1024
+
+
+def print_alert(alert):
+    """Default alert sink: one line per alert on stdout."""
+    timestamp = datetime.fromtimestamp(alert['timestamp']).strftime('%H:%M:%S.%f')[:-3]
+    if alert['kind'] == 'threshold':
+        print(f"ALERT {timestamp} {alert['metric']} {alert['value']:.2f} >= {alert['limit']:.2f}")
+    else:
+        print(f"ALERT {timestamp} {alert['metric']} {alert['value']:.2f} is {alert['z']:+.1f} "
+              f"standard deviations from the rolling mean {alert['mean']:.2f}")
+
+
+class HostSampler:
+    """Sample host metrics into ring buffers and watch them for anomalies.
+
+    The last capacity samples are kept; rolling statistics cover the
+    last window samples. A threshold alert fires when a metric reaches
+    its limit in thresholds, a z-score alert when it is more than
+    z_threshold standard deviations from the rolling mean of the
+    previous samples, once min_samples have been seen. The standard
+    deviation used is at least min_std, in the metric's own unit. Each
+    alert fires once when the condition starts and re-arms when it clears.
+    """
+
+    def __init__(self, interval=0.25, capacity=3600, window=120, alpha=0.1,
+                 thresholds=None, z_threshold=4.0, min_samples=30, alert_sink=print_alert,
+                 disk_path='/', disk_every=1.0, min_std=0.5):
+        if window > capacity:
+            raise ValueError("window must not be larger than capacity")
+        self.interval = interval
+        self.capacity = capacity
+        self.window = window
+        self.alpha = alpha
+        self.thresholds = dict(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+        self.z_threshold = z_threshold
+        self.min_samples = max(2, min_samples)
+        self.min_std = min_std
+        self.alert_sink = alert_sink
+        self.disk_path = disk_path
+        # Disk usage is a filesystem call and changes slowly, so it is refreshed less often
+        self.disk_every = disk_every
+
+        n = len(METRICS)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros((capacity, n), dtype=np.float64)
+        self.count = 0
+        self.mean = np.zeros(n)
+        self._m2 = np.zeros(n)
+        self.ewma = np.zeros(n)
+        self._limits = np.array([self.thresholds.get(metric, np.inf) for metric in METRICS])
+        self._threshold_active = np.zeros(n, dtype=bool)
+        self._z_active = np.zeros(n, dtype=bool)
+        self.alerts_raised = 0
+
+        self._last_counters = None
+        self._disk_percent = 0.0
+        self._disk_checked = 0.0
+        self.sample_cpu_seconds = 0.0
+        self._started = None
+        self._thread = None
+        self._stop = threading.Event()
+        psutil.cpu_percent(interval=None)
+
+    @property
+    def n_window(self):
+        return min(self.count, self.window)
+
+    def _read(self, now):
+        """Read psutil counters and return one row of metric values."""
+        cpu = psutil.cpu_percent(interval=None)
+        memory = psutil.virtual_memory().percent
+        if now - self._disk_checked >= self.disk_every:
+            self._disk_percent = psutil.disk_usage(self.disk_path).percent
+            self._disk_checked = now
+        disk_io = psutil.disk_io_counters()
+        net_io = psutil.net_io_counters()
+        counters = np.array([
+            disk_io.read_bytes if disk_io else 0, disk_io.write_bytes if disk_io else 0,
+            net_io.bytes_sent, net_io.bytes_recv], dtype=np.float64)
+        if self._last_counters is None:
+            rates = np.zeros(4)
+        else:
+            last_time, last_counters = self._last_counters
+            elapsed = now - last_time
+            # Counters can go backwards when a NIC or disk disappears
+            rates = np.maximum(counters - last_counters, 0) / _MB / elapsed if elapsed > 0 else np.zeros(4)
+        self._last_counters = (now, counters)
+        return np.concatenate(([cpu, memory, self._disk_percent], rates))
+
+    def sample(self):
+        """Take one sample now, record it and return the metric values."""
+        cpu_start = time.thread_time()
+        now = time.time()
+        values = self._read(now)
+        self.record(now, values)
+        self.sample_cpu_seconds += time.thread_time() - cpu_start
+        return values
+
+    def record(self, timestamp, values):
+        """Add one row of metric values, update the statistics and check for alerts."""
+        values = np.asarray(values, dtype=np.float64)
+        n = self.n_window
+        slot = self.count % self.capacity
+        self._check(timestamp, values, n)
+
+        if n < self.window:
+            # Window still filling: plain Welford update
+            n += 1
+            delta = values - self.mean
+            self.mean += delta / n
+            self._m2 += delta * (values - self.mean)
+        else:
+            # Slide the window: replace the oldest sample in the running mean and M2
+            old = self.values[(self.count - self.window) % self.capacity]
+            old_mean = self.mean
+            self.mean = old_mean + (values - old) / n
+            self._m2 += (values - old) * (values - self.mean + old - old_mean)
+            np.maximum(self._m2, 0.0, out=self._m2)
+        self.ewma = values.copy() if self.count == 0 else self.alpha * values + (1 - self.alpha) * self.ewma
+
+        self.times[slot] = timestamp
+        self.values[slot] = values
+        self.count += 1
+
+    @property
+    def std(self):
+        n = self.n_window
+        return np.sqrt(self._m2 / (n - 1)) if n > 1 else np.zeros(len(METRICS))
+
+    def _check(self, timestamp, values, n):
+        over = values >= self._limits
+        for index in np.flatnonzero(over & ~self._threshold_active):
+            self._alert({'timestamp': timestamp, 'kind': 'threshold', 'metric': METRICS[index],
+                         'value': float(values[index]), 'limit': float(self._limits[index])})
+        self._threshold_active = over
+
+        if n < self.min_samples:
+            return
+        std = self.std
+        # The floor keeps near-constant metrics from alerting on tiny changes
+        z = (values - self.mean) / np.maximum(std, self.min_std)
+        anomalous = np.abs(z) > self.z_threshold
+        for index in np.flatnonzero(anomalous & ~self._z_active):
+            self._alert({'timestamp': timestamp, 'kind': 'zscore', 'metric': METRICS[index],
+                         'value': float(values[index]), 'mean': float(self.mean[index]),
+                         'std': float(std[index]), 'z': float(z[index])})
+        self._z_active = anomalous
+
+    def _alert(self, alert):
+        self.alerts_raised += 1
+        if self.alert_sink is not None:
+            self.alert_sink(alert)
+
+    def latest(self):
+        """Return the most recent sample as {metric: value}, or None before the first one."""
+        if not self.count:
+            return None
+        row = self.values[(self.count - 1) % self.capacity]
+        return dict(zip(METRICS, row.tolist()))
+
+    def series(self, metric=None, n=None):
+        """Return (times, values) of the last n samples, oldest first.
+
+        values holds one metric's column if metric is given, otherwise
+        every metric in METRICS order.
+        """
+        available = min(self.count, self.capacity)
+        n = available if n is None else min(n, available)
+        slots = np.arange(self.count - n, self.count) % self.capacity
+        values = self.values[slots]
+        if metric is not None:
+            values = values[:, METRICS.index(metric)]
+        return self.times[slots], values
+
+    def stats(self):
+        """Rolling mean, standard deviation and EWMA of every metric."""
+        std = self.std
+        return {metric: {'mean': float(self.mean[i]), 'std': float(std[i]), 'ewma': float(self.ewma[i])}
+                for i, metric in enumerate(METRICS)}
+
+    def overhead(self):
+        """CPU time the sampler itself has used, in total and as a share of one core."""
+        elapsed = time.time() - self._started if self._started else 0.0
+        return {
+            'samples': self.count,
+            'elapsed_s': elapsed,
+            'cpu_seconds': self.sample_cpu_seconds,
+            'cpu_percent': 100 * self.sample_cpu_seconds / elapsed if elapsed > 0 else 0.0,
+            'ms_per_sample': 1000 * self.sample_cpu_seconds / self.count if self.count else 0.0,
+        }
+
+    def run(self, duration=None):
+        """Sample every interval seconds until stop() is called or duration has passed."""
+        self._started = self._started or time.time()
+        deadline = None if duration is None else time.monotonic() + duration
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            self.sample()
+            next_tick += self.interval
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            if next_tick < now:
+                # Fell behind (e.g. the machine was suspended): skip missed ticks
+                next_tick = now
+            self._stop.wait(next_tick - now)
+
+    def start(self):
+        """Sample in a background daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='host-sampler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sample host metrics headlessly and alert on anomalies.")
+    parser.add_argument('--interval', type=float, default=0.25, help="seconds between samples")
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    parser.add_argument('--window', type=int, default=120, help="samples in the rolling window")
+    parser.add_argument('--threshold', type=float, default=90.0,
+                        help="alert level for CPU, memory and disk usage (%%)")
+    parser.add_argument('--z-threshold', type=float, default=4.0)
+    parser.add_argument('--report-every', type=float, default=10.0,
+                        help="seconds between summary lines")
+    args = parser.parse_args()
+
+    sampler = HostSampler(interval=args.interval, window=args.window,
+                          thresholds={metric: args.threshold for metric in PERCENT_METRICS},
+                          z_threshold=args.z_threshold, capacity=max(args.window, 3600))
+    sampler.start()
+    started = time.monotonic()
+    try:
+        while args.duration is None or time.monotonic() - started < args.duration:
+            time.sleep(min(args.report_every, args.duration or args.report_every))
+            stats = sampler.stats()
+            print("  ".join(f"{metric} {stats[metric]['mean']:.1f}±{stats[metric]['std']:.1f}"
+                            for metric in METRICS))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sampler.stop()
+        overhead = sampler.overhead()
+        print(f"{overhead['samples']} samples in {overhead['elapsed_s']:.1f}s, sampler CPU "
+              f"{overhead['cpu_seconds']:.3f}s ({overhead['cpu_percent']:.2f}% of one core, "
+              f"{overhead['ms_per_sample']:.3f} ms/sample), {sampler.alerts_raised} alerts")
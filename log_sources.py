@@ -0,0 +1,536 @@
+"""Incremental log sources with persisted checkpoints.
+
+Every source turns some log into structured records, dicts with the
+keys in RECORD_FIELDS, and hands them out in batches with read_batch().
+A source's position is a small JSON-serialisable state, saved in a
+CheckpointStore after each batch has been handled, so a restart only
+reads records that arrived since.
+
+    FileTailSource       syslog/auth.log style text files and journalctl -o json exports,
+                         following the file across rotation and truncation
+    EventLogExportSource Windows event logs exported to XML (wevtutil qe /f:xml)
+                         or JSON (Get-WinEvent | ConvertTo-Json), an offline
+                         stand-in for win32evtlog
+
+    python log_sources.py --syslog /var/log/syslog --auth /var/log/auth.log --follow
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+RECORD_FIELDS = ('timestamp', 'log', 'host', 'source', 'pid', 'event_id', 'level', 'record_id',
+                 'message', 'data')
+
+CHECKPOINT_FILE = 'log_checkpoints.json'
+
+_MONTHS = {name: number for number, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+_RFC3164 = re.compile(r'^([A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d) (\S+) ([^\s\[:]+)(?:\[(\d+)\])?: ?(.*)$')
+_ISO_SYSLOG = re.compile(r'^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?(?:Z|[+-]\d\d:?\d\d)?) (\S+) '
+                         r'([^\s\[:]+)(?:\[(\d+)\])?: ?(.*)$')
+_FRACTION = re.compile(r'(\.\d{6})\d+')
+_DOTNET_DATE = re.compile(r'/Date\((-?\d+)\)/')
+
+
+def make_record(log, message, timestamp=None, host=None, source=None, pid=None, event_id=None,
+                level=None, record_id=None, data=None):
+    """Build a record dict with every field in RECORD_FIELDS."""
+    return {'timestamp': timestamp, 'log': log, 'host': host, 'source': source, 'pid': pid,
+            'event_id': event_id, 'level': level, 'record_id': record_id, 'message': message,
+            'data': data}
+
+
+def parse_iso_time(value):
+    """ISO 8601 -> Unix seconds; naive times are local. None if it cannot be parsed."""
+    if not value:
+        return None
+    value = _FRACTION.sub(r'\1', value.strip())
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+class SyslogParser:
+    """Parse classic (RFC 3164) and high-precision (ISO 8601) syslog lines.
+
+    RFC 3164 timestamps have no year; the current year is assumed, or
+    the previous one for dates that would be more than a day ahead.
+    Consecutive lines usually share a timestamp, so the last conversion
+    is cached.
+    """
+
+    def __init__(self, log='syslog'):
+        self.log = log
+        self._last_stamp = None
+        self._last_time = None
+
+    def _rfc3164_time(self, stamp):
+        if stamp == self._last_stamp:
+            return self._last_time
+        now = datetime.now()
+        try:
+            moment = datetime(now.year, _MONTHS[stamp[:3]], int(stamp[4:6]), int(stamp[7:9]),
+                              int(stamp[10:12]), int(stamp[13:15]))
+        except (KeyError, ValueError):
+            return None
+        if (moment - now).days >= 1:
+            moment = moment.replace(year=now.year - 1)
+        self._last_stamp, self._last_time = stamp, moment.timestamp()
+        return self._last_time
+
+    def __call__(self, line):
+        match = _RFC3164.match(line)
+        if match:
+            timestamp = self._rfc3164_time(match.group(1))
+        else:
+            match = _ISO_SYSLOG.match(line)
+            if not match:
+                return make_record(self.log, line)
+            timestamp = parse_iso_time(match.group(1))
+        stamp, host, program, pid, message = match.groups()
+        return make_record(self.log, message, timestamp, host, program, int(pid) if pid else None)
+
+
+class JournalJsonParser:
+    """Parse lines of `journalctl -o json` output."""
+
+    def __init__(self, log='journal'):
+        self.log = log
+
+    def __call__(self, line):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return make_record(self.log, line)
+        message = entry.get('MESSAGE')
+        if isinstance(message, list):
+            # Non-UTF-8 messages are exported as byte arrays
+            message = bytes(message).decode('utf-8', 'replace')
+        timestamp = entry.get('__REALTIME_TIMESTAMP')
+        pid = entry.get('_PID')
+        priority = entry.get('PRIORITY')
+        return make_record(
+            self.log, message,
+            int(timestamp) / 1e6 if timestamp else None,
+            entry.get('_HOSTNAME'),
+            entry.get('SYSLOG_IDENTIFIER') or entry.get('_COMM'),
+            int(pid) if pid else None,
+            level=int(priority) if priority is not None else None,
+            record_id=entry.get('__CURSOR'),
+        )
+
+
+class FileTailSource:
+    """Read new lines from a growing text log, one batch at a time.
+
+    Only complete lines are returned; a partly written last line waits
+    for the next read. Rotation is detected by the file's inode
+    changing: the rest of the old file is read first (through the open
+    handle, or from path.1 after a restart), then the new file from the
+    start. A file that shrank was truncated and is re-read from the start.
+    """
+
+    def __init__(self, path, parser=None, name=None, read_size=1 << 20):
+        self.path = path
+        self.name = name or path
+        self.parser = parser or SyslogParser(os.path.basename(path))
+        self.read_size = read_size
+        self.inode = None
+        self.offset = 0
+        self._file = None
+        self._buffer = b''
+
+    def state(self):
+        return {'inode': self.inode, 'offset': self.offset}
+
+    def restore(self, state):
+        self.close()
+        self.inode = state.get('inode')
+        self.offset = state.get('offset', 0)
+
+    def _open(self, path, inode, offset):
+        self.close()
+        self._file = open(path, 'rb')
+        self._file.seek(offset)
+        self.inode, self.offset = inode, offset
+
+    def _current_inode(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return (stat.st_dev, stat.st_ino), stat.st_size
+
+    def _check_rotation(self):
+        """Make sure a file is open; returns False if there is nothing to read yet."""
+        current, size = self._current_inode()
+        if self._file is None:
+            if current is None:
+                return False
+            inode = tuple(self.inode) if self.inode else None
+            if inode is not None and inode != current:
+                rotated = self.path + '.1'
+                try:
+                    rotated_stat = os.stat(rotated)
+                except FileNotFoundError:
+                    rotated_stat = None
+                if rotated_stat is not None and (rotated_stat.st_dev, rotated_stat.st_ino) == inode:
+                    # Restarted after a rotation: finish the rotated file first
+                    self._open(rotated, inode, self.offset)
+                    return True
+            self._open(self.path, current, self.offset if inode == current else 0)
+        elif tuple(self.inode) == current and size < self.offset:
+            # Truncated in place (copytruncate)
+            self._open(self.path, current, 0)
+        return True
+
+    def _is_stale(self):
+        """True when the open file is no longer the one at path (it was rotated away)."""
+        current, _ = self._current_inode()
+        return current is not None and tuple(self.inode) != current
+
+    def read_batch(self, max_records=1000):
+        """Return up to max_records new records (possibly none)."""
+        records = []
+        while len(records) < max_records:
+            if not self._check_rotation():
+                break
+            wanted = max_records - len(records)
+            lines = []
+            data = self._buffer
+            while True:
+                end = data.rfind(b'\n') + 1
+                if end:
+                    lines.extend(data[:end - 1].split(b'\n'))
+                    data = data[end:]
+                if len(lines) >= wanted:
+                    break
+                chunk = self._file.read(self.read_size)
+                if not chunk:
+                    break
+                data += chunk
+            self._buffer = data
+            if not lines:
+                if self._is_stale():
+                    # Drained the rotated file; continue with the new one from its start
+                    self.close()
+                    self.inode, self.offset = None, 0
+                    continue
+                break
+            if len(lines) > wanted:
+                # Keep what does not fit in this batch for the next one
+                self._buffer = b'\n'.join(lines[wanted:]) + b'\n' + self._buffer
+                lines = lines[:wanted]
+            for line in lines:
+                self.offset += len(line) + 1
+                if line.strip():
+                    records.append(self.parser(line.decode('utf-8', 'replace').rstrip('\r')))
+        return records
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._buffer = b''
+
+
+_EVENT_NS = '{http://schemas.microsoft.com/win/2004/08/events/event}'
+_LEVELS = {'0': 'Information', '1': 'Critical', '2': 'Error', '3': 'Warning', '4': 'Information',
+           '5': 'Verbose'}
+
+
+def _event_from_xml(element, log):
+    system = element.find(_EVENT_NS + 'System')
+    if system is None:
+        return None
+
+    def text(tag):
+        node = system.find(_EVENT_NS + tag)
+        return node.text if node is not None else None
+
+    provider = system.find(_EVENT_NS + 'Provider')
+    created = system.find(_EVENT_NS + 'TimeCreated')
+    execution = system.find(_EVENT_NS + 'Execution')
+    data = {}
+    event_data = element.find(_EVENT_NS + 'EventData')
+    if event_data is None:
+        event_data = element.find(_EVENT_NS + 'UserData')
+    if event_data is not None:
+        for index, node in enumerate(event_data.iter()):
+            if node is event_data or node.text is None:
+                continue
+            key = node.get('Name') or node.tag.replace(_EVENT_NS, '') or str(index)
+            data[key] = node.text
+    rendered = element.find(f'{_EVENT_NS}RenderingInfo/{_EVENT_NS}Message')
+    message = rendered.text if rendered is not None and rendered.text else ' '.join(data.values())
+    event_id = text('EventID')
+    record_id = text('EventRecordID')
+    level = text('Level')
+    pid = execution.get('ProcessID') if execution is not None else None
+    return make_record(
+        text('Channel') or log, message,
+        parse_iso_time(created.get('SystemTime')) if created is not None else None,
+        text('Computer'),
+        provider.get('Name') if provider is not None else None,
+        int(pid) if pid else None,
+        int(event_id) if event_id else None,
+        _LEVELS.get(level, level),
+        int(record_id) if record_id else None,
+        data or None,
+    )
+
+
+def _event_from_json(entry, log):
+    created = entry.get('TimeCreated') or entry.get('TimeGenerated')
+    if isinstance(created, dict):
+        created = created.get('value') or created.get('DateTime')
+    timestamp = None
+    if isinstance(created, str):
+        match = _DOTNET_DATE.search(created)
+        timestamp = int(match.group(1)) / 1000 if match else parse_iso_time(created)
+    elif isinstance(created, (int, float)):
+        timestamp = float(created)
+    event_id = entry.get('Id', entry.get('EventID'))
+    record_id = entry.get('RecordId', entry.get('RecordNumber'))
+    properties = entry.get('Properties')
+    data = entry.get('EventData')
+    if data is None and isinstance(properties, list):
+        data = [item.get('Value') if isinstance(item, dict) else item for item in properties]
+    message = entry.get('Message')
+    if message is None and data:
+        message = ' '.join(str(value) for value in (data.values() if isinstance(data, dict) else data))
+    return make_record(
+        entry.get('LogName') or log, message or '', timestamp,
+        entry.get('MachineName') or entry.get('ComputerName'),
+        entry.get('ProviderName') or entry.get('SourceName'),
+        entry.get('ProcessId'),
+        int(event_id) & 0xFFFF if event_id is not None else None,
+        entry.get('LevelDisplayName') or _LEVELS.get(str(entry.get('Level')), entry.get('Level')),
+        int(record_id) if record_id is not None else None,
+        data,
+    )
+
+
+class EventLogExportSource:
+    """Read Windows event log exports (XML or JSON) without win32evtlog.
+
+    pattern may be a file or a glob matching several exports. Export
+    files are usually re-written as snapshots, so the checkpoint keeps
+    the highest record id seen per log: files are skipped while their
+    size and mtime are unchanged, and records at or below the checkpoint
+    taken when a file is opened are skipped. Exports may be in any order
+    (Get-WinEvent writes newest first), so the checkpoint only moves once
+    a whole file has been read.
+    """
+
+    def __init__(self, pattern, name=None, log='Application'):
+        self.pattern = pattern
+        self.name = name or pattern
+        self.log = log
+        self.last_record = {}
+        self.files = {}
+        self._pending = None
+        self._pending_file = None
+        self._pending_checkpoint = {}
+        self._pending_max = {}
+
+    def state(self):
+        return {'last_record': self.last_record, 'files': self.files}
+
+    def restore(self, state):
+        self.last_record = dict(state.get('last_record', {}))
+        self.files = dict(state.get('files', {}))
+        self._pending = None
+
+    def _events(self, path):
+        with open(path, 'rb') as f:
+            head = f.read(512).lstrip(b'\xef\xbb\xbf \t\r\n')
+        if head.startswith(b'<'):
+            # wevtutil writes bare <Event> elements with no root, so supply one
+            parser = ET.XMLPullParser(events=('end',))
+            parser.feed(b'<Events>')
+            with open(path, 'rb') as f:
+                first = True
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    if first:
+                        # An XML declaration is only legal at the very start
+                        chunk = re.sub(rb'^\s*(\xef\xbb\xbf)?\s*<\?xml[^>]*\?>', b'', chunk)
+                        first = False
+                    parser.feed(chunk)
+                    for _, element in parser.read_events():
+                        if element.tag == _EVENT_NS + 'Event':
+                            record = _event_from_xml(element, self.log)
+                            element.clear()
+                            if record is not None:
+                                yield record
+            parser.feed(b'</Events>')
+            for _, element in parser.read_events():
+                if element.tag == _EVENT_NS + 'Event':
+                    record = _event_from_xml(element, self.log)
+                    if record is not None:
+                        yield record
+        elif head.startswith(b'['):
+            with open(path, encoding='utf-8-sig') as f:
+                for entry in json.load(f):
+                    yield _event_from_json(entry, self.log)
+        else:
+            with open(path, encoding='utf-8-sig') as f:
+                for line in f:
+                    if line.strip():
+                        yield _event_from_json(json.loads(line), self.log)
+
+    def _next_file(self):
+        for path in sorted(glob.glob(self.pattern)):
+            stat = os.stat(path)
+            signature = [stat.st_size, stat.st_mtime_ns]
+            if self.files.get(path) != signature:
+                return path, signature
+        return None, None
+
+    def read_batch(self, max_records=1000):
+        records = []
+        while len(records) < max_records:
+            if self._pending is None:
+                path, signature = self._next_file()
+                if path is None:
+                    break
+                self._pending, self._pending_file = self._events(path), (path, signature)
+                self._pending_checkpoint, self._pending_max = dict(self.last_record), {}
+            checkpoint, seen = self._pending_checkpoint, self._pending_max
+            for record in self._pending:
+                log, record_id = record['log'], record['record_id']
+                if record_id is not None:
+                    last = checkpoint.get(log)
+                    if last is not None and record_id <= last:
+                        continue
+                    seen[log] = max(record_id, seen.get(log, record_id))
+                records.append(record)
+                if len(records) >= max_records:
+                    break
+            else:
+                path, signature = self._pending_file
+                self.files[path] = signature
+                for log, record_id in seen.items():
+                    self.last_record[log] = max(record_id, self.last_record.get(log, record_id))
+                self._pending = None
+        return records
+
+    def close(self):
+        self._pending = None
+
+
+class CheckpointStore:
+    """Source positions kept in one JSON file, replaced atomically on save."""
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self.states = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.states = json.load(f)
+
+    def restore(self, source):
+        if source.name in self.states:
+            source.restore(self.states[source.name])
+
+    def update(self, source):
+        self.states[source.name] = source.state()
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_file = tempfile.mkstemp(dir=directory, prefix='.checkpoint-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.states, f)
+        os.replace(tmp_file, self.path)
+
+
+class LogIngestor:
+    """Poll several sources and pass their batches to sink(source, records).
+
+    A source's checkpoint is saved only after sink has returned for its
+    batch, so records are handled at least once across restarts.
+    """
+
+    def __init__(self, sources, checkpoints=None, sink=None, batch_size=1000):
+        self.sources = list(sources)
+        self.checkpoints = checkpoints if checkpoints is not None else CheckpointStore()
+        self.sink = sink
+        self.batch_size = batch_size
+        self.records_read = 0
+        for source in self.sources:
+            self.checkpoints.restore(source)
+
+    def poll(self):
+        """Read one batch from every source; returns the number of records handled."""
+        handled = 0
+        for source in self.sources:
+            records = source.read_batch(self.batch_size)
+            if records and self.sink is not None:
+                self.sink(source, records)
+            handled += len(records)
+            self.checkpoints.update(source)
+        self.records_read += handled
+        self.checkpoints.save()
+        return handled
+
+    def run(self, follow=False, poll_interval=1.0):
+        """Read until every source is drained, or keep polling when follow is set."""
+        try:
+            while True:
+                if self.poll():
+                    continue
+                if not follow:
+                    break
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for source in self.sources:
+                source.close()
+
+
+def jsonl_sink(file_name):
+    """Return a sink that appends records to a JSON lines file."""
+    def sink(source, records):
+        with open(file_name, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+    return sink
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest new log records incrementally.")
+    parser.add_argument('--syslog', action='append', default=[], help="syslog-format file to tail")
+    parser.add_argument('--auth', action='append', default=[], help="auth.log-format file to tail")
+    parser.add_argument('--journal', action='append', default=[],
+                        help="file of `journalctl -o json` output to tail")
+    parser.add_argument('--event-export', action='append', default=[],
+                        help="Windows event log export (XML or JSON) file or glob")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE)
+    parser.add_argument('--output', default='log_records.jsonl')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--follow', action='store_true', help="keep polling for new records")
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    sources = [FileTailSource(path) for path in args.syslog]
+    sources += [FileTailSource(path, SyslogParser('auth')) for path in args.auth]
+    sources += [FileTailSource(path, JournalJsonParser()) for path in args.journal]
+    sources += [EventLogExportSource(pattern) for pattern in args.event_export]
+    if not sources:
+        parser.error("no log sources given")
+
+    ingestor = LogIngestor(sources, CheckpointStore(args.checkpoint), jsonl_sink(args.output),
+                           args.batch_size)
+    ingestor.run(args.follow, args.poll_interval)
+    print(f"{ingestor.records_read} new records written to {args.output}")
@@ -0,0 +1,232 @@
+"""Building blocks for the app.py login path.
+
+ConnectionPool hands out a bounded number of reused DB-API connections
+(MySQL in production, sqlite3 in tests), RecaptchaVerifier keeps one
+HTTP session open to the verification API, SlidingWindowLimiter rejects
+clients that try too often before any DB or captcha work is done, and
+FailedAttemptBatcher writes failed-login counts to the database in
+batches instead of once per bad password.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+RECAPTCHA_URL = 'https://www.google.com/recaptcha/api/siteverify'
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool's timeout."""
+
+
+class ConnectionPool:
+    """At most size connections made by connect(), reused across requests.
+
+    Use `with pool.connection() as conn:`; the connection goes back to
+    the pool afterwards, rolled back if the block raised, and is thrown
+    away if even the rollback fails. Queries are written with %s
+    placeholders and passed through sql(), which rewrites them for
+    drivers that use ? (sqlite3).
+    """
+
+    def __init__(self, connect, size=5, timeout=5.0, placeholder='%s'):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.placeholder = placeholder
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def sql(self, query):
+        return query if self.placeholder == '%s' else query.replace('%s', self.placeholder)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self.connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection free after {self.timeout}s") from None
+
+    def release(self, conn, broken=False):
+        if broken:
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def close(self):
+        """Close the idle connections (connections in use are closed when released)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.release(conn, broken=True)
+
+
+class RecaptchaVerifier:
+    """Callable that checks a reCAPTCHA response over one reused requests.Session."""
+
+    def __init__(self, secret, url=RECAPTCHA_URL, timeout=5.0, session=None):
+        import requests
+
+        self.secret = secret
+        self.url = url
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def __call__(self, recaptcha_response):
+        if not recaptcha_response:
+            return False
+        try:
+            response = self.session.post(self.url, timeout=self.timeout,
+                                         data={'secret': self.secret, 'response': recaptcha_response})
+            return bool(response.json().get('success', False))
+        except Exception:
+            # An unreachable verifier fails closed
+            return False
+
+
+class SlidingWindowLimiter:
+    """Allow at most limit hits per key in any window seconds.
+
+    Only allowed hits are counted, so a client that keeps retrying while
+    blocked is let through again once its earlier hits age out. At most
+    max_keys keys are tracked, the least recently seen are dropped first.
+    """
+
+    def __init__(self, limit, window, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key, now=None):
+        """Record a hit for key and return True, or return False if key is over its limit."""
+        now = time.monotonic() if now is None else now
+        cutoff = now - self.window
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                hits = self._hits[key] = deque()
+                if len(self._hits) > self.max_keys:
+                    self._hits.popitem(last=False)
+            else:
+                self._hits.move_to_end(key)
+            while hits and hits[0] <= cutoff:
+                hits.popleft()
+            if len(hits) >= self.limit:
+                return False
+            hits.append(now)
+            return True
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class FailedAttemptBatcher:
+    """Collect failed logins in memory and add them to users.failed_attempts in batches.
+
+    A batch is written once max_pending users have failures waiting or
+    flush_interval seconds have passed since the last write, whichever
+    comes first; call flush() on shutdown to write the rest.
+    """
+
+    def __init__(self, pool, flush_interval=2.0, max_pending=100):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, username):
+        """Count a failed attempt for username.
+
+        Returns how many of username's failures, this one included, had
+        not been written when it was recorded: add it to a
+        failed_attempts value read just before to get the current count.
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            count, _ = self._pending.get(username, (0, None))
+            self._pending[username] = (count + 1, now)
+            due = (len(self._pending) >= self.max_pending
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Writing failed login attempts failed; will retry")
+        return count + 1
+
+    def reset(self, username, cursor):
+        """Drop unwritten failures for username and zero its counter with cursor."""
+        with self._lock:
+            self._pending.pop(username, None)
+        cursor.execute(self.pool.sql('UPDATE users SET failed_attempts = 0 WHERE username = %s'),
+                       (username,))
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        rows = [(count, last, username) for username, (count, last) in pending.items()]
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(self.pool.sql(
+                    'UPDATE users SET failed_attempts = failed_attempts + %s, last_failed_attempt = %s '
+                    'WHERE username = %s'), rows)
+                conn.commit()
+                cursor.close()
+        except Exception:
+            # Keep the counts for the next flush rather than losing them
+            with self._lock:
+                for count, last, username in rows:
+                    waiting, newer = self._pending.get(username, (0, None))
+                    self._pending[username] = (waiting + count, newer or last)
+            raise
+        return len(rows)
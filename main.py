@@ -1,37 +1,236 @@
+import argparse
 import logging
-import RandomForest
+import os
+import time
 import network
-import capture_preprocess
-import system_usage
-import windows_logs
 import checknet
+import metrics
+from alert_correlator import AlertCorrelator, print_incident
+from alert_feed import ALERT_FILE, AlertFeed, flow_alert
+from flow_archive import ARCHIVE_DIR, FlowArchive
+from model_registry import ModelRegistry, ModelWatcher
+from sketches import ScanFloodDetector, print_detection
 
-# Set up logging configuration
-logging.basicConfig(level=logging.INFO, filename='process.log', filemode='w')
-def main():
-    while True:
-        try:
+# pandas and sklearn (RandomForest, capture_preprocess, stream_inference) are
+# imported where they are first needed, so starting up and --help stay fast
+
+MODEL_FILE = 'random_forest_model.joblib'
+SCALER_FILE = 'scaler.joblib'
+TRAIN_FILE = 'network_dataset.csv'
+CAPTURE_FILE = 'captured_traffic.bin'
+CAPTURE_CSV = 'captured_traffic.csv'
+DATASET_FILE = 'captured_dataset.csv'
+REGISTRY_DIR = 'models'
+
+_STAGE_HELP = "Time per pipeline stage of the capture loop"
+_CAPTURE_SECONDS = metrics.histogram('hids_stage_seconds', _STAGE_HELP, stage='capture')
+_PREPROCESS_SECONDS = metrics.histogram('hids_stage_seconds', _STAGE_HELP, stage='preprocess')
+_PREDICT_SECONDS = metrics.histogram('hids_stage_seconds', _STAGE_HELP, stage='predict')
+_CYCLES = metrics.counter('hids_cycles_total', "Capture, preprocess and predict cycles completed")
+_CYCLE_ERRORS = metrics.counter('hids_cycle_errors_total', "Cycles that failed with an error")
+
+
+def retrain():
+    """Train a new model version and make it the registry's current one."""
+    import RandomForest
+
+    logging.info("Training Random Forest model.")
+    clf, scaler, accuracy, version = RandomForest.train_model(
+        train_file=TRAIN_FILE,
+        output_model_file=MODEL_FILE,
+        output_scaler_file=SCALER_FILE,
+        registry=REGISTRY_DIR
+    )
+    logging.info(f"Model version {version} trained, accuracy {accuracy:.4f}.")
+
+
+def load_or_train(retrain_at_start=False):
+    """Load the registry's current model, training one first if asked to or if none exists.
+
+    Model files from before the registry existed are imported as its first version.
+    """
+    registry = ModelRegistry(REGISTRY_DIR)
+    if retrain_at_start:
+        retrain()
+    elif registry.current() is None:
+        if os.path.isfile(MODEL_FILE) and os.path.isfile(SCALER_FILE):
+            version = registry.import_files(MODEL_FILE, SCALER_FILE, train_file=TRAIN_FILE)
+            logging.info(f"Imported {MODEL_FILE} and {SCALER_FILE} as model version {version}.")
+        else:
+            retrain()
+    model = registry.load()
+    logging.info(f"Loaded model version {model.version} from {REGISTRY_DIR}.")
+    return registry, model
+
+
+def main(retrain_interval=None, retrain_at_start=False, interface=None, watchlist=(), archive=None):
+    """Capture, preprocess and score traffic in a loop with a model loaded once.
+
+    The model is only retrained at startup when asked to (or when no model
+    exists yet) and, if retrain_interval is set, every retrain_interval
+    seconds between cycles. Each cycle starts from empty capture files, so
+    it only scores (and correlates) the flows it captured itself; they
+    are kept in archive (a flow_archive.FlowArchive) when one is given,
+    which is flushed every cycle and closed when the loop ends.
+    """
+    import RandomForest
+    import capture_preprocess
+
+    interface = interface or network.choose_interface()
+    registry, model = load_or_train(retrain_at_start)
+    watcher = ModelWatcher(registry, model.version, poll_interval=0)
+    # Incidents for the dashboard (app.py follows ALERT_FILE); open ones carry over between cycles
+    feed = AlertFeed(mirror_file=ALERT_FILE)
+    correlator = AlertCorrelator(sink=feed.publish)
+    metrics.gauge('hids_open_incidents', "Incidents not yet emitted").set_function(
+        lambda: correlator.open_incidents)
+    # Scans and floods go to the feed as they happen, not at the end of a cycle
+    detector = ScanFloodDetector(sink=feed.publish)
+    last_trained = time.monotonic()
+
+    try:
+        while True:
+            try:
+                if retrain_interval and time.monotonic() - last_trained >= retrain_interval:
+                    retrain()
+                    last_trained = time.monotonic()
+                # Pick up a retrained or promoted version between cycles
+                new_model = watcher.poll()
+                if new_model is not None:
+                    model = new_model
+                    logging.info(f"Switched to model version {model.version}.")
+
+                # The writer appends, so without this every cycle would score (and
+                # report) all flows since startup again; the archive keeps the history
+                for file_name in (CAPTURE_FILE, CAPTURE_CSV):
+                    if os.path.exists(file_name):
+                        os.remove(file_name)
                 logging.info("Starting network packet capture.")
-                network.capture_packets()
-            
+                with _CAPTURE_SECONDS.time():
+                    network.capture_packets(CAPTURE_FILE, CAPTURE_CSV, interface=interface,
+                                            watchlist=watchlist, detector=detector, archive=archive)
+
                 logging.info("Processing traffic data.")
-                capture_preprocess.process_traffic_data('captured_traffic.csv', 'captured_dataset.csv')
-                logging.info("Training Random Forest model and predicting network traffic.")
-                RandomForest.train_and_predict_network_traffic(
-                    train_file='network_dataset.csv',
-                    new_data_file='captured_dataset.csv',
-                    output_model_file='random_forest_model.joblib',
-                    output_scaler_file='scaler.joblib',
-                    prediction_output_file='predicted_captured_dataset.csv'
-                )
-                logging.info("Model training and prediction completed.")
-        except Exception as e:
-            logging.error(f"An error occurred in the main: {e}")
+                with _PREPROCESS_SECONDS.time():
+                    capture_preprocess.process_traffic_data(CAPTURE_CSV, DATASET_FILE)
+                logging.info("Predicting network traffic.")
+                with _PREDICT_SECONDS.time():
+                    RandomForest.predict_network_traffic(
+                        model.clf, model.scaler,
+                        new_data_file=DATASET_FILE,
+                        prediction_output_file='predicted_captured_dataset.csv',
+                        train_file=TRAIN_FILE,
+                        correlator=correlator
+                    )
+                correlator.expire()
+                _CYCLES.inc()
+                logging.info(f"Prediction completed; {correlator.open_incidents} incidents open.")
+            except Exception as e:
+                _CYCLE_ERRORS.inc()
+                logging.error(f"An error occurred in the main: {e}")
+    finally:
+        if archive is not None:
+            archive.close()
+
+
+def main_stream(batch_size=256, max_wait_ms=50, latency_budget_ms=250, retrain_at_start=False,
+                interface=None, watchlist=(), archive=None):
+    """Score finished flows in-process while capturing, without the CSV round trip.
+
+    Scored flows are kept in archive, with their predictions, when one is given.
+    """
+    from stream_inference import MicroBatchScorer
+
+    interface = interface or network.choose_interface()
+    registry, model = load_or_train(retrain_at_start)
+    feed = AlertFeed(mirror_file=ALERT_FILE)
+
+    def incident_sink(incident):
+        print_incident(incident)
+        feed.publish(incident)
+
+    correlator = AlertCorrelator(sink=incident_sink)
+    metrics.gauge('hids_open_incidents', "Incidents not yet emitted").set_function(
+        lambda: correlator.open_incidents)
+
+    def alert_sink(record):
+        correlator.add(flow_alert(record))
+
+    def detection_sink(detection):
+        print_detection(detection)
+        feed.publish(detection)
+
+    scorer = MicroBatchScorer(
+        model.clf, model.scaler, model.columns,
+        max_batch_size=batch_size, max_wait_ms=max_wait_ms,
+        latency_budget_ms=latency_budget_ms,
+        transformer=model.transformer,
+        compiled=model.compiled,
+        watcher=ModelWatcher(registry, model.version),
+        alert_sink=alert_sink
+    )
+    logging.info("Starting streaming network capture and scoring.")
+    correlator.start()
+    try:
+        network.capture_packets(scorer=scorer, interface=interface, watchlist=watchlist,
+                                detector=ScanFloodDetector(sink=detection_sink), archive=archive)
+    finally:
+        correlator.stop()
+        feed.close()
+        if archive is not None:
+            archive.close()
+    logging.info(f"Streaming scoring finished: {scorer.report()}; "
+                 f"{correlator.detections} detections in {correlator.incidents} incidents")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the network intrusion detector.")
+    parser.add_argument('--retrain', action='store_true',
+                        help="train a new model version before starting")
+    parser.add_argument('--retrain-interval', type=float, default=None, metavar='HOURS',
+                        help="retrain on this schedule (default: never)")
+    parser.add_argument('--interface', help="interface to capture on (default: ask)")
+    parser.add_argument('--watch', action='append', default=[], metavar='HOST',
+                        help="never sample out this host's flows when overloaded")
+    parser.add_argument('--stream', action='store_true',
+                        help="score flows in-process as they finish instead of via CSV files")
+    parser.add_argument('--archive', default=ARCHIVE_DIR, metavar='DIR',
+                        help="flow archive directory; pass an empty string to disable")
+    parser.add_argument('--retention-days', type=float, default=30,
+                        help="delete archived flows older than this")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=50)
+    parser.add_argument('--latency-budget-ms', type=float, default=250)
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve /metrics and /debug/profile on this port")
+    parser.add_argument('--metrics-log-interval', type=float, default=None, metavar='SECONDS',
+                        help="log a one-line metrics summary on this schedule")
+    parser.add_argument('--profile-signal', action='store_true',
+                        help="toggle the sampling profiler with SIGUSR1")
+    args = parser.parse_args()
+    interval = args.retrain_interval * 3600 if args.retrain_interval else None
+
+    # Only a detector run starts a new log; importing this module leaves it alone
+    logging.basicConfig(level=logging.INFO, filename='process.log', filemode='w')
+
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+        logging.info(f"Serving metrics on port {args.metrics_port}.")
+    if args.metrics_log_interval:
+        metrics.start_log_summary(args.metrics_log_interval)
+    if args.profile_signal and not metrics.install_profile_signal():
+        logging.warning("SIGUSR1 is not available here; use /debug/profile instead.")
+
+    archive = FlowArchive(args.archive, retention_days=args.retention_days) if args.archive else None
     if checknet.net():
         try:
-           main()
+            if args.stream:
+                main_stream(args.batch_size, args.max_wait_ms, args.latency_budget_ms,
+                            retrain_at_start=args.retrain, interface=args.interface,
+                            watchlist=args.watch, archive=archive)
+            else:
+                main(retrain_interval=interval, retrain_at_start=args.retrain,
+                     interface=args.interface, watchlist=args.watch, archive=archive)
         except KeyboardInterrupt:
             logging.info("Program interrupted by the user.")
     else:
@@ -0,0 +1,363 @@
+"""Lightweight pipeline metrics: counters, gauges and latency histograms.
+
+Metrics live in a process-wide registry and are created once, usually
+at module level:
+
+    FLUSH_SECONDS = metrics.histogram('hids_writer_flush_seconds', "Flow record flush time")
+    ...
+    with FLUSH_SECONDS.time():
+        ...
+
+Updating one is a few attribute operations, and hot loops that already
+count things (packets seen, flow table size) are exposed through
+functions evaluated only when metrics are read. serve() publishes
+the registry in the Prometheus text format, start_log_summary() writes
+a periodic one-line summary to the log, and SamplingProfiler collects
+hot stacks on demand (nothing runs while it is off).
+
+    python metrics.py --port 9108     # serve an empty registry, for trying scrapers
+"""
+
+import argparse
+import bisect
+import logging
+import math
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as _StackCounter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Seconds; also fine for millisecond-scale stages
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class _Value:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+        self._function = None
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set_function(self, function):
+        """Read function() whenever the metric is collected, e.g. a counter a loop already keeps."""
+        self._function = function
+
+    def get(self):
+        if self._function is not None:
+            try:
+                return self._function()
+            except Exception:
+                return math.nan
+        return self.value
+
+    def samples(self):
+        yield self.name, self.labels, self.get()
+
+
+class Counter(_Value):
+    """A value that only goes up."""
+
+    kind = 'counter'
+
+
+class Gauge(_Value):
+    """A value that goes up and down."""
+
+    kind = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Histogram:
+    """Counts of observations in cumulative buckets, plus their sum."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Context manager observing the time spent inside it, in seconds."""
+        return _Timer(self)
+
+    def quantile(self, q):
+        """Estimate quantile q (0..1) by linear interpolation inside the bucket."""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket', self.labels + (('le', f'{bound:g}'),), cumulative
+        yield f'{self.name}_bucket', self.labels + (('le', '+Inf'),), self.count
+        yield f'{self.name}_sum', self.labels, self.sum
+        yield f'{self.name}_count', self.labels, self.count
+
+
+class Registry:
+    """All metrics of a process, keyed by name and labels."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        labels = tuple(sorted(labels.items()))
+        key = (name, labels)
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = cls(name, help, labels, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name, help='', **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help='', **labels):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help='', buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self):
+        """The registry in the Prometheus text exposition format."""
+        lines = []
+        described = set()
+        for metric in sorted(self.metrics(), key=lambda m: (m.name, m.labels)):
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_label_text(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """One line: counters and gauges by value, histograms as count/p50/p99."""
+        parts = []
+        for metric in sorted(self.metrics(), key=lambda m: (m.name, m.labels)):
+            name = metric.name + _label_text(metric.labels)
+            if isinstance(metric, Histogram):
+                if metric.count:
+                    parts.append(f"{name} n={metric.count} p50={metric.quantile(0.5):.4g} "
+                                 f"p99={metric.quantile(0.99):.4g}")
+            else:
+                value = metric.get()
+                parts.append(f"{name}={value:g}" if isinstance(value, (int, float)) else f"{name}={value}")
+        return ' '.join(parts)
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+class SamplingProfiler:
+    """Sample the stacks of all other threads every interval seconds.
+
+    Costs nothing until start() is called. hot_stacks() returns the most
+    frequently seen stacks, innermost frame last, in the "collapsed"
+    format flame graph tools read (frames joined by ';', then a count).
+    """
+
+    def __init__(self, interval=0.005, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = _StackCounter()
+        self.samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = [f"{f.f_code.co_name} ({f.f_code.co_filename.rsplit('/', 1)[-1]}:{lineno})"
+                         for f, lineno in traceback.walk_stack(frame)][:self.max_depth]
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def reset(self):
+        self.stacks.clear()
+        self.samples = 0
+
+    def hot_stacks(self, n=20):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common(n))
+
+    def profile(self, seconds, n=20):
+        """Sample for seconds (if not already running) and return the hot stacks."""
+        if self.running:
+            return self.hot_stacks(n)
+        self.reset()
+        self.start()
+        time.sleep(seconds)
+        self.stop()
+        return self.hot_stacks(n)
+
+
+PROFILER = SamplingProfiler()
+
+
+def install_profile_signal(signum=getattr(signal, 'SIGUSR1', None), n=30):
+    """Toggle PROFILER with a signal (kill -USR1 <pid>); stopping logs the hot stacks."""
+    if signum is None:
+        # No SIGUSR1 on Windows: use the /debug/profile endpoint instead
+        return False
+
+    def toggle(signum, frame):
+        if PROFILER.running:
+            PROFILER.stop()
+            logging.info(f"Profiler: {PROFILER.samples} samples, hot stacks:\n{PROFILER.hot_stacks(n)}")
+        else:
+            PROFILER.reset()
+            PROFILER.start()
+            logging.info("Profiler started")
+
+    signal.signal(signum, toggle)
+    return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/metrics':
+            body = self.registry.render().encode()
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif url.path == '/debug/profile':
+            query = parse_qs(url.query)
+            try:
+                seconds = float(query.get('seconds', ['5'])[0])
+                top = int(query.get('n', ['20'])[0])
+            except ValueError:
+                seconds = top = 0
+            if not math.isfinite(seconds) or seconds <= 0 or top <= 0:
+                self.send_error(400, "seconds and n must be positive numbers")
+                return
+            body = PROFILER.profile(min(seconds, 300.0), top).encode() + b'\n'
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=9108, host='', registry=REGISTRY):
+    """Serve /metrics (and /debug/profile?seconds=N) from a background thread."""
+    handler = type('Handler', (_Handler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+def start_log_summary(interval=60.0, registry=REGISTRY, logger=logging):
+    """Log registry.summary() every interval seconds from a background thread."""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            logger.info(f"Metrics: {registry.summary()}")
+
+    threading.Thread(target=loop, name='metrics-log', daemon=True).start()
+    return stop
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the metrics registry over HTTP.")
+    parser.add_argument('--port', type=int, default=9108)
+    args = parser.parse_args()
+    serve(args.port)
+    print(f"Serving metrics on :{args.port}/metrics; Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,241 @@
+"""Numbered model versions with an atomic "current" pointer.
+
+    models/
+        CURRENT             name of the version in use, e.g. "v0003"
+        v0001/
+            model.joblib            RandomForestClassifier
+            scaler.joblib           StandardScaler
+            preprocess_stats.joblib FlowTransformer imputation means
+            compiled.joblib         forest_compiler.CompiledForest
+            meta.json               feature columns, training time, accuracy, ...
+
+A version directory is fully written before it is renamed into place,
+and CURRENT is replaced with os.replace(), so readers never see a half
+written model. Models are loaded with joblib.load(mmap_mode='r'): the
+compiled forest's node arrays are memory-mapped straight from the file,
+so several inference processes share one copy in the page cache.
+ModelWatcher lets a running scorer pick up a newly promoted version.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import stat
+import tempfile
+import time
+from datetime import datetime
+
+from joblib import dump, load
+
+REGISTRY_DIR = 'models'
+CURRENT_FILE = 'CURRENT'
+_VERSION_PATTERN = re.compile(r'^v(\d{4,})$')
+
+
+class LoadedModel:
+    """Everything needed to score flows with one registry version."""
+
+    def __init__(self, version, clf, scaler, transformer, compiled, meta):
+        self.version = version
+        self.clf = clf
+        self.scaler = scaler
+        self.transformer = transformer
+        self.compiled = compiled
+        self.meta = meta
+
+    @property
+    def columns(self):
+        return self.meta['feature_columns']
+
+
+class ModelRegistry:
+    """A directory of numbered model versions, one of which is current."""
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def versions(self):
+        """Version names, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        names = [name for name in os.listdir(self.root) if _VERSION_PATTERN.match(name)]
+        return sorted(names, key=lambda name: int(name[1:]))
+
+    def current(self):
+        """Name of the current version, or None if nothing has been published."""
+        try:
+            with open(self._path(CURRENT_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _root_mode(self):
+        return stat.S_IMODE(os.stat(self.root).st_mode)
+
+    def set_current(self, version):
+        """Atomically point CURRENT at version (also used to roll back)."""
+        if not os.path.isfile(self._path(version, 'meta.json')):
+            raise ValueError(f"No model version {version} in {self.root}")
+        fd, tmp_file = tempfile.mkstemp(dir=self.root, prefix='.CURRENT-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(version + '\n')
+        # mkstemp creates the file 0600; readable by whoever can read the registry
+        os.chmod(tmp_file, self._root_mode() & 0o666)
+        os.replace(tmp_file, self._path(CURRENT_FILE))
+
+    def meta(self, version=None):
+        version = version or self.current()
+        with open(self._path(version, 'meta.json')) as f:
+            return json.load(f)
+
+    def publish(self, clf, scaler, transformer, feature_columns, accuracy=None, make_current=True,
+                **extra):
+        """Save a new version and, by default, make it current. Returns its name.
+
+        extra keyword arguments are stored in meta.json as they are.
+        """
+        from forest_compiler import compile_forest
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.root, prefix='.staging-')
+        try:
+            # mkdtemp creates the directory 0700; give the version the registry root's mode
+            os.chmod(staging, self._root_mode())
+            dump(clf, os.path.join(staging, 'model.joblib'))
+            dump(scaler, os.path.join(staging, 'scaler.joblib'))
+            transformer.save(os.path.join(staging, 'preprocess_stats.joblib'))
+            dump(compile_forest(clf, scaler), os.path.join(staging, 'compiled.joblib'))
+            meta = {
+                'feature_columns': list(feature_columns),
+                'trained_at': datetime.now().isoformat(timespec='seconds'),
+                'accuracy': accuracy,
+                'n_estimators': len(getattr(clf, 'estimators_', [])),
+                **extra,
+            }
+            while True:
+                versions = self.versions()
+                number = int(versions[-1][1:]) + 1 if versions else 1
+                version = f"v{number:04d}"
+                meta['version'] = version
+                with open(os.path.join(staging, 'meta.json'), 'w') as f:
+                    json.dump(meta, f, indent=2)
+                try:
+                    # Renaming a directory is atomic; another publisher may have taken the number
+                    os.rename(staging, self._path(version))
+                    break
+                except OSError:
+                    if not os.path.isdir(self._path(version)):
+                        raise
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        if make_current:
+            self.set_current(version)
+        return version
+
+    def load(self, version=None, mmap=True):
+        """Load version (default: current) as a LoadedModel, memory-mapping arrays."""
+        from capture_preprocess import FlowTransformer
+
+        version = version or self.current()
+        if version is None:
+            raise FileNotFoundError(f"No model has been published to {self.root}")
+        mmap_mode = 'r' if mmap else None
+        return LoadedModel(
+            version,
+            load(self._path(version, 'model.joblib'), mmap_mode=mmap_mode),
+            load(self._path(version, 'scaler.joblib'), mmap_mode=mmap_mode),
+            FlowTransformer.load(self._path(version, 'preprocess_stats.joblib')),
+            load(self._path(version, 'compiled.joblib'), mmap_mode=mmap_mode),
+            self.meta(version),
+        )
+
+    def import_files(self, model_file, scaler_file, stats_file=None, train_file='network_dataset.csv'):
+        """Publish a model saved as plain joblib files (e.g. the shipped model) as a new version."""
+        import RandomForest
+        from capture_preprocess import FlowTransformer
+
+        clf, scaler = RandomForest.load_model(model_file, scaler_file)
+        stats_file = stats_file or RandomForest.stats_file_for(scaler_file)
+        transformer = FlowTransformer.load(stats_file) if os.path.isfile(stats_file) else FlowTransformer()
+        return self.publish(clf, scaler, transformer, RandomForest.feature_columns(scaler, train_file),
+                            source=os.path.abspath(model_file))
+
+    def remove(self, version):
+        """Delete a version that is not current."""
+        if version == self.current():
+            raise ValueError(f"{version} is the current model version")
+        shutil.rmtree(self._path(version))
+
+
+class ModelWatcher:
+    """Notice when the registry's current version changes.
+
+    poll() is cheap enough to call before every batch: it looks at
+    CURRENT at most every poll_interval seconds and only loads a model
+    when the pointer has moved.
+    """
+
+    def __init__(self, registry, version=None, poll_interval=2.0, mmap=True):
+        self.registry = registry
+        self.version = version if version is not None else registry.current()
+        self.poll_interval = poll_interval
+        self.mmap = mmap
+        self._checked = time.monotonic()
+
+    def poll(self):
+        """Return the new current LoadedModel if it changed since the last call, else None."""
+        now = time.monotonic()
+        if now - self._checked < self.poll_interval:
+            return None
+        self._checked = now
+        version = self.registry.current()
+        if version is None or version == self.version:
+            return None
+        model = self.registry.load(version, self.mmap)
+        self.version = version
+        return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage versioned models.")
+    parser.add_argument('--registry', default=REGISTRY_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="list versions, marking the current one")
+    show_parser = subparsers.add_parser('show', help="print a version's metadata")
+    show_parser.add_argument('version', nargs='?')
+    promote_parser = subparsers.add_parser('promote', help="make a version current (or roll back)")
+    promote_parser.add_argument('version')
+    import_parser = subparsers.add_parser('import', help="publish plain joblib model files")
+    import_parser.add_argument('--model-file', default='random_forest_model.joblib')
+    import_parser.add_argument('--scaler-file', default='scaler.joblib')
+    import_parser.add_argument('--train-file', default='network_dataset.csv')
+    remove_parser = subparsers.add_parser('remove', help="delete a version that is not current")
+    remove_parser.add_argument('version')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    if args.command == 'list':
+        current = registry.current()
+        for version in registry.versions():
+            meta = registry.meta(version)
+            accuracy = meta.get('accuracy')
+            print(f"{'*' if version == current else ' '} {version}  {meta['trained_at']}  "
+                  f"trees={meta['n_estimators']}  "
+                  f"accuracy={'-' if accuracy is None else f'{accuracy:.4f}'}")
+    elif args.command == 'show':
+        print(json.dumps(registry.meta(args.version), indent=2))
+    elif args.command == 'promote':
+        registry.set_current(args.version)
+        print(f"{args.version} is now current")
+    elif args.command == 'import':
+        version = registry.import_files(args.model_file, args.scaler_file, train_file=args.train_file)
+        print(f"Imported {args.model_file} as {version}")
+    else:
+        registry.remove(args.version)
+        print(f"Removed {args.version}")
@@ -0,0 +1,148 @@
+"""Adaptive flow sampling for when flow building falls behind the capture.
+
+An OverloadController is attached to a FlowTable (table.sampler) and
+checked once per table sweep. It measures pressure as the largest of
+
+    lag / lag_target        how far packet timestamps trail the wall clock,
+                            i.e. how much tshark has buffered ahead of us
+    depth / limit           for every queue registered with watch_queue()
+
+and while pressure stays above 1 it halves the sampling rate (down to
+min_rate); once it falls below recover it raises the rate again, back
+to full capture.
+
+Sampling is per flow: a new flow is admitted when a hash of its
+direction-normalized key is below the current rate, and an admitted flow
+keeps all of its packets, so its features are exact. Each admitted flow
+carries a weight of 1/rate, and estimates() scales flow, packet and byte
+totals by it so they stay unbiased. Packets with SYN or RST set are
+never shed, nor are flows to or from a watch-listed host. A flow that
+was not admitted is only emitted if SYN/RST packets were all it had
+(a probe or refused connection, seen exactly); otherwise it is dropped
+as shed rather than reported with most of its packets missing.
+"""
+
+import logging
+import random
+import time
+from collections import OrderedDict
+
+import metrics
+
+_SAMPLING_RATE = metrics.gauge('hids_sampling_rate', "Fraction of new flows admitted to the flow table")
+_PACKETS_SHED = metrics.counter('hids_packets_shed_total', "Packets dropped by overload sampling")
+_FLOWS_SHED = metrics.counter('hids_flows_shed_total', "Flows dropped by overload sampling")
+_SAMPLING_RATE.set(1.0)
+
+
+class OverloadController:
+    """Lower the flow sampling rate under pressure and restore it when load drops.
+
+    Set lag_target to None for replayed captures, where packet
+    timestamps say nothing about how far behind the loop is.
+    """
+
+    def __init__(self, lag_target=2.0, min_rate=0.05, decrease=0.5, increase=1.5, recover=0.5,
+                 watchlist=(), clock=time.time, max_shed_keys=65536):
+        self.lag_target = lag_target
+        self.min_rate = min_rate
+        self.decrease = decrease
+        self.increase = increase
+        self.recover = recover
+        self.watchlist = frozenset(watchlist)
+        self.clock = clock
+        self.max_shed_keys = max_shed_keys
+        self.rate = 1.0
+        self.weight = 1.0
+        self.pressure = 0.0
+        self.lag = 0.0
+        self.queues = {}
+        self.packets_shed = 0
+        self.flows_shed = 0
+        self.flows_admitted = 0
+        self.flows_sampled = 0
+        self.rate_changes = 0
+        self.estimated = {'flows': 0.0, 'packets': 0.0, 'bytes': 0.0}
+        # Per-run salt, so which flows are kept cannot be predicted from outside
+        self._salt = random.getrandbits(32)
+        # Keys of flows shed before they had a table entry -> packets shed
+        self._shed_keys = OrderedDict()
+
+    def watch_queue(self, name, depth, limit):
+        """Count depth() above limit as pressure (e.g. a buffer length or table size)."""
+        self.queues[name] = (depth, limit)
+
+    def update(self, packet_time):
+        """Recompute pressure and adjust the rate; called by the FlowTable on each sweep."""
+        pressure = 0.0
+        if self.lag_target:
+            self.lag = max(0.0, self.clock() - packet_time)
+            pressure = self.lag / self.lag_target
+        for depth, limit in self.queues.values():
+            pressure = max(pressure, depth() / limit)
+        self.pressure = pressure
+
+        rate = self.rate
+        if pressure > 1.0:
+            rate = max(self.min_rate, rate * self.decrease)
+        elif pressure < self.recover and rate < 1.0:
+            rate = min(1.0, rate * self.increase)
+        if rate != self.rate:
+            self.rate_changes += 1
+            logging.warning(f"Flow sampling rate {self.rate:.0%} -> {rate:.0%} "
+                            f"(pressure {pressure:.2f}, lag {self.lag:.1f}s)")
+            self.rate = rate
+            self.weight = 1.0 / rate
+            _SAMPLING_RATE.set(rate)
+
+    def admit(self, packet, key):
+        """Weight for a new flow: 1/rate if it is sampled in, 0.0 if not."""
+        if self.rate >= 1.0 or packet.src_ip in self.watchlist or packet.dst_ip in self.watchlist:
+            self.flows_admitted += 1
+            return 1.0
+        if (hash((self._salt, key)) & 0xFFFFFFFF) < self.rate * 0x100000000:
+            self.flows_sampled += 1
+            return self.weight
+        return 0.0
+
+    def shed(self, key=None):
+        """Count a dropped packet; key is given when its flow has no table entry."""
+        self.packets_shed += 1
+        _PACKETS_SHED.inc()
+        if key is not None:
+            shed_keys = self._shed_keys
+            shed_keys[key] = shed_keys.get(key, 0) + 1
+            if len(shed_keys) > self.max_shed_keys:
+                shed_keys.popitem(last=False)
+
+    def shed_before(self, key):
+        """Packets of key's flow shed before a SYN/RST gave it a table entry."""
+        return self._shed_keys.pop(key, 0)
+
+    def finished(self, flow):
+        """Account a finished flow; returns False when it should be dropped."""
+        if flow.packets_shed:
+            self.flows_shed += 1
+            _FLOWS_SHED.inc()
+            return False
+        packets = flow.total_fwd_packets + flow.total_bwd_packets
+        weight = flow.weight
+        if flow.syn_flags + flow.rst_flags >= packets:
+            # SYN/RST-only flows are never shed, so every one of them is seen
+            weight = 1.0
+        estimated = self.estimated
+        estimated['flows'] += weight
+        estimated['packets'] += weight * packets
+        estimated['bytes'] += weight * (flow.total_length_fwd_packets + flow.total_length_bwd_packets)
+        return True
+
+    def estimates(self):
+        """Totals over finished flows, scaled by 1/rate for sampled ones."""
+        return dict(self.estimated)
+
+    def report(self):
+        return {'sampling_rate': self.rate, 'pressure': round(self.pressure, 2),
+                'lag_s': round(self.lag, 2), 'packets_shed': self.packets_shed,
+                'flows_shed': self.flows_shed, 'flows_sampled': self.flows_sampled,
+                'rate_changes': self.rate_changes,
+                **{f'estimated_{name}': round(value) for name, value in self.estimated.items()}}
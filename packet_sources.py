@@ -0,0 +1,301 @@
+"""Packet sources that feed the flow builder.
+
+Every source yields PacketInfo objects, so live capture and offline pcap
+replay go through exactly the same flow-building code.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+import metrics
+
+# pyshark parses fields lazily, so timing the field accesses times the decode
+_DECODE_SECONDS = metrics.histogram('hids_decode_seconds', "pyshark field decode time per packet",
+                                    buckets=(1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2))
+
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+# Link-layer types found in pcap/pcapng headers
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = (0x8100, 0x88a8, 0x9100)
+
+PCAP_MAGIC_USEC = 0xa1b2c3d4
+PCAP_MAGIC_NSEC = 0xa1b23c4d
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER = 0x1a2b3c4d
+
+
+class PacketInfo:
+    """The header fields of one IPv4 TCP/UDP packet that flows are built from."""
+
+    __slots__ = ('timestamp', 'length', 'src_ip', 'src_port', 'dst_ip', 'dst_port',
+                 'protocol', 'header_length', 'flags')
+
+    def __init__(self, timestamp, length, src_ip, src_port, dst_ip, dst_port,
+                 protocol, header_length=0, flags=0):
+        self.timestamp = timestamp          # seconds since the epoch
+        self.length = length                # original frame length on the wire
+        self.src_ip = src_ip
+        self.src_port = src_port
+        self.dst_ip = dst_ip
+        self.dst_port = dst_port
+        self.protocol = protocol            # 'TCP' or 'UDP'
+        self.header_length = header_length  # TCP segment length, as tshark's tcp.len
+        self.flags = flags                  # TCP header flags byte
+
+    def __repr__(self):
+        return (f"PacketInfo({self.protocol} {self.src_ip}:{self.src_port} -> "
+                f"{self.dst_ip}:{self.dst_port}, length={self.length})")
+
+
+class LiveCaptureSource:
+    """Packets sniffed from a network interface through pyshark/tshark."""
+
+    def __init__(self, interface, bpf_filter=None):
+        import pyshark
+        self.interface = interface
+        self.packets_seen = 0
+        self.packets_skipped = 0
+        self._capture = pyshark.LiveCapture(interface=interface, bpf_filter=bpf_filter)
+
+    @staticmethod
+    def _parse_flag(flag):
+        """Convert flag to int, default to 0 if non-numeric (e.g., 'True'/'False')."""
+        try:
+            return int(flag)
+        except (ValueError, TypeError):
+            return 0
+
+    def _tcp_flags(self, tcp):
+        """Pack the pyshark TCP flag fields into a header flags byte."""
+        flags = 0
+        for field, bit in (('flags_fin', 0x01), ('flags_syn', 0x02), ('flags_reset', 0x04),
+                           ('flags_push', 0x08), ('flags_ack', 0x10), ('flags_urg', 0x20)):
+            if self._parse_flag(getattr(tcp, field, 0)) == 1:
+                flags |= bit
+        return flags
+
+    def __iter__(self):
+        decode_seconds = _DECODE_SECONDS
+        for packet in self._capture.sniff_continuously():
+            start = time.perf_counter()
+            self.packets_seen += 1
+            if not hasattr(packet, 'ip'):
+                self.packets_skipped += 1
+                continue
+            timestamp = float(packet.sniff_timestamp)
+            length = int(packet.length)
+            if hasattr(packet, 'tcp'):
+                tcp = packet.tcp
+                info = PacketInfo(timestamp, length, packet.ip.src, int(tcp.srcport),
+                                  packet.ip.dst, int(tcp.dstport), 'TCP',
+                                  int(tcp.len), self._tcp_flags(tcp))
+            elif hasattr(packet, 'udp'):
+                udp = packet.udp
+                info = PacketInfo(timestamp, length, packet.ip.src, int(udp.srcport),
+                                  packet.ip.dst, int(udp.dstport), 'UDP')
+            else:
+                self.packets_skipped += 1
+                continue
+            decode_seconds.observe(time.perf_counter() - start)
+            yield info
+
+    def close(self):
+        self._capture.close()
+
+
+_IPV4_HEADER = struct.Struct('!BxHxxHxBxx4s4s')
+_PORTS = struct.Struct('!HH')
+
+
+class PcapFileSource:
+    """Packets replayed from a pcap or pcapng file.
+
+    Headers are decoded straight from a memory map of the file with
+    struct, skipping tshark entirely. Non-IPv4, fragmented and truncated
+    packets are counted in packets_skipped and not yielded. An empty file
+    (e.g. a capture that was just rotated) has no packets.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.packets_seen = 0
+        self.packets_skipped = 0
+        self._file = open(path, 'rb')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            # mmap cannot map a zero-length file
+            self._map = b''
+        else:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._ip_cache = {}
+
+    def _ip(self, raw):
+        ip = self._ip_cache.get(raw)
+        if ip is None:
+            if len(self._ip_cache) > 65536:
+                self._ip_cache.clear()
+            ip = self._ip_cache[raw] = '%d.%d.%d.%d' % tuple(raw)
+        return ip
+
+    def _ip_offset(self, data, linktype):
+        """Return the offset of the IPv4 header in a frame, or -1 if it has none."""
+        if linktype == LINKTYPE_ETHERNET:
+            if len(data) < 14:
+                return -1
+            offset = 12
+            ethertype = (data[offset] << 8) | data[offset + 1]
+            while ethertype in ETHERTYPE_VLAN and len(data) >= offset + 6:
+                offset += 4
+                ethertype = (data[offset] << 8) | data[offset + 1]
+            return offset + 2 if ethertype == ETHERTYPE_IPV4 else -1
+        if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+            return 0
+        if linktype == LINKTYPE_LINUX_SLL:
+            return 16 if len(data) >= 16 and ((data[14] << 8) | data[15]) == ETHERTYPE_IPV4 else -1
+        if linktype == LINKTYPE_LINUX_SLL2:
+            return 20 if len(data) >= 20 and ((data[0] << 8) | data[1]) == ETHERTYPE_IPV4 else -1
+        if linktype == LINKTYPE_NULL:
+            # Address family in host byte order; AF_INET is 2 everywhere
+            return 4 if len(data) >= 4 and (data[0] == 2 or data[3] == 2) else -1
+        return -1
+
+    def decode_fields(self, data, linktype):
+        """Decode a frame's IPv4 TCP/UDP header fields without building strings.
+
+        Returns (src ip bytes, dst ip bytes, src port, dst port, protocol
+        number, TCP segment length, TCP flags), or None.
+        """
+        offset = self._ip_offset(data, linktype)
+        if offset < 0 or len(data) < offset + 20:
+            return None
+        version_ihl, total_length, fragment, protocol, src, dst = \
+            _IPV4_HEADER.unpack_from(data, offset)
+        if version_ihl >> 4 != 4 or fragment & 0x1fff:
+            return None
+        ip_header_length = (version_ihl & 0x0f) * 4
+        l4 = offset + ip_header_length
+        if protocol == PROTO_TCP:
+            if len(data) < l4 + 14:
+                return None
+            src_port, dst_port = _PORTS.unpack_from(data, l4)
+            segment_length = total_length - ip_header_length - (data[l4 + 12] >> 4) * 4
+            return src, dst, src_port, dst_port, PROTO_TCP, max(segment_length, 0), data[l4 + 13]
+        if protocol == PROTO_UDP:
+            if len(data) < l4 + 4:
+                return None
+            src_port, dst_port = _PORTS.unpack_from(data, l4)
+            return src, dst, src_port, dst_port, PROTO_UDP, 0, 0
+        return None
+
+    def decode(self, data, linktype, timestamp, length):
+        """Decode one captured frame into a PacketInfo, or None if it is not IPv4 TCP/UDP."""
+        fields = self.decode_fields(data, linktype)
+        if fields is None:
+            return None
+        src, dst, src_port, dst_port, protocol, header_length, flags = fields
+        return PacketInfo(timestamp, length, self._ip(src), src_port, self._ip(dst), dst_port,
+                          'TCP' if protocol == PROTO_TCP else 'UDP', header_length, flags)
+
+    def frames(self):
+        """Yield (data, linktype, timestamp, original_length) for every frame in the file."""
+        if len(self._map) < 4:
+            return
+        magic_le = struct.unpack_from('<I', self._map, 0)[0]
+        if magic_le == PCAPNG_SHB:
+            yield from self._pcapng_frames()
+        else:
+            yield from self._pcap_frames()
+
+    def _pcap_frames(self):
+        buf = memoryview(self._map)
+        for endian in ('<', '>'):
+            magic = struct.unpack_from(endian + 'I', buf, 0)[0]
+            if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+                break
+        else:
+            raise ValueError(f"{self.path} is not a pcap or pcapng file")
+        divisor = 1e9 if magic == PCAP_MAGIC_NSEC else 1e6
+        linktype = struct.unpack_from(endian + 'I', buf, 20)[0] & 0x0fffffff
+        record = struct.Struct(endian + 'IIII')
+        offset, end = 24, len(buf)
+        while offset + 16 <= end:
+            ts_sec, ts_frac, incl_len, orig_len = record.unpack_from(buf, offset)
+            offset += 16
+            if offset + incl_len > end:
+                break
+            yield buf[offset:offset + incl_len], linktype, ts_sec + ts_frac / divisor, orig_len
+            offset += incl_len
+
+    def _pcapng_frames(self):
+        buf = memoryview(self._map)
+        offset, end = 0, len(buf)
+        endian = '<'
+        interfaces = []
+        while offset + 12 <= end:
+            block_type = struct.unpack_from(endian + 'I', buf, offset)[0]
+            if block_type == PCAPNG_SHB:
+                endian = '<' if struct.unpack_from('<I', buf, offset + 8)[0] == PCAPNG_BYTE_ORDER else '>'
+                interfaces = []
+            block_length = struct.unpack_from(endian + 'I', buf, offset + 4)[0]
+            if block_length < 12 or offset + block_length > end:
+                break
+            body = offset + 8
+            if block_type == 1:
+                # Interface Description Block: link type plus optional timestamp resolution
+                linktype = struct.unpack_from(endian + 'H', buf, body)[0]
+                interfaces.append((linktype, self._if_tsresol(buf, body + 8, offset + block_length - 4, endian)))
+            elif block_type == 6:
+                # Enhanced Packet Block
+                if_id, ts_high, ts_low, incl_len, orig_len = struct.unpack_from(endian + 'IIIII', buf, body)
+                if if_id < len(interfaces):
+                    linktype, resolution = interfaces[if_id]
+                    data = buf[body + 20:body + 20 + incl_len]
+                    yield data, linktype, ((ts_high << 32) | ts_low) / resolution, orig_len
+            elif block_type == 3 and interfaces:
+                # Simple Packet Block: no timestamp, snaplen-limited data
+                orig_len = struct.unpack_from(endian + 'I', buf, body)[0]
+                incl_len = min(orig_len, block_length - 16)
+                yield buf[body + 4:body + 4 + incl_len], interfaces[0][0], 0.0, orig_len
+            offset += block_length
+
+    @staticmethod
+    def _if_tsresol(buf, offset, end, endian):
+        """Return ticks per second from an IDB's if_tsresol option (default microseconds)."""
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(endian + 'HH', buf, offset)
+            if code == 0:
+                break
+            if code == 9 and length >= 1:
+                value = buf[offset + 4]
+                return 2 ** (value & 0x7f) if value & 0x80 else 10 ** value
+            offset += 4 + ((length + 3) & ~3)
+        return 10 ** 6
+
+    def __iter__(self):
+        decode = self.decode
+        for data, linktype, timestamp, length in self.frames():
+            self.packets_seen += 1
+            packet = decode(data, linktype, timestamp, length)
+            if packet is None:
+                self.packets_skipped += 1
+                continue
+            yield packet
+
+    def close(self):
+        try:
+            if isinstance(self._map, mmap.mmap):
+                self._map.close()
+        except BufferError:
+            # A half-consumed iterator still holds views into the map
+            pass
+        self._file.close()
@@ -0,0 +1,350 @@
+"""Multi-core flow building, sharded by a direction-independent flow hash.
+
+One decode process reads packets from the capture source and hands each
+one to a flow worker chosen by hashing its endpoints, so both directions
+of a connection always land on the same worker. Packets travel through
+one single-producer/single-consumer ring buffer in shared memory per
+worker instead of pickled queues. Each worker runs its own FlowTable
+and sends finished flows back to the parent process, which merges them
+into a single writer (and optional scorer).
+"""
+
+import argparse
+import multiprocessing as mp
+import queue
+import socket
+import struct
+import time
+from multiprocessing import shared_memory
+
+from flow_stats import FlowTable
+from packet_sources import PacketInfo
+
+# Ring header: head (next slot to write), tail (next slot to read), closed flag
+_HEADER = struct.Struct('<QQQ')
+HEADER_SIZE = 64
+_HEAD, _TAIL, _CLOSED = 0, 8, 16
+_COUNTER = struct.Struct('<Q')
+
+# timestamp, length, src ip, dst ip, src port, dst port, protocol, flags, TCP segment length
+SLOT = struct.Struct('<dI4s4sHHBBH')
+SLOT_SIZE = 32
+
+_PROTOCOL_NUMBERS = {'TCP': 6, 'UDP': 17}
+_PROTOCOL_NAMES = {6: 'TCP', 17: 'UDP'}
+
+
+class ShmRing:
+    """Fixed-size packet ring in shared memory for one producer and one consumer.
+
+    The producer only advances head and the consumer only advances tail,
+    each after the slots it owns have been written or read, so no lock is
+    needed between the two processes.
+    """
+
+    def __init__(self, capacity=65536, name=None):
+        self.capacity = capacity
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + capacity * SLOT_SIZE)
+            self.shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.buf = self.shm.buf
+        self._ip_cache = {}
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _get(self, offset):
+        return _COUNTER.unpack_from(self.buf, offset)[0]
+
+    def _set(self, offset, value):
+        _COUNTER.pack_into(self.buf, offset, value)
+
+    def __len__(self):
+        return self._get(_HEAD) - self._get(_TAIL)
+
+    @property
+    def closed(self):
+        return bool(self._get(_CLOSED))
+
+    def close_writer(self):
+        """Mark the ring as finished; the consumer drains it and stops."""
+        self._set(_CLOSED, 1)
+
+    def put_many(self, slots):
+        """Write as many slot tuples as fit and return how many were written."""
+        head = self._get(_HEAD)
+        free = self.capacity - (head - self._get(_TAIL))
+        count = min(free, len(slots))
+        buf, capacity, pack_into = self.buf, self.capacity, SLOT.pack_into
+        for i in range(count):
+            pack_into(buf, HEADER_SIZE + ((head + i) % capacity) * SLOT_SIZE, *slots[i])
+        if count:
+            self._set(_HEAD, head + count)
+        return count
+
+    def _ip(self, raw):
+        ip = self._ip_cache.get(raw)
+        if ip is None:
+            if len(self._ip_cache) > 65536:
+                self._ip_cache.clear()
+            ip = self._ip_cache[raw] = socket.inet_ntoa(raw)
+        return ip
+
+    def get_many(self, max_items=4096):
+        """Read up to max_items packets, oldest first."""
+        tail = self._get(_TAIL)
+        count = min(self._get(_HEAD) - tail, max_items)
+        buf, capacity, unpack_from = self.buf, self.capacity, SLOT.unpack_from
+        packets = []
+        for i in range(count):
+            timestamp, length, src, dst, src_port, dst_port, protocol, flags, header_length = \
+                unpack_from(buf, HEADER_SIZE + ((tail + i) % capacity) * SLOT_SIZE)
+            packets.append(PacketInfo(timestamp, length, self._ip(src), src_port, self._ip(dst),
+                                      dst_port, _PROTOCOL_NAMES.get(protocol, ''),
+                                      header_length, flags))
+        if count:
+            self._set(_TAIL, tail + count)
+        return packets
+
+    def release(self):
+        """Detach from the shared memory, removing it if this side created it."""
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def packet_slot(packet):
+    """Convert a PacketInfo into the tuple stored in a ring slot."""
+    return (packet.timestamp, packet.length,
+            socket.inet_aton(packet.src_ip), socket.inet_aton(packet.dst_ip),
+            packet.src_port, packet.dst_port, _PROTOCOL_NUMBERS.get(packet.protocol, 0),
+            packet.flags, min(packet.header_length, 0xffff))
+
+
+def flow_shard(slot, n_workers):
+    """Pick a worker for a slot tuple; both directions of a flow get the same one."""
+    a = (slot[2], slot[4])
+    b = (slot[3], slot[5])
+    return hash((a, b, slot[6]) if a <= b else (b, a, slot[6])) % n_workers
+
+
+def _source_slots(source):
+    """Yield ring slot tuples from a packet source.
+
+    Sources that can decode raw header fields (pcap replay) skip building
+    PacketInfo objects and IP strings, which the workers do instead.
+    """
+    if hasattr(source, 'frames') and hasattr(source, 'decode_fields'):
+        decode_fields = source.decode_fields
+        for data, linktype, timestamp, length in source.frames():
+            source.packets_seen += 1
+            fields = decode_fields(data, linktype)
+            if fields is None:
+                source.packets_skipped += 1
+                continue
+            src, dst, src_port, dst_port, protocol, header_length, flags = fields
+            yield (timestamp, length, src, dst, src_port, dst_port, protocol, flags,
+                   min(header_length, 0xffff))
+    else:
+        for packet in source:
+            yield packet_slot(packet)
+
+
+def open_source(spec):
+    """Build a packet source from a picklable ('pcap', path) or ('live', interface) spec."""
+    kind, target = spec
+    if kind == 'pcap':
+        from packet_sources import PcapFileSource
+        return PcapFileSource(target)
+    if kind == 'live':
+        from packet_sources import LiveCaptureSource
+        return LiveCaptureSource(target)
+    raise ValueError(f"Unknown packet source kind: {kind}")
+
+
+def _decode_process(source_spec, ring_names, capacity, results, drop_when_full, batch_size):
+    rings = [ShmRing(capacity, name) for name in ring_names]
+    n_workers = len(rings)
+    pending = [[] for _ in rings]
+    dropped = 0
+    source = None
+
+    def push(index, block):
+        nonlocal dropped
+        ring = rings[index]
+        while block:
+            written = ring.put_many(block)
+            block = block[written:]
+            if block:
+                if drop_when_full:
+                    dropped += len(block)
+                    return
+                time.sleep(0.0005)
+
+    try:
+        source = open_source(source_spec)
+        for slot in _source_slots(source):
+            index = flow_shard(slot, n_workers)
+            shard = pending[index]
+            shard.append(slot)
+            if len(shard) >= batch_size:
+                push(index, shard)
+                pending[index] = []
+        for index, shard in enumerate(pending):
+            push(index, shard)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Always signal end-of-stream, so the workers stop even if the source failed to open
+        for ring in rings:
+            ring.close_writer()
+            ring.release()
+        if source is not None:
+            source.close()
+        results.put(('decoder', {'packets_seen': getattr(source, 'packets_seen', 0),
+                                 'packets_skipped': getattr(source, 'packets_skipped', 0),
+                                 'packets_dropped': dropped}))
+
+
+def _flow_worker(index, ring_name, capacity, results, table_kwargs, batch_size):
+    ring = ShmRing(capacity, ring_name)
+    table = FlowTable(**table_kwargs)
+    out = []
+    packets = 0
+
+    def send(records):
+        if records:
+            results.put(('flows', records))
+
+    try:
+        while True:
+            closed = ring.closed
+            block = ring.get_many()
+            if not block:
+                if closed:
+                    break
+                time.sleep(0.0005)
+                continue
+            packets += len(block)
+            for packet in block:
+                finished = table.add(packet)
+                if finished:
+                    out.extend(flow.to_record() for flow in finished)
+            if len(out) >= batch_size:
+                send(out)
+                out = []
+    except KeyboardInterrupt:
+        pass
+    finally:
+        out.extend(flow.to_record() for flow in table.flush())
+        send(out)
+        ring.release()
+        results.put(('worker', {'worker': index, 'packets': packets, **table.stats()}))
+
+
+def run_parallel(source_spec, writer, n_workers=None, scorer=None, ring_capacity=65536,
+                 drop_when_full=False, batch_size=256, **table_kwargs):
+    """Build flows from source_spec on n_workers processes and merge them into writer.
+
+    table_kwargs are passed to each worker's FlowTable. With
+    drop_when_full, packets are dropped and counted instead of stalling
+    the decoder when a worker's ring is full (for live capture).
+    Returns a dict with decoder and per-worker statistics. Raises
+    RuntimeError if the decoder process fails (e.g. the capture file
+    cannot be opened), after stopping the workers.
+    """
+    if n_workers is None:
+        n_workers = max(1, mp.cpu_count() - 1)
+    rings = [ShmRing(ring_capacity) for _ in range(n_workers)]
+    results = mp.Queue()
+    workers = [mp.Process(target=_flow_worker,
+                          args=(i, ring.name, ring_capacity, results, table_kwargs, batch_size),
+                          daemon=True)
+               for i, ring in enumerate(rings)]
+    decoder = mp.Process(target=_decode_process,
+                         args=(source_spec, [ring.name for ring in rings], ring_capacity,
+                               results, drop_when_full, batch_size),
+                         daemon=True)
+    for process in workers + [decoder]:
+        process.start()
+
+    stats = {'workers': []}
+    pending = n_workers + 1
+    try:
+        while pending:
+            try:
+                kind, payload = results.get(timeout=0.05)
+            except queue.Empty:
+                writer.poll()
+                if scorer is not None:
+                    scorer.poll()
+                if decoder.exitcode not in (None, 0):
+                    break
+                if not any(process.is_alive() for process in workers + [decoder]) and results.empty():
+                    break
+                continue
+            if kind == 'flows':
+                writer.extend(payload)
+                if scorer is not None:
+                    scorer.extend(payload)
+            elif kind == 'decoder':
+                stats['decoder'] = payload
+                pending -= 1
+            else:
+                stats['workers'].append(payload)
+                pending -= 1
+    finally:
+        if scorer is not None:
+            scorer.flush()
+        decoder.join(timeout=5)
+        if decoder.exitcode not in (None, 0):
+            # The decoder may have died before closing the rings
+            for ring in rings:
+                ring.close_writer()
+        for process in workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for ring in rings:
+            ring.release()
+    if decoder.exitcode not in (None, 0):
+        raise RuntimeError(f"Packet decoder for {source_spec} exited with code {decoder.exitcode}")
+    return stats
+
+
+if __name__ == "__main__":
+    from flow_writer import FlowRecordWriter
+
+    parser = argparse.ArgumentParser(description="Build flows on several cores.")
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('--pcap', help="pcap/pcapng file to replay")
+    source_group.add_argument('--interface', help="network interface to capture from")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default='captured_traffic.bin')
+    parser.add_argument('--csv', default='captured_traffic.csv',
+                        help="CSV mirror of the flow records; pass an empty string to disable")
+    parser.add_argument('--idle-timeout', type=float, default=120.0)
+    parser.add_argument('--active-timeout', type=float, default=1800.0)
+    parser.add_argument('--max-flows', type=int, default=100000,
+                        help="flow table limit per worker")
+    args = parser.parse_args()
+
+    spec = ('pcap', args.pcap) if args.pcap else ('live', args.interface)
+    start = time.perf_counter()
+    with FlowRecordWriter(args.output, csv_file=args.csv or None, flush_records=10000) as writer:
+        stats = run_parallel(spec, writer, args.workers, drop_when_full=spec[0] == 'live',
+                             idle_timeout=args.idle_timeout, active_timeout=args.active_timeout,
+                             max_flows=args.max_flows)
+    elapsed = time.perf_counter() - start
+    seen = stats.get('decoder', {}).get('packets_seen', 0)
+    print(f"Processed {seen} packets on {len(stats['workers'])} workers in {elapsed:.2f}s "
+          f"({seen / elapsed if elapsed else 0:,.0f} packets/s), "
+          f"{writer.records_written} flow records saved to {args.output}")
+    print(f"Decoder: {stats.get('decoder')}")
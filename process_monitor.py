@@ -0,0 +1,323 @@
+"""Per-process activity monitoring for suspicious-process detection.
+
+Each sample makes one psutil.process_iter() pass that only reads the
+changing counters (CPU times, I/O). Static details (name, exe, command
+line, parent, user) are read once per process, identified by pid and
+create time, and cached. Consecutive snapshots are diffed into start and
+exit events, per-process CPU/IO rates and top consumers, and rules are
+run on new processes and on usage.
+
+    python process_monitor.py [--interval 1.0] [--duration 60] [--top 5]
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime
+
+import psutil
+
+DYNAMIC_ATTRS = ['pid', 'create_time', 'cpu_times', 'io_counters']
+STATIC_ATTRS = ['name', 'exe', 'cmdline', 'ppid', 'username']
+
+# Where packaged binaries live; anything else is "unknown" unless listed explicitly
+TRUSTED_DIRS = ('/usr/bin/', '/usr/sbin/', '/bin/', '/sbin/', '/usr/lib/', '/usr/libexec/',
+                '/usr/local/bin/', '/usr/local/sbin/', '/lib/', '/opt/', '/snap/',
+                'C:\\Windows\\', 'C:\\Program Files\\', 'C:\\Program Files (x86)\\')
+SUSPICIOUS_DIRS = ('/tmp/', '/var/tmp/', '/dev/shm/', '/run/user/')
+
+# Services and document viewers that should not normally start shells or network tools
+SUSPICIOUS_PARENTS = {'nginx', 'apache2', 'httpd', 'lighttpd', 'php-fpm', 'mysqld', 'postgres',
+                      'java', 'node', 'tomcat', 'w3wp.exe', 'sqlservr.exe', 'winword.exe',
+                      'excel.exe', 'powerpnt.exe', 'outlook.exe', 'acrord32.exe'}
+SUSPICIOUS_CHILDREN = {'sh', 'bash', 'dash', 'zsh', 'ksh', 'nc', 'ncat', 'netcat', 'socat',
+                       'telnet', 'python', 'python3', 'perl', 'curl', 'wget', 'cmd.exe',
+                       'powershell.exe', 'pwsh.exe', 'wscript.exe', 'cscript.exe',
+                       'mshta.exe', 'rundll32.exe', 'regsvr32.exe', 'certutil.exe'}
+
+
+class ProcessInfo:
+    """Static details of one process, read once when it is first seen."""
+
+    __slots__ = ('pid', 'create_time', 'name', 'exe', 'cmdline', 'ppid', 'username',
+                 'cpu_percent', 'read_rate', 'write_rate', 'rule_state')
+
+    def __init__(self, pid, create_time, name=None, exe=None, cmdline=None, ppid=None, username=None):
+        self.pid = pid
+        self.create_time = create_time
+        self.name = name or ''
+        self.exe = exe or ''
+        self.cmdline = cmdline or []
+        self.ppid = ppid
+        self.username = username
+        self.cpu_percent = 0.0
+        self.read_rate = 0.0
+        self.write_rate = 0.0
+        # Per-rule bookkeeping (e.g. consecutive high-CPU samples)
+        self.rule_state = {}
+
+    @property
+    def key(self):
+        return (self.pid, self.create_time)
+
+    def to_dict(self):
+        return {'pid': self.pid, 'name': self.name, 'exe': self.exe,
+                'cmdline': ' '.join(self.cmdline), 'ppid': self.ppid, 'username': self.username}
+
+
+class Rule:
+    """Base class for process rules; each hook returns an alert message or None."""
+
+    name = 'rule'
+
+    def check_start(self, info, monitor):
+        return None
+
+    def check_usage(self, info, monitor):
+        return None
+
+
+class CpuSpikeRule(Rule):
+    """A process using at least percent CPU for samples consecutive samples."""
+
+    name = 'cpu_spike'
+
+    def __init__(self, percent=80.0, samples=3):
+        self.percent = percent
+        self.samples = samples
+
+    def check_usage(self, info, monitor):
+        streak = info.rule_state.get(self.name, 0)
+        streak = streak + 1 if info.cpu_percent >= self.percent else 0
+        info.rule_state[self.name] = streak
+        # Alert once per episode, when the streak first reaches the limit
+        if streak == self.samples:
+            return f"{info.name} (pid {info.pid}) at {info.cpu_percent:.0f}% CPU for {streak} samples"
+        return None
+
+
+class UnknownBinaryRule(Rule):
+    """A process whose executable is outside the trusted directories and the known list."""
+
+    name = 'unknown_binary'
+
+    def __init__(self, known=(), trusted_dirs=TRUSTED_DIRS, suspicious_dirs=SUSPICIOUS_DIRS):
+        self.known = set(known)
+        self.trusted_dirs = tuple(trusted_dirs)
+        self.suspicious_dirs = tuple(suspicious_dirs)
+
+    def check_start(self, info, monitor):
+        exe = info.exe
+        if not exe or exe in self.known:
+            return None
+        if exe.startswith(self.suspicious_dirs):
+            return f"{info.name} (pid {info.pid}) runs from a temporary directory: {exe}"
+        if exe.endswith(' (deleted)'):
+            return f"{info.name} (pid {info.pid}) runs a deleted binary: {exe}"
+        if not exe.startswith(self.trusted_dirs):
+            return f"{info.name} (pid {info.pid}) runs an unknown binary: {exe}"
+        return None
+
+
+class ParentChildRule(Rule):
+    """A shell or network tool started (directly or a few levels down) by a service."""
+
+    name = 'parent_child'
+
+    def __init__(self, parents=SUSPICIOUS_PARENTS, children=SUSPICIOUS_CHILDREN, depth=3):
+        self.parents = {name.lower() for name in parents}
+        self.children = {name.lower() for name in children}
+        self.depth = depth
+
+    def check_start(self, info, monitor):
+        if info.name.lower() not in self.children:
+            return None
+        chain = [info.name]
+        for ancestor in monitor.ancestors(info, self.depth):
+            chain.append(ancestor.name)
+            if ancestor.name.lower() in self.parents:
+                return f"{' <- '.join(chain)} (pid {info.pid}): unexpected process chain"
+        return None
+
+
+DEFAULT_RULES = (CpuSpikeRule, UnknownBinaryRule, ParentChildRule)
+
+
+def print_event(event):
+    """Default event sink: one line per event on stdout."""
+    timestamp = datetime.fromtimestamp(event['timestamp']).strftime('%H:%M:%S')
+    process = event['process']
+    if event['kind'] == 'alert':
+        print(f"ALERT {timestamp} [{event['rule']}] {event['message']}")
+    else:
+        print(f"{timestamp} {event['kind']} pid {process['pid']} {process['name']} {process['cmdline']}")
+
+
+class ProcessMonitor:
+    """Diff process snapshots into events, usage rates and rule alerts.
+
+    Processes already running at the first sample are not reported as
+    starts, but start rules are still run on them when check_existing is
+    set. event_sink receives 'start', 'exit' and 'alert' event dicts.
+    """
+
+    def __init__(self, rules=None, event_sink=print_event, check_existing=True, report_starts=True):
+        self.rules = [rule() for rule in DEFAULT_RULES] if rules is None else list(rules)
+        self.event_sink = event_sink
+        self.check_existing = check_existing
+        self.report_starts = report_starts
+        self.processes = {}
+        self._by_pid = {}
+        self._counters = {}
+        self._last_time = None
+        self.samples = 0
+        self.sample_cpu_seconds = 0.0
+        self.processes_scanned = 0
+
+    def ancestors(self, info, depth):
+        """Yield the cached parent, grandparent, ... of info, up to depth levels."""
+        seen = {info.pid}
+        for _ in range(depth):
+            parent = self._by_pid.get(info.ppid)
+            if parent is None or parent.pid in seen:
+                return
+            seen.add(parent.pid)
+            yield parent
+            info = parent
+
+    def _emit(self, timestamp, kind, info, **fields):
+        if self.event_sink is not None:
+            self.event_sink({'timestamp': timestamp, 'kind': kind, 'process': info.to_dict(), **fields})
+
+    def _run_rules(self, timestamp, info, hook):
+        alerts = 0
+        for rule in self.rules:
+            message = getattr(rule, hook)(info, self)
+            if message:
+                alerts += 1
+                self._emit(timestamp, 'alert', info, rule=rule.name, message=message)
+        return alerts
+
+    def sample(self):
+        """Take one snapshot, diff it against the previous one and return a summary."""
+        cpu_start = time.process_time()
+        now = time.time()
+        elapsed = now - self._last_time if self._last_time is not None else None
+        first = self._last_time is None
+
+        counters = {}
+        new = []
+        for proc in psutil.process_iter(DYNAMIC_ATTRS, ad_value=None):
+            data = proc.info
+            key = (data['pid'], data['create_time'])
+            cpu = data['cpu_times']
+            io = data['io_counters']
+            counters[key] = (cpu.user + cpu.system if cpu else 0.0,
+                             io.read_bytes if io else 0, io.write_bytes if io else 0)
+            if key not in self.processes:
+                try:
+                    static = proc.as_dict(STATIC_ATTRS, ad_value=None)
+                except psutil.NoSuchProcess:
+                    del counters[key]
+                    continue
+                info = ProcessInfo(data['pid'], data['create_time'], **static)
+                self.processes[key] = info
+                new.append(info)
+
+        exited = [self.processes.pop(key) for key in self.processes.keys() - counters.keys()]
+        self._by_pid = {info.pid: info for info in self.processes.values()}
+
+        alerts = 0
+        for info in new:
+            if not first and self.report_starts:
+                self._emit(now, 'start', info)
+            if not first or self.check_existing:
+                alerts += self._run_rules(now, info, 'check_start')
+        for info in exited:
+            self._emit(now, 'exit', info)
+
+        if elapsed:
+            for key, (cpu, read_bytes, write_bytes) in counters.items():
+                info = self.processes[key]
+                previous = self._counters.get(key)
+                if previous is None:
+                    # Started since the last sample: everything it used happened in this interval
+                    previous = (0.0, 0, 0) if info.create_time >= self._last_time else (cpu, read_bytes, write_bytes)
+                info.cpu_percent = 100 * (cpu - previous[0]) / elapsed
+                info.read_rate = max(read_bytes - previous[1], 0) / elapsed
+                info.write_rate = max(write_bytes - previous[2], 0) / elapsed
+                alerts += self._run_rules(now, info, 'check_usage')
+
+        self._counters = counters
+        self._last_time = now
+        self.samples += 1
+        self.processes_scanned += len(counters)
+        self.sample_cpu_seconds += time.process_time() - cpu_start
+        return {'timestamp': now, 'processes': len(counters), 'started': len(new) if not first else 0,
+                'exited': len(exited), 'alerts': alerts}
+
+    def top(self, n=5, by='cpu'):
+        """The n processes using the most CPU (by='cpu') or disk I/O (by='io') in the last interval."""
+        if by == 'cpu':
+            key = lambda info: info.cpu_percent
+        else:
+            key = lambda info: info.read_rate + info.write_rate
+        return sorted(self.processes.values(), key=key, reverse=True)[:n]
+
+    def overhead(self):
+        """CPU time spent sampling, and how many processes were scanned per CPU second."""
+        return {
+            'samples': self.samples,
+            'processes_scanned': self.processes_scanned,
+            'cpu_seconds': self.sample_cpu_seconds,
+            'ms_per_sample': 1000 * self.sample_cpu_seconds / self.samples if self.samples else 0.0,
+            'processes_per_cpu_second': (self.processes_scanned / self.sample_cpu_seconds
+                                         if self.sample_cpu_seconds else 0.0),
+        }
+
+    def run(self, interval=1.0, duration=None, top_n=5):
+        """Sample every interval seconds, printing the top consumers, until duration or Ctrl+C."""
+        started = time.monotonic()
+        try:
+            while duration is None or time.monotonic() - started < duration:
+                tick = time.monotonic()
+                summary = self.sample()
+                if self.samples > 1 and top_n:
+                    cpu = ', '.join(f"{info.name}({info.pid}) {info.cpu_percent:.0f}%"
+                                    for info in self.top(top_n, 'cpu'))
+                    io = ', '.join(f"{info.name}({info.pid}) "
+                                   f"{(info.read_rate + info.write_rate) / 1024:.0f} KB/s"
+                                   for info in self.top(top_n, 'io'))
+                    print(f"{summary['processes']} processes | top CPU: {cpu} | top IO: {io}")
+                time.sleep(max(0.0, interval - (time.monotonic() - tick)))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monitor processes for suspicious activity.")
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    parser.add_argument('--top', type=int, default=5, help="top CPU/IO processes to print per sample")
+    parser.add_argument('--cpu-percent', type=float, default=80.0, help="CPU spike alert level")
+    parser.add_argument('--cpu-samples', type=int, default=3,
+                        help="consecutive samples above --cpu-percent before alerting")
+    parser.add_argument('--known-binaries', help="file with one trusted executable path per line")
+    parser.add_argument('--quiet-starts', action='store_true', help="do not print start/exit events")
+    args = parser.parse_args()
+
+    known = ()
+    if args.known_binaries and os.path.isfile(args.known_binaries):
+        with open(args.known_binaries) as f:
+            known = [line.strip() for line in f if line.strip()]
+    rules = [CpuSpikeRule(args.cpu_percent, args.cpu_samples), UnknownBinaryRule(known), ParentChildRule()]
+
+    def sink(event):
+        if event['kind'] == 'alert' or not args.quiet_starts:
+            print_event(event)
+
+    monitor = ProcessMonitor(rules, event_sink=sink)
+    monitor.run(args.interval, args.duration, args.top)
+    overhead = monitor.overhead()
+    print(f"{overhead['samples']} samples, {overhead['ms_per_sample']:.1f} ms CPU per sample, "
+          f"{overhead['processes_per_cpu_second']:,.0f} processes scanned per CPU second")
@@ -0,0 +1,112 @@
+import argparse
+import time
+
+from flow_stats import FlowTable, build_flows
+from flow_writer import FlowRecordWriter
+from packet_sources import PcapFileSource
+
+
+def replay_pcap(pcap_file, output_file='captured_traffic.bin', csv_file='captured_traffic.csv',
+                flush_records=10000, flush_interval=5.0, idle_timeout=120.0,
+                active_timeout=1800.0, max_flows=100000, scorer=None, detector=None, archive=None,
+                workers=1):
+    """Rebuild flow records from a pcap/pcapng file, the same way live capture does.
+
+    With workers > 1, flows are built on that many processes sharded by
+    flow hash (parallel_capture.run_parallel); a detector needs every
+    packet in this process, so it only works with one worker.
+    """
+    if workers > 1 and detector is not None:
+        raise ValueError("scan/flood detection needs workers=1")
+    if archive is not None and scorer is not None:
+        scorer.archive = archive
+    writer = FlowRecordWriter(output_file, csv_file=csv_file,
+                              flush_records=flush_records, flush_interval=flush_interval,
+                              archive=archive if scorer is None else None)
+    table_kwargs = {'idle_timeout': idle_timeout, 'active_timeout': active_timeout, 'max_flows': max_flows}
+    start = time.perf_counter()
+    if workers > 1:
+        from parallel_capture import run_parallel
+        try:
+            stats = run_parallel(('pcap', pcap_file), writer, workers, scorer, **table_kwargs)
+        finally:
+            writer.close()
+            if archive is not None:
+                archive.flush()
+        packets_seen = stats['decoder']['packets_seen']
+        packets_skipped = stats['decoder']['packets_skipped']
+        table_stats = stats['workers']
+    else:
+        source = PcapFileSource(pcap_file)
+        table = FlowTable(**table_kwargs)
+        try:
+            build_flows(source, writer, table, scorer, detector)
+        finally:
+            source.close()
+            writer.close()
+            if archive is not None:
+                archive.flush()
+        packets_seen, packets_skipped = source.packets_seen, source.packets_skipped
+        table_stats = table.stats()
+    elapsed = time.perf_counter() - start
+    rate = packets_seen / elapsed if elapsed > 0 else 0
+    print(f"Replayed {packets_seen} packets ({packets_skipped} skipped) "
+          f"in {elapsed:.2f}s, {rate:,.0f} packets/s; "
+          f"{writer.records_written} flow records saved to {output_file}")
+    print(f"Flow table: {table_stats}")
+    if scorer is not None:
+        print(f"Scoring: {scorer.report()}")
+    if detector is not None:
+        print(f"Scan/flood detection: {detector.report()}")
+    return writer.records_written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a pcap/pcapng file through the flow builder.")
+    parser.add_argument('pcap_file')
+    parser.add_argument('--output', default='captured_traffic.bin')
+    parser.add_argument('--csv', default='captured_traffic.csv',
+                        help="CSV mirror of the flow records; pass an empty string to disable")
+    parser.add_argument('--idle-timeout', type=float, default=120.0)
+    parser.add_argument('--active-timeout', type=float, default=1800.0)
+    parser.add_argument('--max-flows', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="build flows on this many processes (parallel_capture)")
+    parser.add_argument('--score', action='store_true',
+                        help="score finished flows with the saved model while replaying")
+    parser.add_argument('--model-file', default='random_forest_model.joblib')
+    parser.add_argument('--scaler-file', default='scaler.joblib')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=50)
+    parser.add_argument('--detect', action='store_true',
+                        help="print port scans, host sweeps and SYN floods found while replaying")
+    parser.add_argument('--archive', metavar='DIR', help="also keep the flows in a flow archive")
+    args = parser.parse_args()
+
+    scorer = None
+    if args.score:
+        import RandomForest
+        from forest_compiler import compile_forest
+        from stream_inference import MicroBatchScorer
+        clf, scaler = RandomForest.load_model(args.model_file, args.scaler_file)
+        scorer = MicroBatchScorer(clf, scaler, RandomForest.feature_columns(scaler),
+                                  max_batch_size=args.batch_size, max_wait_ms=args.max_wait_ms,
+                                  transformer=RandomForest.load_transformer(args.scaler_file),
+                                  compiled=compile_forest(clf, scaler))
+    detector = None
+    if args.detect:
+        from sketches import ScanFloodDetector
+        detector = ScanFloodDetector()
+    archive = None
+    if args.archive:
+        from flow_archive import FlowArchive
+        # Replayed captures are usually older than any retention period
+        archive = FlowArchive(args.archive, retention_days=None)
+    try:
+        replay_pcap(args.pcap_file, args.output, args.csv or None,
+                    idle_timeout=args.idle_timeout, active_timeout=args.active_timeout,
+                    max_flows=args.max_flows, scorer=scorer, detector=detector, archive=archive,
+                    workers=args.workers)
+    finally:
+        if archive is not None:
+            archive.close()
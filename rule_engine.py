@@ -0,0 +1,480 @@
+"""Compiled detection rules for log records from log_sources.
+
+A rule is a dict (usually loaded from JSON) whose conditions must all
+hold for a record to match:
+
+    {
+        "id": "ssh-brute-force",
+        "description": "Repeated SSH password failures from one address",
+        "severity": "high",
+        "logs": ["auth"],                       # record['log'] in this set
+        "sources": ["sshd"],                    # record['source'], case-insensitive
+        "event_ids": [4625],                    # record['event_id'] in this set
+        "fields": {"LogonType": ["3", "10"]},   # record['data'][name], case-insensitive
+        "contains": ["failed password"],        # any substring of the message, case-insensitive
+        "regex": "from (?P<ip>\\\\d+\\\\.\\\\d+\\\\.\\\\d+\\\\.\\\\d+)",    # searched in the message
+        "threshold": {"count": 5, "window": 60, "group_by": "ip"}
+    }
+
+RuleEngine compiles a rule set so that matching cost does not grow with
+the number of rules: rules are bucketed by their most selective scope
+(event ID, then source, then log) and by their first field condition
+with hash lookups, and all substring patterns, including literals
+extracted from regexes, are merged into one trie-shaped regular
+expression that finds every pattern present in a message in a single
+pass. Only rules whose patterns or field values were found are checked
+further. Threshold rules count matches per group in sliding time windows.
+
+    python rule_engine.py rules.json log_records.jsonl
+"""
+
+import argparse
+import json
+import re
+import time
+from collections import OrderedDict, deque
+
+SEVERITIES = ('low', 'medium', 'high', 'critical')
+
+# Below this many patterns, plain `in` checks beat the merged regex
+_MERGE_MIN_PATTERNS = 8
+
+_SPECIAL = set('\\.^$*+?{}[]()|')
+_MIN_LITERAL = 3
+
+
+def _group_end(pattern, i):
+    """Index just past the group opening at pattern[i]."""
+    depth = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '[':
+            i = _class_end(pattern, i)
+            continue
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def _class_end(pattern, i):
+    """Index just past the character class opening at pattern[i]."""
+    i += 1
+    if i < len(pattern) and pattern[i] == '^':
+        i += 1
+    if i < len(pattern) and pattern[i] == ']':
+        i += 1
+    while i < len(pattern) and pattern[i] != ']':
+        i += 2 if pattern[i] == '\\' else 1
+    return i + 1
+
+
+def _literal_alternatives(group):
+    """('a', 'b') for a group like (?:a|b) or (?P<x>a|b) of plain literals, else None."""
+    body = group[1:-1]
+    if body.startswith('?:'):
+        body = body[2:]
+    elif body.startswith('?P<'):
+        body = body[body.index('>') + 1:]
+    elif body.startswith('?'):
+        return None
+    alternatives = body.split('|')
+    if any(not alt or _SPECIAL & set(alt) for alt in alternatives):
+        return None
+    return tuple(alternatives)
+
+
+def _required_literals(pattern):
+    """Literals at least one of which every match of pattern contains, or None.
+
+    Conservative: only top-level literal runs and top-level groups of
+    plain literal alternatives are used; anything else (classes,
+    escapes like \\d, quantified items) just ends a run.
+    """
+    if re.compile(pattern).flags & re.VERBOSE:
+        return None
+    candidates, run = [], []
+    i, n = 0, len(pattern)
+    while i < n:
+        ch = pattern[i]
+        optional = False
+        if ch == '|':
+            # A top-level alternative: nothing is required
+            return None
+        if ch == '(':
+            end = _group_end(pattern, i)
+            optional = end < n and pattern[end] in '?*{'
+            alternatives = _literal_alternatives(pattern[i:end])
+            if alternatives and not optional:
+                candidates.append(alternatives)
+            candidates.append((''.join(run),))
+            run = []
+            i = end
+            continue
+        if ch == '[':
+            i = _class_end(pattern, i)
+            candidates.append((''.join(run),))
+            run = []
+            continue
+        if ch == '\\' and i + 1 < n:
+            escaped = pattern[i + 1]
+            if escaped.isalnum():
+                candidates.append((''.join(run),))
+                run = []
+            else:
+                run.append(escaped)
+            i += 2
+            continue
+        if ch in '?*{':
+            # The previous character is optional
+            if run:
+                run.pop()
+            candidates.append((''.join(run),))
+            run = []
+        elif ch in '+.^$':
+            candidates.append((''.join(run),))
+            run = []
+        else:
+            run.append(ch)
+        i += 1
+    candidates.append((''.join(run),))
+    candidates = [literals for literals in candidates
+                  if min(len(literal) for literal in literals) >= _MIN_LITERAL]
+    if not candidates:
+        return None
+    # Prefer the fewest, longest literals
+    best = max(candidates, key=lambda literals: (-len(literals), min(len(literal) for literal in literals)))
+    return tuple(literal.lower() for literal in best)
+
+
+class MultiPatternMatcher:
+    """Find which of many substrings occur in a text, in one pass.
+
+    The patterns are merged into a regex shaped like their prefix trie,
+    so at each position the regex engine only follows branches whose
+    next character matches. Each match reports the longest pattern
+    starting there, plus every shorter pattern that is a prefix of it;
+    searching resumes one character later, so overlapping patterns are
+    found too.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = sorted(set(patterns))
+        self._regex = None
+        self._prefixes = {}
+        if len(self.patterns) >= _MERGE_MIN_PATTERNS:
+            trie = {}
+            for pattern in self.patterns:
+                node = trie
+                for ch in pattern:
+                    node = node.setdefault(ch, {})
+                node[None] = pattern
+            self._regex = re.compile(self._build(trie))
+            for pattern in self.patterns:
+                self._prefixes[pattern] = list(self._trie_path(trie, pattern))
+
+    @classmethod
+    def _build(cls, node):
+        branches = [re.escape(ch) + cls._build(child)
+                    for ch, child in sorted((k, v) for k, v in node.items() if k is not None)]
+        if not branches:
+            return ''
+        if None in node:
+            return '(?:' + '|'.join(branches) + ')?'
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+    @staticmethod
+    def _trie_path(trie, pattern):
+        node = trie
+        for ch in pattern:
+            node = node[ch]
+            if None in node:
+                yield node[None]
+
+    def find(self, text):
+        """Return the set of patterns that occur in text."""
+        if self._regex is None:
+            return {pattern for pattern in self.patterns if pattern in text}
+        found = set()
+        search = self._regex.search
+        position = 0
+        while True:
+            match = search(text, position)
+            if match is None:
+                return found
+            found.update(self._prefixes[match.group()])
+            position = match.start() + 1
+
+
+class Rule:
+    """One compiled rule.
+
+    check() tests every condition except contains: the engine only
+    checks a rule once one of its anchors (its contains patterns, or a
+    literal its regex requires) was found in the message.
+    """
+
+    def __init__(self, spec):
+        if 'id' not in spec:
+            raise ValueError(f"Rule without an id: {spec}")
+        self.id = spec['id']
+        self.description = spec.get('description', '')
+        self.severity = spec.get('severity', 'medium')
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"Rule {self.id}: unknown severity {self.severity!r}")
+        self.logs = frozenset(spec.get('logs', ())) or None
+        self.sources = frozenset(source.lower() for source in spec.get('sources', ())) or None
+        self.event_ids = frozenset(int(event_id) for event_id in spec.get('event_ids', ())) or None
+        self.fields = None
+        if spec.get('fields'):
+            self.fields = {}
+            for name, values in spec['fields'].items():
+                values = values if isinstance(values, list) else [values]
+                self.fields[name] = frozenset(str(value).lower() for value in values)
+        self.contains = tuple(pattern.lower() for pattern in spec.get('contains', ()) if pattern) or None
+        self.regex = re.compile(spec['regex'], re.IGNORECASE) if spec.get('regex') else None
+        # Substrings whose presence makes the rule a candidate
+        if self.contains:
+            self.anchors = self.contains
+        elif self.regex is not None:
+            self.anchors = _required_literals(spec['regex'])
+        else:
+            self.anchors = None
+        threshold = spec.get('threshold')
+        self.count = int(threshold['count']) if threshold else 1
+        self.window = float(threshold.get('window', 60)) if threshold else 0.0
+        self.group_by = threshold.get('group_by') if threshold else None
+
+    def check(self, record):
+        """Return the regex match groups ({} without a regex) if record matches, else None."""
+        if self.logs is not None and record.get('log') not in self.logs:
+            return None
+        if self.sources is not None and (record.get('source') or '').lower() not in self.sources:
+            return None
+        if self.event_ids is not None and record.get('event_id') not in self.event_ids:
+            return None
+        if self.fields is not None:
+            data = record.get('data')
+            if not isinstance(data, dict):
+                return None
+            for name, values in self.fields.items():
+                if str(data.get(name, '')).lower() not in values:
+                    return None
+        if self.regex is not None:
+            match = self.regex.search(record.get('message') or '')
+            if match is None:
+                return None
+            return match.groupdict()
+        return {}
+
+
+class _Bucket:
+    """Rules sharing one scope key.
+
+    Rules with text anchors become candidates when the engine's merged
+    matcher finds one of their anchors, rules with field conditions are
+    looked up by the value of their first field; only the rest are
+    checked for every record in the bucket.
+    """
+
+    def __init__(self, rules):
+        self.always = []
+        self.by_pattern = {}
+        self.by_field = {}
+        for rule in rules:
+            if rule.anchors is not None:
+                for pattern in rule.anchors:
+                    self.by_pattern.setdefault(pattern, []).append(rule)
+            elif rule.fields is not None:
+                name, values = next(iter(rule.fields.items()))
+                index = self.by_field.setdefault(name, {})
+                for value in values:
+                    index.setdefault(value, []).append(rule)
+            else:
+                self.always.append(rule)
+
+    def candidates(self, record, found):
+        rules = self.always
+        if self.by_field:
+            data = record.get('data')
+            if isinstance(data, dict):
+                for name, index in self.by_field.items():
+                    value = data.get(name)
+                    matched = index.get(str(value).lower()) if value is not None else None
+                    if matched:
+                        rules = rules + matched
+        if found and self.by_pattern:
+            seen = set()
+            for pattern in found:
+                for rule in self.by_pattern.get(pattern, ()):
+                    if rule.id not in seen:
+                        if not seen:
+                            rules = list(rules)
+                        seen.add(rule.id)
+                        rules.append(rule)
+        return rules
+
+
+class RuleEngine:
+    """Match records against a compiled rule set.
+
+    match() returns alert dicts for the rules a record triggers. For a
+    threshold rule that is once count matches have been seen for the
+    same group within window seconds (record timestamps are used when
+    present); the group's counter then starts over. At most max_groups
+    threshold groups are tracked, least recently updated ones are dropped.
+    """
+
+    def __init__(self, rules, max_groups=100000):
+        self.rules = [rule if isinstance(rule, Rule) else Rule(rule) for rule in rules]
+        ids = [rule.id for rule in self.rules]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Rule ids must be unique")
+        self.max_groups = max_groups
+        self._windows = OrderedDict()
+        self.events_matched = 0
+        self.alerts_raised = 0
+
+        scoped = {}
+        for rule in self.rules:
+            # Index each rule under its most selective scope only
+            if rule.event_ids is not None:
+                keys = [('event_id', event_id) for event_id in rule.event_ids]
+            elif rule.sources is not None:
+                keys = [('source', source) for source in rule.sources]
+            elif rule.logs is not None:
+                keys = [('log', log) for log in rule.logs]
+            else:
+                keys = [None]
+            for key in keys:
+                scoped.setdefault(key, []).append(rule)
+        self._buckets = {key: _Bucket(rules) for key, rules in scoped.items()}
+        self._global = self._buckets.pop(None, None)
+        # One matcher for the anchors of every bucket: scanning a message
+        # costs about the same whether it serves ten rules or thousands
+        patterns = {pattern for bucket in scoped.values() for rule in bucket
+                    for pattern in rule.anchors or ()}
+        self._matcher = MultiPatternMatcher(patterns) if patterns else None
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path) as f:
+            rules = json.load(f)
+        return cls(rules['rules'] if isinstance(rules, dict) else rules, **kwargs)
+
+    def _threshold(self, rule, record, groups):
+        if rule.count <= 1:
+            return 1
+        group = groups.get(rule.group_by) if rule.group_by else None
+        if group is None and rule.group_by:
+            group = record.get(rule.group_by)
+            if group is None and isinstance(record.get('data'), dict):
+                group = record['data'].get(rule.group_by)
+        key = (rule.id, group)
+        now = record.get('timestamp') or time.time()
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = deque()
+            if len(self._windows) > self.max_groups:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(key)
+        window.append(now)
+        cutoff = now - rule.window
+        while window and window[0] < cutoff:
+            window.popleft()
+        if len(window) >= rule.count:
+            window.clear()
+            return rule.count
+        return 0
+
+    def match(self, record):
+        """Return the alerts record triggers (usually an empty list)."""
+        buckets = []
+        event_id = record.get('event_id')
+        if event_id is not None:
+            bucket = self._buckets.get(('event_id', event_id))
+            if bucket is not None:
+                buckets.append(bucket)
+        source = record.get('source')
+        if source:
+            bucket = self._buckets.get(('source', source.lower()))
+            if bucket is not None:
+                buckets.append(bucket)
+        log = record.get('log')
+        if log:
+            bucket = self._buckets.get(('log', log))
+            if bucket is not None:
+                buckets.append(bucket)
+        if self._global is not None:
+            buckets.append(self._global)
+        if not buckets:
+            return []
+
+        found = None
+        message = record.get('message')
+        if message and any(bucket.by_pattern for bucket in buckets):
+            found = self._matcher.find(message.lower())
+
+        alerts = []
+        for bucket in buckets:
+            for rule in bucket.candidates(record, found):
+                groups = rule.check(record)
+                if groups is None:
+                    continue
+                count = self._threshold(rule, record, groups)
+                if count:
+                    alerts.append({'rule': rule.id, 'severity': rule.severity,
+                                   'description': rule.description, 'count': count,
+                                   'groups': groups, 'record': record})
+        if alerts:
+            self.events_matched += 1
+            self.alerts_raised += len(alerts)
+        return alerts
+
+    def match_batch(self, records):
+        """Match a batch of records (e.g. one from log_sources) and return all alerts."""
+        alerts = []
+        match = self.match
+        for record in records:
+            found = match(record)
+            if found:
+                alerts.extend(found)
+        return alerts
+
+
+def print_alert(alert):
+    """Default alert sink: one line per alert on stdout."""
+    record = alert['record']
+    extra = f" x{alert['count']}" if alert['count'] > 1 else ''
+    groups = ' '.join(f"{name}={value}" for name, value in alert['groups'].items() if value)
+    print(f"ALERT [{alert['severity']}] {alert['rule']}{extra}: {record.get('source') or ''} "
+          f"{record.get('message') or ''} {groups}".rstrip())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match log records against detection rules.")
+    parser.add_argument('rules_file', help="JSON list of rules (or {\"rules\": [...]})")
+    parser.add_argument('records_file', nargs='?', default='log_records.jsonl',
+                        help="JSON lines of records, as written by log_sources.py")
+    args = parser.parse_args()
+
+    engine = RuleEngine.from_file(args.rules_file)
+    start = time.perf_counter()
+    count = 0
+    with open(args.records_file) as f:
+        for line in f:
+            if line.strip():
+                count += 1
+                for alert in engine.match(json.loads(line)):
+                    print_alert(alert)
+    elapsed = time.perf_counter() - start
+    print(f"{count} records, {engine.alerts_raised} alerts from {len(engine.rules)} rules "
+          f"in {elapsed:.2f}s")
@@ -0,0 +1,517 @@
+"""Constant-memory traffic sketches and a packet-rate scan/flood detector.
+
+    HyperLogLog     distinct count from 2**p one-byte registers
+    CountMinSketch  approximate per-key counts in depth rows of width counters
+    SpaceSaving     the k heaviest keys of a stream
+
+Each also comes in a sliding-window form that keeps one sketch per time
+bucket (numbered by the caller, e.g. packet time // bucket seconds, and
+never decreasing) and forgets buckets older than n_buckets.
+ScanFloodDetector combines them to flag port scans, host sweeps and SYN
+floods while the flow model is still waiting for flows to finish, in
+memory that does not grow with the number of hosts.
+
+    python sketches.py capture.pcap     # detections in a capture file
+    python sketches.py --synthetic      # against generated attacks, with precision/recall
+"""
+
+import argparse
+import heapq
+import itertools
+import math
+import time
+from array import array
+from collections import OrderedDict, deque
+
+import metrics
+from flow_stats import ACK, PSH, RST, SYN
+
+_MASK64 = (1 << 64) - 1
+_POW2 = [2.0 ** -rank for rank in range(66)]
+
+
+def hash64(value):
+    """Well-mixed 64-bit hash of any hashable value (splitmix64 finaliser over hash())."""
+    x = hash(value) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return x ^ (x >> 31)
+
+
+class HyperLogLog:
+    """Distinct count estimate; relative error about 1.04 / sqrt(2**p).
+
+    The harmonic sum of the registers is kept up to date as they grow,
+    so count() is O(1).
+    """
+
+    def __init__(self, p=8):
+        self.p = p
+        self.m = 1 << p
+        self._shift = 64 - p
+        self._low = (1 << self._shift) - 1
+        self._alpha = 0.7213 / (1 + 1.079 / self.m)
+        self._load(bytearray(self.m))
+
+    def _load(self, registers):
+        self.registers = registers
+        self._sum = sum(_POW2[rank] for rank in registers)
+        self._zeros = registers.count(0)
+
+    def index_rank(self, h):
+        """Register index and rank for a hash64() value."""
+        return h >> self._shift, self._shift - (h & self._low).bit_length() + 1
+
+    def raise_register(self, index, rank):
+        """Set register index to at least rank; True if it grew."""
+        old = self.registers[index]
+        if rank <= old:
+            return False
+        self.registers[index] = rank
+        self._sum += _POW2[rank] - _POW2[old]
+        if not old:
+            self._zeros -= 1
+        return True
+
+    def add_hash(self, h):
+        return self.raise_register(*self.index_rank(h))
+
+    def add(self, value):
+        """Add value; True if the estimate may have changed."""
+        return self.add_hash(hash64(value))
+
+    def count(self):
+        m = self.m
+        estimate = self._alpha * m * m / self._sum
+        if estimate <= 2.5 * m and self._zeros:
+            # Linear counting is more accurate while many registers are still empty
+            return m * math.log(m / self._zeros)
+        return estimate
+
+    def merge(self, other):
+        """Fold another HyperLogLog with the same p into this one."""
+        self._load(bytearray(map(max, self.registers, other.registers)))
+
+    def clear(self):
+        self._load(bytearray(self.m))
+
+
+class SlidingHyperLogLog:
+    """HyperLogLog over the last n_buckets buckets.
+
+    Registers are kept per bucket, and the window's registers (their
+    maximum) are raised on every add and rebuilt when a bucket expires,
+    so count() stays O(1). Buckets expire lazily, on the next add.
+    """
+
+    def __init__(self, p=8, n_buckets=6):
+        self.n_buckets = n_buckets
+        self.window = HyperLogLog(p)
+        self._buckets = OrderedDict()  # bucket number -> registers, oldest first
+        self._current = None
+        self.bucket = None
+
+    def _advance(self, bucket):
+        expired = False
+        while self._buckets and next(iter(self._buckets)) <= bucket - self.n_buckets:
+            self._buckets.popitem(last=False)
+            expired = True
+        if expired:
+            live = list(self._buckets.values())
+            self.window._load(bytearray(map(max, *live)) if len(live) > 1
+                              else bytearray(live[0]) if live else bytearray(self.window.m))
+        self._current = self._buckets[bucket] = bytearray(self.window.m)
+        self.bucket = bucket
+
+    def add_hash(self, h, bucket):
+        """Add a hash64() value in bucket; True if the window's registers grew."""
+        if bucket != self.bucket:
+            self._advance(bucket)
+        index, rank = self.window.index_rank(h)
+        if rank > self._current[index]:
+            self._current[index] = rank
+        return self.window.raise_register(index, rank)
+
+    def add(self, value, bucket):
+        return self.add_hash(hash64(value), bucket)
+
+    def count(self):
+        return self.window.count()
+
+
+class CountMinSketch:
+    """Per-key counts that are never underestimated.
+
+    An estimate exceeds the true count by at most e/width of the total
+    with probability 1 - exp(-depth).
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('q', bytes(8 * width)) for _ in range(depth)]
+        self.total = 0
+
+    def cells(self, h):
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        width = self.width
+        return [(h1 + i * h2) % width for i in range(self.depth)]
+
+    def add_hash(self, h, count=1):
+        self.total += count
+        for row, cell in zip(self.rows, self.cells(h)):
+            row[cell] += count
+
+    def estimate_hash(self, h):
+        return min(row[cell] for row, cell in zip(self.rows, self.cells(h)))
+
+    def excess_hash(self, h):
+        """estimate_hash() less the average count per cell: what stands out from collisions."""
+        return self.estimate_hash(h) - self.total / self.width
+
+    def add(self, key, count=1):
+        self.add_hash(hash64(key), count)
+
+    def estimate(self, key):
+        return self.estimate_hash(hash64(key))
+
+
+class SlidingCountMin(CountMinSketch):
+    """Count-Min sketch over the last n_buckets buckets.
+
+    rows holds the window's counts; each bucket's own counts are kept
+    too and subtracted when it expires.
+    """
+
+    def __init__(self, width=2048, depth=4, n_buckets=6):
+        super().__init__(width, depth)
+        self.n_buckets = n_buckets
+        self._buckets = deque()  # finished (bucket number, rows, total), oldest first
+        self._current = None
+        self._current_total = 0
+        self.bucket = None
+
+    def _advance(self, bucket):
+        if self._current is not None:
+            self._buckets.append((self.bucket, self._current, self._current_total))
+        while self._buckets and self._buckets[0][0] <= bucket - self.n_buckets:
+            _, expired, total = self._buckets.popleft()
+            self.total -= total
+            for row, old in zip(self.rows, expired):
+                for cell, count in enumerate(old):
+                    if count:
+                        row[cell] -= count
+        self._current = [array('q', bytes(8 * self.width)) for _ in range(self.depth)]
+        self._current_total = 0
+        self.bucket = bucket
+
+    def add_hash(self, h, bucket, count=1):
+        if bucket != self.bucket:
+            self._advance(bucket)
+        self.total += count
+        self._current_total += count
+        for row, current, cell in zip(self.rows, self._current, self.cells(h)):
+            row[cell] += count
+            current[cell] += count
+
+    def add(self, key, bucket, count=1):
+        self.add_hash(hash64(key), bucket, count)
+
+
+class SpaceSaving:
+    """The k heaviest keys of a stream.
+
+    Counts are exact for keys that were never replaced; a key that took
+    the place of another may be overestimated by errors[key]. A heap of
+    (count, key) entries finds the smallest count; entries made stale by
+    later adds are skipped when they surface.
+    """
+
+    def __init__(self, k=100):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self._heap = []  # (count, tie breaker, key)
+        self._order = itertools.count()
+
+    def add(self, key, count=1):
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+        elif len(counts) < self.k:
+            counts[key] = count
+            self.errors[key] = 0
+        else:
+            heap = self._heap
+            while True:
+                smallest, _, victim = heapq.heappop(heap)
+                if counts.get(victim) == smallest:
+                    break
+            del counts[victim]
+            del self.errors[victim]
+            counts[key] = smallest + count
+            self.errors[key] = smallest
+        heapq.heappush(self._heap, (counts[key], next(self._order), key))
+        if len(self._heap) > 8 * self.k:
+            self._heap = [(count, next(self._order), key) for key, count in counts.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, n=10):
+        """[(key, count)] for the n largest counts, largest first."""
+        return heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+
+
+class SlidingSpaceSaving:
+    """SpaceSaving summaries of the last n_buckets buckets, summed when queried."""
+
+    def __init__(self, k=100, n_buckets=6):
+        self.k = k
+        self.n_buckets = n_buckets
+        self._buckets = deque()  # (bucket number, SpaceSaving), oldest first
+        self._current = None
+        self.bucket = None
+
+    def add(self, key, bucket, count=1):
+        if bucket != self.bucket:
+            while self._buckets and self._buckets[0][0] <= bucket - self.n_buckets:
+                self._buckets.popleft()
+            self._current = SpaceSaving(self.k)
+            self._buckets.append((bucket, self._current))
+            self.bucket = bucket
+        self._current.add(key, count)
+
+    def top(self, n=10):
+        totals = {}
+        for _, summary in self._buckets:
+            for key, count in summary.counts.items():
+                totals[key] = totals.get(key, 0) + count
+        return heapq.nlargest(n, totals.items(), key=lambda item: item[1])
+
+
+def print_detection(detection):
+    """Default detection sink: one line per detection on stdout."""
+    kind = detection['kind']
+    if kind == 'syn_flood':
+        print(f"ALERT {kind} on {detection['dst']}:{detection['dst_port']}: "
+              f"~{detection['half_open']} half-open connections in {detection['window']:g}s")
+    else:
+        what = 'ports' if kind == 'port_scan' else 'hosts'
+        print(f"ALERT {kind} from {detection['src']}: ~{detection['distinct']} distinct {what} "
+              f"in {detection['window']:g}s")
+
+
+def detection_key(detection):
+    """What a detection is about: the scanning source, or the flooded (host, port)."""
+    if detection['kind'] == 'syn_flood':
+        return detection['kind'], (detection['dst'], detection['dst_port'])
+    return detection['kind'], detection['src']
+
+
+class _Source:
+    __slots__ = ('ports', 'hosts', 'bucket')
+
+    def __init__(self, p, n_buckets):
+        self.ports = SlidingHyperLogLog(p, n_buckets)
+        self.hosts = SlidingHyperLogLog(p, n_buckets)
+        self.bucket = None
+
+
+class ScanFloodDetector:
+    """Flag port scans, host sweeps and SYN floods from single packets, in bounded memory.
+
+    Connection attempts (TCP SYN without ACK, and UDP sent to a port
+    below its source port) feed two HyperLogLogs per source: distinct
+    destination ports (port_scan past port_threshold) and distinct
+    destination hosts (host_sweep past host_threshold). A source only
+    gets them once it has made min_attempts more attempts in the window
+    than the average Count-Min cell holds, so a spoofed flood from
+    millions of addresses does not churn them, and at most max_sources
+    are kept, least recently active dropped first.
+
+    SYNs and bare ACKs (the handshake's last packet) sent to each
+    destination host and port are counted in two Count-Min sketches;
+    SYNs minus ACKs past flood_threshold is a syn_flood. Bytes sent per
+    source go into a SpaceSaving summary, see top_talkers().
+
+    Everything covers the last window seconds of packet time, in
+    n_buckets steps. Each (kind, key) goes to sink at most once per
+    window.
+    """
+
+    def __init__(self, window=60.0, n_buckets=6, port_threshold=100, host_threshold=50,
+                 flood_threshold=1000, min_attempts=8, max_sources=4096, hll_p=7,
+                 cm_width=4096, cm_depth=4, top_k=100, sink=print_detection):
+        self.window = window
+        self.n_buckets = n_buckets
+        self.bucket_seconds = window / n_buckets
+        self.port_threshold = port_threshold
+        self.host_threshold = host_threshold
+        self.flood_threshold = flood_threshold
+        self.min_attempts = min_attempts
+        self.max_sources = max_sources
+        self.hll_p = hll_p
+        self.sink = sink
+        self.attempts = SlidingCountMin(cm_width, cm_depth, n_buckets)
+        self.syns = SlidingCountMin(cm_width, cm_depth, n_buckets)
+        self.acks = SlidingCountMin(cm_width, cm_depth, n_buckets)
+        self.talkers = SlidingSpaceSaving(top_k, n_buckets)
+        self._sources = OrderedDict()  # src ip -> _Source, least recently active first
+        self._flagged = OrderedDict()  # (kind, key) -> bucket it was reported in
+        self._bucket = None
+        self.packets = 0
+        self.sources_evicted = 0
+        self.detections = {'port_scan': 0, 'host_sweep': 0, 'syn_flood': 0}
+        metrics.gauge('hids_sketch_sources', "Sources with scan HyperLogLogs").set_function(
+            lambda: len(self._sources))
+        for kind in self.detections:
+            metrics.counter('hids_sketch_detections_total', "Scan and flood detections, by kind",
+                            kind=kind).set_function(lambda kind=kind: self.detections[kind])
+
+    def _advance(self, bucket):
+        self._bucket = bucket
+        oldest = bucket - self.n_buckets
+        flagged = self._flagged
+        while flagged and next(iter(flagged.values())) <= oldest:
+            flagged.popitem(last=False)
+        sources = self._sources
+        while sources and next(iter(sources.values())).bucket <= oldest:
+            sources.popitem(last=False)
+
+    def add(self, packet):
+        """Update the sketches with one PacketInfo and report what it reveals."""
+        bucket = int(packet.timestamp // self.bucket_seconds)
+        if bucket != self._bucket:
+            if self._bucket is not None and bucket < self._bucket:
+                # Slightly out-of-order timestamps count in the current bucket
+                bucket = self._bucket
+            else:
+                self._advance(bucket)
+        self.packets += 1
+        self.talkers.add(packet.src_ip, bucket, packet.length)
+        if packet.protocol == 'TCP':
+            flags = packet.flags
+            if flags & SYN:
+                if not flags & ACK:
+                    self._syn(packet, bucket)
+                    self._attempt(packet, bucket)
+            elif flags & ACK and not flags & (RST | PSH) and not packet.header_length:
+                self.acks.add_hash(hash64((packet.dst_ip, packet.dst_port)), bucket)
+        elif packet.dst_port < packet.src_port:
+            self._attempt(packet, bucket)
+
+    def add_many(self, packets):
+        for packet in packets:
+            self.add(packet)
+
+    def _syn(self, packet, bucket):
+        h = hash64((packet.dst_ip, packet.dst_port))
+        self.syns.add_hash(h, bucket)
+        syns = self.syns.estimate_hash(h)
+        if syns >= self.flood_threshold:
+            half_open = syns - self.acks.estimate_hash(h)
+            if half_open >= self.flood_threshold:
+                self._report('syn_flood', (packet.dst_ip, packet.dst_port), packet, bucket,
+                             severity='critical', dst=packet.dst_ip, dst_port=packet.dst_port,
+                             half_open=half_open, syns=syns)
+
+    def _attempt(self, packet, bucket):
+        src = packet.src_ip
+        sources = self._sources
+        source = sources.get(src)
+        if source is None:
+            h = hash64(src)
+            self.attempts.add_hash(h, bucket)
+            if self.attempts.excess_hash(h) < self.min_attempts:
+                return
+            source = sources[src] = _Source(self.hll_p, self.n_buckets)
+            if len(sources) > self.max_sources:
+                sources.popitem(last=False)
+                self.sources_evicted += 1
+        else:
+            sources.move_to_end(src)
+        source.bucket = bucket
+        if source.ports.add_hash(hash64(packet.dst_port), bucket):
+            distinct = source.ports.count()
+            if distinct >= self.port_threshold:
+                self._report('port_scan', src, packet, bucket, src=src, dst=packet.dst_ip,
+                             distinct=round(distinct))
+        if source.hosts.add_hash(hash64(packet.dst_ip), bucket):
+            distinct = source.hosts.count()
+            if distinct >= self.host_threshold:
+                self._report('host_sweep', src, packet, bucket, src=src, dst_port=packet.dst_port,
+                             distinct=round(distinct))
+
+    def _report(self, kind, key, packet, bucket, severity='high', **details):
+        flagged = self._flagged
+        if (kind, key) in flagged:
+            return
+        flagged[(kind, key)] = bucket
+        self.detections[kind] += 1
+        if self.sink is not None:
+            self.sink({'kind': kind, 'severity': severity, 'src': None, 'dst': None, 'dst_port': None,
+                       'protocol': packet.protocol, 'timestamp': packet.timestamp,
+                       'window': self.window, **details})
+
+    def top_talkers(self, n=10):
+        """[(source, bytes)] for the heaviest senders in the window."""
+        return self.talkers.top(n)
+
+    def report(self):
+        return {'packets': self.packets, 'sources_tracked': len(self._sources),
+                'sources_evicted': self.sources_evicted, **self.detections}
+
+
+def evaluate(detections, expected):
+    """Precision and recall of detections against a set of detection_key()s."""
+    found = {detection_key(detection) for detection in detections}
+    true_positives = len(found & expected)
+    return {'detected': len(found), 'expected': len(expected), 'true_positives': true_positives,
+            'precision': true_positives / len(found) if found else 1.0,
+            'recall': true_positives / len(expected) if expected else 1.0,
+            'false_positives': sorted(map(str, found - expected))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect scans and floods in a capture file.")
+    parser.add_argument('pcap_file', nargs='?')
+    parser.add_argument('--synthetic', action='store_true',
+                        help="use generated scans and floods over benign traffic instead of a file")
+    parser.add_argument('--flows', type=int, default=20000, help="benign flows with --synthetic")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--window', type=float, default=60.0)
+    parser.add_argument('--port-threshold', type=int, default=100)
+    parser.add_argument('--host-threshold', type=int, default=50)
+    parser.add_argument('--flood-threshold', type=int, default=1000)
+    parser.add_argument('--top', type=int, default=5, help="top talkers to print at the end")
+    args = parser.parse_args()
+    if not args.synthetic and not args.pcap_file:
+        parser.error("give a pcap file or --synthetic")
+
+    detections = []
+
+    def sink(detection):
+        print_detection(detection)
+        detections.append(detection)
+
+    detector = ScanFloodDetector(args.window, port_threshold=args.port_threshold,
+                                 host_threshold=args.host_threshold,
+                                 flood_threshold=args.flood_threshold, sink=sink)
+    if args.synthetic:
+        from synthetic_traffic import SyntheticAttacks, SyntheticTraffic
+
+        attacks = SyntheticAttacks(SyntheticTraffic(args.flows, attack_ratio=0.0, seed=args.seed),
+                                   seed=args.seed)
+        packets = attacks.packets()
+    else:
+        from packet_sources import PcapFileSource
+
+        packets = PcapFileSource(args.pcap_file)
+    start = time.perf_counter()
+    detector.add_many(packets)
+    seconds = time.perf_counter() - start
+    print(f"{detector.packets} packets in {seconds:.2f}s ({detector.packets / seconds:,.0f} packets/s): "
+          f"{detector.report()}")
+    for source, count in detector.top_talkers(args.top):
+        print(f"  top talker {source}: {count:,} bytes")
+    if args.synthetic:
+        print(evaluate(detections, attacks.expected))
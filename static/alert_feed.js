@@ -0,0 +1,39 @@
+// Live alert table for dashboard.html.
+//
+// Include with <script src="{{ url_for('static', filename='alert_feed.js') }}"
+// data-cursor="{{ cursor }}"></script> below a <tbody id="alerts">: new alerts
+// are streamed from /api/alerts/stream and prepended, keeping at most MAX_ROWS.
+(function () {
+    var MAX_ROWS = 500;
+    var script = document.currentScript;
+    var table = document.getElementById('alerts');
+    var cursor = script.getAttribute('data-cursor') || '0';
+
+    function cell(row, text) {
+        var td = document.createElement('td');
+        td.textContent = text === null || text === undefined ? '' : text;
+        row.appendChild(td);
+    }
+
+    function addAlert(alert) {
+        var row = document.createElement('tr');
+        row.className = 'alert-' + alert.severity;
+        cell(row, new Date(alert.time * 1000).toLocaleTimeString());
+        cell(row, alert.severity);
+        // Incidents group many source ports
+        cell(row, alert.src_port === undefined ? alert.src : alert.src + ':' + alert.src_port);
+        cell(row, alert.dst + ':' + alert.dst_port);
+        cell(row, alert.protocol);
+        cell(row, alert.count || 1);
+        table.insertBefore(row, table.firstChild);
+        while (table.rows.length > MAX_ROWS) {
+            table.deleteRow(table.rows.length - 1);
+        }
+    }
+
+    // The browser resends the last event id when it reconnects
+    var source = new EventSource('/api/alerts/stream?since=' + encodeURIComponent(cursor));
+    source.onmessage = function (event) {
+        addAlert(JSON.parse(event.data));
+    };
+})();
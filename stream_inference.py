@@ -0,0 +1,197 @@
+"""In-process micro-batch scoring of finished flow records.
+
+Flows coming out of the flow table are turned into the model's feature
+vector in memory and scored in small batches, so detection does not
+wait for the captured_traffic.csv -> captured_dataset.csv ->
+predicted_captured_dataset.csv round trip.
+"""
+
+import logging
+import time
+from collections import deque
+
+import numpy as np
+
+import metrics
+from capture_preprocess import FlowTransformer
+
+_FLOWS_SCORED = metrics.counter('hids_flows_scored_total', "Flows scored by the streaming scorer")
+_FLOWS_MALICIOUS = metrics.counter('hids_flows_malicious_total', "Flows predicted malicious")
+_BATCH_SIZE = metrics.histogram('hids_score_batch_flows', "Flows per scoring batch",
+                                buckets=metrics.SIZE_BUCKETS)
+_INFERENCE_SECONDS = metrics.histogram('hids_inference_seconds', "Feature building and prediction time per batch")
+_DETECTION_SECONDS = metrics.histogram('hids_detection_latency_seconds',
+                                       "Time from a batch's oldest flow finishing to its verdict")
+
+
+def records_to_features(records, columns, transformer=None):
+    """Build the model's feature matrix from flow record dicts.
+
+    Uses the same FlowTransformer as capture_preprocess, so streamed
+    flows get exactly the features the batch path would give them.
+    """
+    if transformer is None:
+        transformer = FlowTransformer()
+    return transformer.transform_records(records, columns)
+
+
+def print_alert(record):
+    """Default alert sink: report a malicious flow on stdout and in the log."""
+    message = (f"ALERT: malicious flow {record['Source IP']}:{record['Source Port']} -> "
+               f"{record['Destination IP']}:{record['Destination Port']} "
+               f"({record['Protocol']}) at {record['Timestamp']}")
+    print(message)
+    logging.warning(message)
+
+
+class MicroBatchScorer:
+    """Score flow records in micro-batches with an already loaded model.
+
+    A batch is scored as soon as max_batch_size records are queued, or
+    once the oldest queued record has waited max_wait_ms. Records
+    predicted malicious go straight to alert_sink. Each batch's latency,
+    from the oldest record being queued to its prediction, is checked
+    against latency_budget_ms. max_wait_ms is capped at the budget.
+
+    If a forest_compiler.CompiledForest is given, batches of up to
+    compiled_max_batch records are scored with it instead of sklearn.
+    It gives identical predictions at a fraction of the per-call cost.
+
+    With a model_registry.ModelWatcher, a newly promoted model version is
+    swapped in between batches: queued records are kept and scored by
+    the new model, and no batch is ever scored by a half-loaded one.
+
+    With an archive (flow_archive.FlowArchive), every scored batch is
+    archived along with its predictions.
+    """
+
+    def __init__(self, clf, scaler, columns, max_batch_size=256, max_wait_ms=50,
+                 latency_budget_ms=250, alert_sink=print_alert, history=1024, transformer=None,
+                 compiled=None, compiled_max_batch=512, watcher=None, model_version=None, archive=None):
+        self.clf = clf
+        self.scaler = scaler
+        self.columns = list(columns)
+        self.transformer = transformer if transformer is not None else FlowTransformer()
+        self.compiled = compiled
+        self.compiled_max_batch = compiled_max_batch
+        self.max_batch_size = max_batch_size
+        self.latency_budget_ms = latency_budget_ms
+        self.max_wait = min(max_wait_ms, latency_budget_ms) / 1000.0
+        self.alert_sink = alert_sink
+        self.watcher = watcher
+        self.archive = archive
+        self.model_version = model_version if model_version is not None else getattr(watcher, 'version', None)
+        self.model_swaps = 0
+        self.flows_scored = 0
+        self.malicious = 0
+        self.batches = 0
+        self.over_budget = 0
+        # (batch size, scoring ms, end-to-end ms) for the most recent batches
+        self.latencies = deque(maxlen=history)
+        self._queue = []
+        self._oldest = None
+
+    def add(self, record):
+        """Queue one finished flow record for scoring."""
+        if not self._queue:
+            self._oldest = time.perf_counter()
+        self._queue.append(record)
+        if len(self._queue) >= self.max_batch_size:
+            self.flush()
+
+    def extend(self, records):
+        """Queue several finished flow records for scoring."""
+        for record in records:
+            self.add(record)
+
+    def poll(self):
+        """Score the queued records if the oldest has waited max_wait_ms."""
+        if self._queue and time.perf_counter() - self._oldest >= self.max_wait:
+            self.flush()
+
+    def _scale(self, features):
+        scaler = self.scaler
+        # Same arithmetic as StandardScaler.transform, minus input validation
+        if getattr(scaler, 'with_mean', True) and scaler.mean_ is not None:
+            features -= scaler.mean_
+        if getattr(scaler, 'with_std', True) and scaler.scale_ is not None:
+            features /= scaler.scale_
+        return features
+
+    def use_model(self, model):
+        """Score the next batches with a model_registry.LoadedModel."""
+        self.clf = model.clf
+        self.scaler = model.scaler
+        self.columns = list(model.columns)
+        self.transformer = model.transformer
+        self.compiled = model.compiled
+        self.model_version = model.version
+        self.model_swaps += 1
+        logging.info(f"Switched to model version {model.version}")
+
+    def flush(self):
+        """Score every queued record now."""
+        if not self._queue:
+            return
+        if self.watcher is not None:
+            model = self.watcher.poll()
+            if model is not None:
+                self.use_model(model)
+        records, self._queue = self._queue, []
+        oldest = self._oldest
+        start = time.perf_counter()
+        features = records_to_features(records, self.columns, self.transformer)
+        if self.compiled is not None and len(records) <= self.compiled_max_batch:
+            predictions = self.compiled.predict(features)
+        else:
+            predictions = self.clf.predict(self._scale(features))
+        end = time.perf_counter()
+
+        for record, label in zip(records, predictions):
+            if label == 1:
+                self.malicious += 1
+                _FLOWS_MALICIOUS.inc()
+                if self.alert_sink is not None:
+                    self.alert_sink({**record, 'Predicted_Label': int(label)})
+        if self.archive is not None:
+            self.archive.extend(records, predictions)
+
+        scoring_ms = (end - start) * 1000
+        total_ms = (end - oldest) * 1000
+        self.batches += 1
+        self.flows_scored += len(records)
+        _FLOWS_SCORED.inc(len(records))
+        _BATCH_SIZE.observe(len(records))
+        _INFERENCE_SECONDS.observe(end - start)
+        _DETECTION_SECONDS.observe(end - oldest)
+        self.latencies.append((len(records), scoring_ms, total_ms))
+        if total_ms > self.latency_budget_ms:
+            self.over_budget += 1
+            logging.warning(f"Scoring batch of {len(records)} flows took {total_ms:.1f} ms, "
+                            f"over the {self.latency_budget_ms} ms budget")
+
+    def close(self):
+        self.flush()
+
+    def report(self):
+        """Summarize recent per-batch latency and overall counts."""
+        summary = {
+            'batches': self.batches,
+            'flows_scored': self.flows_scored,
+            'malicious': self.malicious,
+            'over_budget': self.over_budget,
+            'latency_budget_ms': self.latency_budget_ms,
+            'model_version': self.model_version,
+            'model_swaps': self.model_swaps,
+        }
+        if self.latencies:
+            sizes, scoring, total = (np.array(values) for values in zip(*self.latencies))
+            summary.update({
+                'mean_batch_size': float(sizes.mean()),
+                'scoring_ms_p50': float(np.percentile(scoring, 50)),
+                'scoring_ms_p99': float(np.percentile(scoring, 99)),
+                'latency_ms_p50': float(np.percentile(total, 50)),
+                'latency_ms_p99': float(np.percentile(total, 99)),
+                'latency_ms_max': float(total.max()),
+            })
+        return summary
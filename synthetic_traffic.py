@@ -0,0 +1,336 @@
+"""Deterministic synthetic traffic for benchmarks and offline experiments.
+
+Everything here is generated from a seed, so two runs with the same
+parameters produce the same packets, flows and labels.
+"""
+
+import heapq
+import random
+import socket
+import struct
+
+from packet_sources import PacketInfo
+
+FIN, SYN, RST, PSH, ACK = 0x01, 0x02, 0x04, 0x08, 0x10
+
+START_TIME = 1700000000.0
+
+
+def _benign_flow(rng, client, client_port, server, server_port, start, n_packets):
+    """A TCP session: handshake, request/response data, FIN close."""
+    t = start
+    packets = [
+        (t, client, client_port, server, server_port, SYN, 0),
+        (t + 0.0005, server, server_port, client, client_port, SYN | ACK, 0),
+        (t + 0.001, client, client_port, server, server_port, ACK, 0),
+    ]
+    t += 0.001
+    for _ in range(max(0, n_packets - 5)):
+        t += rng.expovariate(50.0)
+        if rng.random() < 0.4:
+            packets.append((t, client, client_port, server, server_port, PSH | ACK, rng.randint(40, 600)))
+        else:
+            packets.append((t, server, server_port, client, client_port, PSH | ACK, rng.randint(200, 1460)))
+    t += rng.expovariate(50.0)
+    packets.append((t, client, client_port, server, server_port, FIN | ACK, 0))
+    packets.append((t + 0.0005, server, server_port, client, client_port, FIN | ACK, 0))
+    return packets
+
+
+def _attack_flow(rng, attacker, attacker_port, victim, victim_port, start, n_packets):
+    """A flood-like flow: a burst of small packets with almost no replies, ended by RST."""
+    t = start
+    packets = []
+    for _ in range(max(1, n_packets - 1)):
+        packets.append((t, attacker, attacker_port, victim, victim_port,
+                        rng.choice((SYN, PSH | ACK, ACK)), rng.randint(0, 64)))
+        t += rng.expovariate(2000.0)
+    packets.append((t, victim, victim_port, attacker, attacker_port, RST, 0))
+    return packets
+
+
+def _to_packet(entry):
+    timestamp, src_ip, src_port, dst_ip, dst_port, flags, payload = entry
+    # 14 bytes Ethernet + 20 IP + 20 TCP headers on the wire
+    return PacketInfo(timestamp, 54 + payload, src_ip, src_port, dst_ip, dst_port,
+                      'TCP', payload, flags)
+
+
+class SyntheticTraffic:
+    """A reproducible mix of benign TCP sessions and attack flows.
+
+    n_flows flows start over duration seconds. Benign flows have about
+    packets_per_flow packets; a fraction attack_ratio of flows are
+    attacks from a small set of attacker hosts. labels maps each flow's
+    (src ip, src port, dst ip, dst port) to 0 (benign) or 1 (attack).
+    """
+
+    def __init__(self, n_flows=1000, packets_per_flow=20, attack_ratio=0.1, duration=60.0,
+                 seed=42, n_clients=250, n_servers=20, n_attackers=5):
+        self.n_flows = n_flows
+        self.packets_per_flow = packets_per_flow
+        self.attack_ratio = attack_ratio
+        self.duration = duration
+        self.seed = seed
+        rng = random.Random(seed)
+        self.clients = [f"10.0.{i // 250}.{i % 250 + 1}" for i in range(n_clients)]
+        self.servers = [f"192.168.1.{i + 1}" for i in range(n_servers)]
+        self.attackers = [f"203.0.113.{i + 1}" for i in range(n_attackers)]
+        self.labels = {}
+        self._flows = []
+        for index in range(n_flows):
+            start = START_TIME + rng.random() * duration
+            length = max(5, int(rng.gauss(packets_per_flow, packets_per_flow / 4)))
+            server = rng.choice(self.servers)
+            server_port = rng.choice((80, 443, 22, 3306, 8080))
+            client_port = 1024 + index % 64000
+            if rng.random() < attack_ratio:
+                client = rng.choice(self.attackers)
+                self._flows.append(('attack', client, client_port, server, server_port, start, length))
+                self.labels[(client, client_port, server, server_port)] = 1
+            else:
+                client = rng.choice(self.clients)
+                self._flows.append(('benign', client, client_port, server, server_port, start, length))
+                self.labels[(client, client_port, server, server_port)] = 0
+
+    def packets(self):
+        """Yield every packet as a PacketInfo, in timestamp order."""
+        rng = random.Random(self.seed + 1)
+        streams = []
+        for kind, client, client_port, server, server_port, start, length in self._flows:
+            build = _attack_flow if kind == 'attack' else _benign_flow
+            streams.append(build(rng, client, client_port, server, server_port, start, length))
+        for entry in heapq.merge(*streams, key=lambda entry: entry[0]):
+            yield _to_packet(entry)
+
+    def label_of(self, record):
+        """Return the label of a flow record, whichever side opened the flow."""
+        key = (record['Source IP'], record['Source Port'],
+               record['Destination IP'], record['Destination Port'])
+        if key in self.labels:
+            return self.labels[key]
+        return self.labels.get((key[2], key[3], key[0], key[1]), 0)
+
+
+def _port_scan(rng, attacker, victim, ports, start, rate):
+    """SYNs to many ports of one host; closed ports answer RST, open ones SYN/ACK."""
+    packets = []
+    t = start
+    for port in ports:
+        source_port = rng.randint(32768, 60999)
+        packets.append((t, attacker, source_port, victim, port, SYN, 0))
+        reply = SYN | ACK if rng.random() < 0.05 else RST | ACK
+        packets.append((t + 0.0003, victim, port, attacker, source_port, reply, 0))
+        t += rng.expovariate(rate)
+    return packets
+
+
+def _host_sweep(rng, attacker, victims, port, start, rate):
+    """SYNs to one port across many hosts; most never answer."""
+    packets = []
+    t = start
+    for victim in victims:
+        source_port = rng.randint(32768, 60999)
+        packets.append((t, attacker, source_port, victim, port, SYN, 0))
+        if rng.random() < 0.2:
+            packets.append((t + 0.0004, victim, port, attacker, source_port, RST | ACK, 0))
+        t += rng.expovariate(rate)
+    return packets
+
+
+def _syn_flood(rng, victim, port, start, n_packets, rate):
+    """SYNs from spoofed random sources; the victim answers SYN/ACK and never hears back."""
+    packets = []
+    t = start
+    for _ in range(n_packets):
+        spoofed = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        source_port = rng.randint(1024, 65535)
+        packets.append((t, spoofed, source_port, victim, port, SYN, 0))
+        packets.append((t + 0.0002, victim, port, spoofed, source_port, SYN | ACK, 0))
+        t += rng.expovariate(rate)
+    return packets
+
+
+class SyntheticAttacks:
+    """Port scans, host sweeps and SYN floods mixed into background traffic.
+
+    background is a SyntheticTraffic (or None for attacks alone).
+    expected holds what sketches.ScanFloodDetector should report, as
+    sketches.detection_key() values: ('port_scan', attacker),
+    ('host_sweep', attacker) and ('syn_flood', (victim, port)).
+    """
+
+    def __init__(self, background=None, seed=42, duration=60.0, port_scans=2, host_sweeps=2,
+                 syn_floods=1, scan_size=500, scan_rate=100.0, flood_packets=10000, flood_rate=500.0):
+        self.background = background
+        rng = random.Random(seed + 2)
+        servers = background.servers if background is not None else ['192.168.1.1']
+        self._streams = []
+        self.expected = set()
+        for index in range(port_scans):
+            attacker = f"198.51.100.{index + 1}"
+            ports = rng.sample(range(1, 65536), scan_size)
+            self._streams.append(_port_scan(rng, attacker, rng.choice(servers), ports,
+                                            self._start(rng, duration, scan_size / scan_rate), scan_rate))
+            self.expected.add(('port_scan', attacker))
+        for index in range(host_sweeps):
+            attacker = f"198.51.100.{index + 101}"
+            victims = [f"10.{100 + index}.{i // 250}.{i % 250 + 1}" for i in range(scan_size)]
+            self._streams.append(_host_sweep(rng, attacker, victims, rng.choice((22, 445, 3389)),
+                                             self._start(rng, duration, scan_size / scan_rate), scan_rate))
+            self.expected.add(('host_sweep', attacker))
+        for index in range(syn_floods):
+            victim, port = servers[index % len(servers)], 80
+            self._streams.append(_syn_flood(rng, victim, port,
+                                            self._start(rng, duration, flood_packets / flood_rate),
+                                            flood_packets, flood_rate))
+            self.expected.add(('syn_flood', (victim, port)))
+
+    @staticmethod
+    def _start(rng, duration, length):
+        return START_TIME + rng.random() * max(0.0, duration - length)
+
+    def packets(self):
+        """Yield background and attack packets as PacketInfo, in timestamp order."""
+        attacks = (_to_packet(entry) for entry in heapq.merge(*self._streams, key=lambda entry: entry[0]))
+        if self.background is None:
+            yield from attacks
+        else:
+            yield from heapq.merge(self.background.packets(), attacks, key=lambda packet: packet.timestamp)
+
+
+def write_pcap(path, packets):
+    """Write PacketInfo objects to a classic Ethernet pcap file."""
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for packet in packets:
+            tcp = struct.pack('!HHIIBBHHH', packet.src_port, packet.dst_port, 0, 0,
+                              5 << 4, packet.flags, 65535, 0, 0) + bytes(packet.header_length)
+            ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 0, 0x4000, 64, 6, 0,
+                             socket.inet_aton(packet.src_ip), socket.inet_aton(packet.dst_ip))
+            frame = b'\x02\x00\x00\x00\x00\x01\x02\x00\x00\x00\x00\x02\x08\x00' + ip + tcp
+            seconds = int(packet.timestamp)
+            microseconds = int(round((packet.timestamp - seconds) * 1e6))
+            if microseconds >= 1000000:
+                seconds, microseconds = seconds + 1, microseconds - 1000000
+            f.write(struct.pack('<IIII', seconds, microseconds, len(frame), len(frame)) + frame)
+
+
+def labelled_flows(traffic, **table_kwargs):
+    """Run traffic through a FlowTable and return (flow records, labels)."""
+    from flow_stats import FlowTable
+
+    table = FlowTable(**table_kwargs)
+    records = []
+    for packet in traffic.packets():
+        records.extend(flow.to_record() for flow in table.add(packet))
+    records.extend(flow.to_record() for flow in table.flush())
+    return records, [traffic.label_of(record) for record in records]
+
+
+def training_dataset(traffic, **table_kwargs):
+    """Build a network_dataset.csv-style DataFrame: numeric features plus 'Label'."""
+    from capture_preprocess import FlowTransformer
+    from flow_stats import COLUMNS
+    import pandas as pd
+
+    records, labels = labelled_flows(traffic, **table_kwargs)
+    flows = pd.DataFrame.from_records(records, columns=COLUMNS)
+    df = FlowTransformer().fit(flows).transform(flows)
+    df['Label'] = labels
+    return df
+
+
+_LOG_SOURCES = ('sshd', 'sudo', 'cron', 'kernel', 'systemd', 'nginx', 'postfix', 'dbus-daemon')
+_LOG_WORDS = ('session', 'opened', 'closed', 'user', 'connection', 'from', 'port', 'request',
+              'started', 'stopped', 'denied', 'timeout', 'error', 'warning', 'device', 'service',
+              'module', 'config', 'reload', 'queue', 'delivered', 'client', 'network', 'disk')
+_EVENT_IDS = (4624, 4625, 4634, 4648, 4672, 4688, 4697, 4720, 4732, 5140, 5156, 7045, 1102)
+# Words detection rules look for; a few messages contain one
+_RARE_WORDS = tuple(f"{a}{b}" for a in ('mal', 'bad', 'evil', 'sus', 'odd', 'rare', 'bot', 'rat')
+                    for b in ('ware', 'cmd', 'load', 'shell', 'proc', 'task', 'conf', 'link',
+                              'drop', 'hook', 'kit', 'spy'))
+
+
+def _ip(rng, prefix='10.0'):
+    return f"{prefix}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+
+def synthetic_log_events(n_events=100000, seed=42, failed_login_ratio=0.02, windows_ratio=0.3,
+                         rare_ratio=0.01):
+    """Records shaped like log_sources.make_record(): syslog lines and Windows events.
+
+    A failed_login_ratio share are SSH password failures from a few
+    attacker addresses, so brute-force threshold rules have something
+    to find, and a rare_ratio share of syslog messages contain one of
+    the words synthetic_rules() looks for.
+    """
+    rng = random.Random(seed)
+    attackers = [_ip(rng, '203.0') for _ in range(5)]
+    users = [f"user{i}" for i in range(50)] + ['root', 'admin']
+    records = []
+    t = START_TIME
+    for i in range(n_events):
+        t += rng.expovariate(1000.0)
+        roll = rng.random()
+        if roll < failed_login_ratio:
+            source, event_id, data = 'sshd', None, None
+            message = (f"Failed password for {rng.choice(users)} from {rng.choice(attackers)} "
+                       f"port {rng.randint(1024, 65535)} ssh2")
+            log = 'auth'
+        elif roll < failed_login_ratio + windows_ratio:
+            log, source = 'Security', 'Microsoft-Windows-Security-Auditing'
+            event_id = rng.choice(_EVENT_IDS)
+            data = {'TargetUserName': rng.choice(users), 'LogonType': str(rng.choice((2, 3, 5, 10))),
+                    'IpAddress': _ip(rng)}
+            message = ' '.join(data.values())
+        else:
+            source, event_id, data = rng.choice(_LOG_SOURCES), None, None
+            log = 'auth' if source in ('sshd', 'sudo') else 'syslog'
+            words = rng.sample(_LOG_WORDS, rng.randint(5, 9))
+            if rng.random() < rare_ratio:
+                words[rng.randrange(len(words))] = rng.choice(_RARE_WORDS)
+            message = (f"{' '.join(words[:3])} {rng.choice(users)} {' '.join(words[3:])} "
+                       f"{_ip(rng)} port {rng.randint(1, 65535)}")
+        records.append({'timestamp': t, 'log': log, 'host': 'bench', 'source': source,
+                        'pid': rng.randint(100, 40000), 'event_id': event_id, 'level': None,
+                        'record_id': i, 'message': message, 'data': data})
+    return records
+
+
+def synthetic_rules(n_rules=1000, seed=42):
+    """A rule_engine rule set of roughly the mix a real deployment carries.
+
+    Most rules are scoped to event IDs (often with field conditions) or
+    to a source with substring patterns; a few are regexes, a few apply
+    to every record, and some carry thresholds.
+    """
+    rng = random.Random(seed)
+    rules = [{
+        'id': 'ssh-brute-force', 'severity': 'high', 'logs': ['auth'], 'sources': ['sshd'],
+        'contains': ['failed password'], 'regex': r'from (?P<ip>\d+\.\d+\.\d+\.\d+)',
+        'threshold': {'count': 5, 'window': 60, 'group_by': 'ip'},
+    }]
+    while len(rules) < n_rules:
+        rule = {'id': f"rule-{len(rules):04d}", 'severity': rng.choice(('low', 'medium', 'high'))}
+        kind = rng.random()
+        if kind < 0.45:
+            rule['event_ids'] = rng.sample(_EVENT_IDS, rng.randint(1, 2))
+            rule['fields'] = {'TargetUserName': [f"user{rng.randint(0, 60)}"]}
+            if rng.random() < 0.3:
+                rule['fields']['LogonType'] = str(rng.choice((3, 10)))
+        elif kind < 0.85:
+            rule['sources'] = [rng.choice(_LOG_SOURCES)]
+            rule['contains'] = [rng.choice(_RARE_WORDS) + rng.choice(('', ' ' + rng.choice(_LOG_WORDS)))
+                                for _ in range(rng.randint(1, 3))]
+        elif kind < 0.95:
+            rule['sources'] = [rng.choice(_LOG_SOURCES)]
+            rule['regex'] = (rf"{rng.choice(_RARE_WORDS)}\s+(?P<user>user\d+)"
+                             if rng.random() < 0.7 else rf"(?:{rng.choice(_RARE_WORDS)}|{rng.choice(_RARE_WORDS)})\d+")
+        else:
+            rule['contains'] = [rng.choice(_RARE_WORDS)]
+        if rng.random() < 0.1:
+            rule['threshold'] = {'count': rng.randint(3, 10), 'window': rng.choice((30, 60, 300)),
+                                 'group_by': 'source'}
+        rules.append(rule)
+    return rules
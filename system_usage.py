@@ -1,92 +1,91 @@
-import psutil
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from collections import deque
+import argparse
 
-def monitor_system(threshold=90, plot_duration=60):
-    # Data collections for plotting
-    data_buffers = {
-        'cpu': deque([0] * plot_duration, maxlen=plot_duration),
-        'memory': deque([0] * plot_duration, maxlen=plot_duration),
-        'disk': deque([0] * plot_duration, maxlen=plot_duration),
-        'net_sent': deque([0] * plot_duration, maxlen=plot_duration),
-        'net_recv': deque([0] * plot_duration, maxlen=plot_duration)
-    }
+from host_metrics import HostSampler, PERCENT_METRICS
 
-    # Initialize network counters
-    initial_network_stats = psutil.net_io_counters()
-    initial_bytes_sent = initial_network_stats.bytes_sent
-    initial_bytes_recv = initial_network_stats.bytes_recv
+
+def monitor_system(threshold=90, plot_duration=60, interval=1.0):
+    """Plot live CPU, memory, disk and network usage from a background HostSampler.
+
+    Lines are created once and only their data is updated on each frame,
+    with blitting, instead of clearing and redrawing every subplot.
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+
+    sampler = HostSampler(interval=interval, capacity=max(plot_duration, 3600),
+                          window=min(plot_duration, 120),
+                          thresholds={metric: threshold for metric in PERCENT_METRICS})
+    sampler.start()
 
     # Set up the figure and subplots
     fig, axs = plt.subplots(4, 1, figsize=(10, 8))
     plt.subplots_adjust(hspace=0.5)
 
-    def add_alert_text(ax, message):
-        """Adds an alert text to the plot when threshold is exceeded."""
-        ax.text(0.5, 0.5, message, transform=ax.transAxes, fontsize=12,
-                color="red", fontweight="bold", ha="center", va="center", alpha=0.7)
-
-    def plot_metric(ax, data, title, ylabel, color, threshold_exceeded, alert_message):
-        """Generalized plotting function for updating and displaying system metrics."""
-        ax.clear()
-        ax.plot(data, color=color)
+    panels = [
+        ('cpu', axs[0], "CPU Usage", "tab:blue", "ALERT: CPU Usage High!"),
+        ('memory', axs[1], "Memory Usage", "tab:orange", "ALERT: Memory Usage High!"),
+        ('disk', axs[2], "Disk Usage", "tab:green", "ALERT: Disk Usage High!"),
+    ]
+    lines = {}
+    alert_texts = {}
+    for metric, ax, title, color, message in panels:
+        ax.set_xlim(0, plot_duration - 1)
         ax.set_ylim(0, 100)
         ax.set_title(title)
-        ax.set_ylabel(ylabel)
-        if threshold_exceeded:
-            add_alert_text(ax, alert_message)
+        ax.set_ylabel("Usage (%)")
+        lines[metric], = ax.plot([], [], color=color)
+        alert_texts[metric] = ax.text(0.5, 0.5, message, transform=ax.transAxes, fontsize=12,
+                                      color="red", fontweight="bold", ha="center", va="center",
+                                      alpha=0.7, visible=False)
+    colors = {metric: color for metric, _, _, color, _ in panels}
 
-    def update_data(_):
-        # Update CPU usage
-        cpu_usage = psutil.cpu_percent(interval=None)
-        data_buffers['cpu'].append(cpu_usage)
-        plot_metric(
-            axs[0], data_buffers['cpu'], "CPU Usage", "Usage (%)",
-            "tab:red" if cpu_usage >= threshold else "tab:blue",
-            cpu_usage >= threshold, "ALERT: CPU Usage High!"
-        )
-        print(f"CPU Usage: {cpu_usage}%")
-
-        # Update memory usage
-        memory_percentage = psutil.virtual_memory().percent
-        data_buffers['memory'].append(memory_percentage)
-        plot_metric(
-            axs[1], data_buffers['memory'], "Memory Usage", "Usage (%)",
-            "tab:red" if memory_percentage >= threshold else "tab:orange",
-            memory_percentage >= threshold, "ALERT: Memory Usage High!"
-        )
-        print(f"Memory Usage: {memory_percentage}%")
+    net_ax = axs[3]
+    net_ax.set_xlim(0, plot_duration - 1)
+    net_ax.set_ylim(0, 1)
+    net_ax.set_title("Network Usage")
+    net_ax.set_ylabel("Rate (MB/s)")
+    lines['net_sent'], = net_ax.plot([], [], label="Sent (MB/s)", color="tab:blue")
+    lines['net_recv'], = net_ax.plot([], [], label="Received (MB/s)", color="tab:purple")
+    net_ax.legend(loc="upper right")
+    alert_texts['net'] = net_ax.text(0.5, 0.5, "ALERT: High Network Traffic!", transform=net_ax.transAxes,
+                                     fontsize=12, color="red", fontweight="bold", ha="center",
+                                     va="center", alpha=0.7, visible=False)
+    artists = list(lines.values()) + list(alert_texts.values())
 
-        # Update disk usage
-        disk_percentage = psutil.disk_usage('/').percent
-        data_buffers['disk'].append(disk_percentage)
-        plot_metric(
-            axs[2], data_buffers['disk'], "Disk Usage", "Usage (%)",
-            "tab:red" if disk_percentage >= threshold else "tab:green",
-            disk_percentage >= threshold, "ALERT: Disk Usage High!"
-        )
-        print(f"Disk Usage: {disk_percentage}%")
+    def update_data(_):
+        latest = sampler.latest()
+        if latest is None:
+            return artists
+        for metric in lines:
+            _, values = sampler.series(metric, plot_duration)
+            lines[metric].set_data(range(len(values)), values)
+        for metric in colors:
+            exceeded = latest[metric] >= threshold
+            lines[metric].set_color("tab:red" if exceeded else colors[metric])
+            alert_texts[metric].set_visible(exceeded)
+        alert_texts['net'].set_visible(latest['net_sent'] >= threshold or latest['net_recv'] >= threshold)
 
-        # Update network usage
-        network_stats = psutil.net_io_counters()
-        bytes_sent = (network_stats.bytes_sent - initial_bytes_sent) / (1024 * 1024)  # MB
-        bytes_recv = (network_stats.bytes_recv - initial_bytes_recv) / (1024 * 1024)  # MB
-        data_buffers['net_sent'].append(bytes_sent)
-        data_buffers['net_recv'].append(bytes_recv)
-        axs[3].clear()
-        axs[3].plot(data_buffers['net_sent'], label="Bytes Sent (MB)", color="tab:blue")
-        axs[3].plot(data_buffers['net_recv'], label="Bytes Received (MB)", color="tab:purple")
-        axs[3].set_title("Network Usage")
-        axs[3].set_ylabel("Data (MB)")
-        axs[3].legend(loc="upper right")
-        if bytes_sent >= threshold or bytes_recv >= threshold:
-            add_alert_text(axs[3], "ALERT: High Network Traffic!")
-        
-        print(f"Network Sent: {bytes_sent:.2f} MB, Received: {bytes_recv:.2f} MB")
+        _, net_values = sampler.series(n=plot_duration)
+        net_peak = net_values[:, -2:].max()
+        if net_peak > net_ax.get_ylim()[1]:
+            # Blitting cannot redraw the axis labels, so rescale with a full redraw
+            net_ax.set_ylim(0, net_peak * 1.5)
+            fig.canvas.draw_idle()
+        return artists
 
+    anim = animation.FuncAnimation(fig, update_data, interval=interval * 1000, blit=True,
+                                   cache_frame_data=False)
+    try:
+        plt.show()
+    finally:
+        sampler.stop()
+    return anim
 
-    anim = animation.FuncAnimation(fig, update_data, interval=1000, cache_frame_data=False)
-    plt.show()
-monitor_system()
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show live system usage.")
+    parser.add_argument('--threshold', type=float, default=90)
+    parser.add_argument('--plot-duration', type=int, default=60, help="samples shown on screen")
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between samples")
+    args = parser.parse_args()
+    monitor_system(args.threshold, args.plot_duration, args.interval)
@@ -1,10 +1,99 @@
 import win32evtlog
 import datetime
 import ctypes
+import json
 import sys
 
-def collect_and_save_event_logs(log_types=["System", "Application", "Security"], event_ids=None, event_count=None):
+from log_sources import CheckpointStore, LogIngestor, make_record
 
+CHECKPOINT_FILE = 'windows_log_checkpoints.json'
+
+
+class WindowsEventLogSource:
+    """Read new records from a live Windows event log with win32evtlog.
+
+    Reads forwards from the record after the checkpointed one instead of
+    scanning the whole log backwards. Without a checkpoint, reading starts
+    at start_time if one is given (or at the oldest record with
+    from_start), otherwise only records written from now on are read.
+    """
+
+    def __init__(self, log_type, server='localhost', start_time=None, from_start=False):
+        self.log_type = log_type
+        self.server = server
+        self.name = f"{server}/{log_type}"
+        self.start_time = start_time
+        self.from_start = from_start or start_time is not None
+        self.last_record = None
+        self._handle = None
+        self._next_read = None
+
+    def state(self):
+        return {'last_record': self.last_record}
+
+    def restore(self, state):
+        self.last_record = state.get('last_record')
+
+    def _open(self):
+        self._handle = win32evtlog.OpenEventLog(self.server, self.log_type)
+        oldest = win32evtlog.GetOldestEventLogRecord(self._handle)
+        newest = oldest + win32evtlog.GetNumberOfEventLogRecords(self._handle) - 1
+        if self.last_record is None:
+            self.last_record = oldest - 1 if self.from_start else newest
+        elif self.last_record < oldest - 1 or self.last_record > newest:
+            # The log was cleared or wrapped past the checkpoint
+            self.last_record = oldest - 1
+        self._next_read = self.last_record + 1
+
+    def read_batch(self, max_records=1000):
+        if self._handle is None:
+            self._open()
+        records = []
+        while len(records) < max_records:
+            if self._next_read is not None:
+                flags = win32evtlog.EVENTLOG_SEEK_READ | win32evtlog.EVENTLOG_FORWARDS_READ
+                offset, self._next_read = self._next_read, None
+            else:
+                flags = win32evtlog.EVENTLOG_SEQUENTIAL_READ | win32evtlog.EVENTLOG_FORWARDS_READ
+                offset = 0
+            try:
+                events = win32evtlog.ReadEventLog(self._handle, flags, offset)
+            except Exception:
+                # Seeking past the newest record fails: nothing new yet
+                self._next_read = self.last_record + 1
+                break
+            if not events:
+                # End of the log; seek again next time, as sequential reads do not see new records
+                self._next_read = self.last_record + 1
+                break
+            for event in events:
+                if event.RecordNumber <= self.last_record:
+                    continue
+                self.last_record = event.RecordNumber
+                generated = event.TimeGenerated
+                if self.start_time and generated < self.start_time:
+                    continue
+                inserts = list(event.StringInserts or [])
+                records.append(make_record(
+                    self.log_type, ' '.join(inserts), generated.timestamp(), event.ComputerName,
+                    event.SourceName, event_id=event.EventID & 0xFFFF, level=event.EventType,
+                    record_id=event.RecordNumber, data=inserts or None))
+        return records
+
+    def close(self):
+        if self._handle is not None:
+            win32evtlog.CloseEventLog(self._handle)
+            self._handle = None
+
+
+def collect_and_save_event_logs(log_types=["System", "Application", "Security"], event_ids=None, event_count=None,
+                                start_time=None, checkpoint_file=CHECKPOINT_FILE):
+    """Append the records added to each log since the last run to <log>_event_logs.jsonl.
+
+    The first run starts at start_time (a datetime) if given, otherwise
+    at the oldest record. event_ids filters by event ID and event_count
+    caps how many records are read per log in one run.
+    """
     try:
         if not ctypes.windll.shell32.IsUserAnAdmin():
             print("This script requires administrator privileges. Please restart the script as administrator.")
@@ -13,64 +102,45 @@ def collect_and_save_event_logs(log_types=["System", "Application", "Security"],
         print("Error checking admin status.")
         sys.exit()
 
-    # Prompt user for start time
-    start_time = None
-    while start_time is None:
-        date_input = input("Enter the start date (YYYY-MM-DD): ")
-        time_input = input("Enter the start time (HH:MM): ")
-        try:
-            start_time = datetime.datetime.strptime(f"{date_input} {time_input}", "%Y-%m-%d %H:%M")
-        except ValueError:
-            print("Invalid date or time format. Please try again.")
-            start_time = None
+    event_ids = set(event_ids) if event_ids else None
+    saved = {log_type: 0 for log_type in log_types}
 
-    events = {log_type: [] for log_type in log_types}
+    def sink(source, records):
+        if event_ids:
+            records = [record for record in records if record['event_id'] in event_ids]
+        filename = f"{source.log_type.lower()}_event_logs.jsonl"
+        with open(filename, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        saved[source.log_type] += len(records)
 
+    sources = [WindowsEventLogSource(log_type, start_time=start_time, from_start=True)
+               for log_type in log_types]
+    ingestor = LogIngestor(sources, CheckpointStore(checkpoint_file), sink)
+    try:
+        if event_count:
+            # One batch of about event_count records per log; the rest is read next run
+            ingestor.batch_size = event_count
+            ingestor.poll()
+            for source in sources:
+                source.close()
+        else:
+            ingestor.run()
+    except Exception as e:
+        print(f"An error occurred while reading event logs: {e}")
     for log_type in log_types:
-        server = 'localhost'
-        log_handle = win32evtlog.OpenEventLog(server, log_type)
-        flags = win32evtlog.EVENTLOG_BACKWARDS_READ | win32evtlog.EVENTLOG_SEQUENTIAL_READ
-
-        try:
-            while True:
-                logs = win32evtlog.ReadEventLog(log_handle, flags, 0)
-                if not logs:
-                    break
-                for event in logs:
-                    # Apply filters
-                    if start_time and event.TimeGenerated < start_time:
-                        continue
-                    if event_ids and event.EventID not in event_ids:
-                        continue
-
-                    record = {
-                        "EventID": event.EventID,
-                        "EventCategory": event.EventCategory,
-                        "TimeGenerated": event.TimeGenerated.Format(),
-                        "SourceName": event.SourceName,
-                        "EventType": event.EventType,
-                        "EventData": event.StringInserts,
-                    }
-                    events[log_type].append(record)
-
-                    if event_count and len(events[log_type]) >= event_count:
-                        break
-                if event_count and len(events[log_type]) >= event_count:
-                    break
-        except Exception as e:
-            print(f"An error occurred while reading {log_type} logs: {e}")
-        finally:
-            win32evtlog.CloseEventLog(log_handle)
-
-        filename = f"{log_type.lower()}_event_logs.txt"
-        with open(filename, "w") as f:
-            for event in events[log_type]:
-                f.write(f"Event ID: {event['EventID']}\n")
-                f.write(f"Category: {event['EventCategory']}\n")
-                f.write(f"Generated Time: {event['TimeGenerated']}\n")
-                f.write(f"Source: {event['SourceName']}\n")
-                f.write(f"Type: {event['EventType']}\n")
-                f.write(f"Data: {event['EventData']}\n")
-                f.write("\n" + "="*40 + "\n\n")
-        print(f"Logs saved to {filename}")
+        print(f"{saved[log_type]} new {log_type} records saved to {log_type.lower()}_event_logs.jsonl")
+
+
+if __name__ == "__main__":
+    import argparse
 
+    parser = argparse.ArgumentParser(description="Save new Windows event log records.")
+    parser.add_argument('--logs', nargs='+', default=["System", "Application", "Security"])
+    parser.add_argument('--event-ids', type=int, nargs='+')
+    parser.add_argument('--event-count', type=int, help="records read per log in this run")
+    parser.add_argument('--start', help="first-run start time, YYYY-MM-DD HH:MM")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE)
+    args = parser.parse_args()
+    start = datetime.datetime.strptime(args.start, "%Y-%m-%d %H:%M") if args.start else None
+    collect_and_save_event_logs(args.logs, args.event_ids, args.event_count, start, args.checkpoint)